@@ -16,6 +16,8 @@ try:
     from . import utils
     from . import config
     from . import database
+    from . import metricas
+    from . import cache
 except ImportError:
     # Vercel - importações absolutas
     import models
@@ -24,6 +26,8 @@ except ImportError:
     import utils
     import config
     import database
+    import metricas
+    import cache
 
 __all__ = [
     'models',
@@ -31,5 +35,7 @@ __all__ = [
     'schemas',
     'utils',
     'config',
-    'database'
+    'database',
+    'metricas',
+    'cache'
 ]
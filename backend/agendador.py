@@ -0,0 +1,119 @@
+"""
+Agendador da ingestão de emails do Sistema de Gestão de Faturas
+Dispara uma varredura da caixa de email a cada INGESTION_SCHEDULE_SECONDS, com
+variação aleatória para que instâncias iniciadas juntas não disparem juntas.
+Só a instância que obtém a trava da caixa de email varre; nas demais o
+disparo é contado como saltado. Depois da varredura, os PDFs com falha de
+extração que venceram a espera são reprocessados
+"""
+
+import random
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Importações com fallback para Vercel
+try:
+    from .config import settings
+    from . import crud
+    from .database import SessionLocal
+    from .ingestao import METRICAS_TRAVA, executar_com_trava, nome_worker, reivindicar_e_executar
+    from .metricas import Contadores
+    from .reprocessamento import reprocessar_falhas
+except ImportError:
+    from config import settings
+    import crud
+    from database import SessionLocal
+    from ingestao import METRICAS_TRAVA, executar_com_trava, nome_worker, reivindicar_e_executar
+    from metricas import Contadores
+    from reprocessamento import reprocessar_falhas
+
+class AgendadorIngestao:
+    """Thread que dispara a ingestão periodicamente"""
+
+    def __init__(self, intervalo: float, jitter: float):
+        self.intervalo = intervalo
+        self.jitter = min(jitter, intervalo / 2)
+        self.contadores = Contadores("disparos", "executados", "saltados", "erros")
+        self.ultimo_disparo: Optional[datetime] = None
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def proxima_espera(self) -> float:
+        """Intervalo até o próximo disparo, com a variação aleatória"""
+        return max(self.intervalo + random.uniform(-self.jitter, self.jitter), 1.0)
+
+    def iniciar(self) -> None:
+        """Inicia a thread (se ligado, configurado e ainda não estiver rodando)"""
+        if self.intervalo <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        if not settings.EMAIL_USER or not settings.EMAIL_PASS:
+            print("⚠️ Agendador de ingestão desligado: credenciais de email não configuradas")
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._executar, name="agendador-ingestao", daemon=True)
+        self._thread.start()
+        print(f"⏰ Agendador de ingestão: a cada {self.intervalo}s (±{self.jitter:g}s)")
+
+    def parar(self, timeout: float = 5.0) -> None:
+        """Encerra a thread (uma varredura em andamento termina sozinha)"""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _executar(self) -> None:
+        while not self._parar.wait(self.proxima_espera()):
+            try:
+                self.disparar()
+            except Exception as e:
+                self.contadores.incrementar("erros")
+                print(f"❌ Erro no agendador de ingestão: {e}")
+
+    def disparar(self) -> bool:
+        """
+        Enfileira e executa uma varredura, se esta instância obtiver a trava.
+
+        Returns:
+            True se a varredura rodou aqui; False se outra instância está varrendo
+        """
+        self.contadores.incrementar("disparos")
+        self.ultimo_disparo = datetime.now(timezone.utc).replace(tzinfo=None)
+        obtida, _ = executar_com_trava(self._varrer)
+        self.contadores.incrementar("executados" if obtida else "saltados")
+        if not obtida:
+            print("⏭️ Disparo da ingestão saltado: outra instância está processando emails")
+        return obtida
+
+    def _varrer(self) -> Optional[Dict[str, Any]]:
+        # Reaproveita o job pendente, se houver (ex.: enfileirado pelo endpoint)
+        with SessionLocal() as db:
+            crud.FaturaCRUD.enfileirar_job_ingestao(db)
+        resultado = reivindicar_e_executar(nome_worker())
+        # PDFs com falha de extração cuja espera venceu
+        try:
+            with SessionLocal() as db:
+                reprocessar_falhas(db)
+        except Exception as e:
+            self.contadores.incrementar("erros")
+            print(f"❌ Erro no reprocessamento de PDFs: {e}")
+        return resultado
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Configuração, disparos e uso da trava da caixa de email"""
+        return {
+            "ativo": self._thread is not None and self._thread.is_alive(),
+            "intervalo_segundos": self.intervalo,
+            "jitter_segundos": self.jitter,
+            "ultimo_disparo": self.ultimo_disparo.isoformat() if self.ultimo_disparo else None,
+            **self.contadores.to_dict(),
+            "trava": {
+                **METRICAS_TRAVA["contadores"].to_dict(),
+                "retencao_ms": METRICAS_TRAVA["retencao_ms"].to_dict()
+            }
+        }
+
+agendador_ingestao = AgendadorIngestao(
+    settings.INGESTION_SCHEDULE_SECONDS,
+    settings.INGESTION_SCHEDULE_JITTER_SECONDS
+)
@@ -0,0 +1 @@
+# Benchmarks de desempenho do backend (executados manualmente, fora do deploy)
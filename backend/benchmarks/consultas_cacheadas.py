@@ -0,0 +1,97 @@
+"""
+Micro-benchmark das consultas quentes do FaturaCRUD: a forma antiga
+(db.query(...) reconstruída a cada chamada) contra as atuais (statements
+construídos uma vez, com parâmetros nomeados).
+
+Uso (a partir da raiz do repositório):
+    python -m backend.benchmarks.consultas_cacheadas --chamadas 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Mede o acesso ao banco, não o cache de objetos (backend/cache.py)
+os.environ["CACHE_ENABLED"] = "false"
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.crud import FaturaCRUD
+from backend.models import Base, Fatura
+
+# Implementações anteriores, para comparação
+def antigo_por_id(db, fatura_id):
+    return db.query(Fatura).filter(Fatura.id == fatura_id).first()
+
+def antigo_por_instalacao(db, numero_instalacao):
+    return db.query(Fatura).filter(Fatura.numero_instalacao == numero_instalacao).first()
+
+def antigo_listagem(db, skip, limit=20, ja_pago=False):
+    query = db.query(Fatura)
+    if ja_pago is not None:
+        query = query.filter(Fatura.ja_pago == ja_pago)
+    return query.offset(skip).limit(limit).all()
+
+def medir(db, funcao, argumentos) -> float:
+    """Microssegundos por chamada; a sessão é limpa a cada chamada (como em lotes)"""
+    inicio = time.perf_counter()
+    for argumento in argumentos:
+        funcao(db, argumento)
+        db.expunge_all()
+    return (time.perf_counter() - inicio) * 1_000_000 / len(argumentos)
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark das consultas quentes do FaturaCRUD")
+    parser.add_argument("--chamadas", type=int, default=5000)
+    parser.add_argument("--linhas", type=int, default=10000)
+    parser.add_argument("--rodadas", type=int, default=3)
+    args = parser.parse_args()
+    
+    # Banco em memória: o tempo medido é essencialmente o overhead Python
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(Fatura.__table__.insert(), [
+            {
+                "nome_cliente": f"Cliente {i}",
+                "documento_cliente": f"{i:011d}",
+                "email_cliente": f"cliente{i}@example.com",
+                "numero_instalacao": f"{i:010d}",
+                "valor_total": 100.0,
+                "mes_referencia": "Agosto/2025",
+                "data_vencimento": "10/09/2025",
+                "ja_pago": i % 2 == 0
+            }
+            for i in range(1, args.linhas + 1)
+        ])
+    db = sessionmaker(bind=engine)()
+    
+    ids = [1 + (i * 7919) % args.linhas for i in range(args.chamadas)]
+    numeros = [f"{fatura_id:010d}" for fatura_id in ids]
+    paginas = [(i * 20) % (args.linhas // 2) for i in range(args.chamadas)]
+    cenarios = [
+        ("get_fatura_by_id", antigo_por_id, FaturaCRUD.get_fatura_by_id, ids),
+        ("get_fatura_by_instalacao", antigo_por_instalacao, FaturaCRUD.get_fatura_by_instalacao, numeros),
+        ("get_faturas (20 linhas)", antigo_listagem,
+         lambda db, skip: FaturaCRUD.get_faturas(db, skip=skip, limit=20, ja_pago=False), paginas),
+    ]
+    
+    print(f"{'consulta':<26} {'db.query (µs)':>14} {'cacheada (µs)':>14} {'ganho':>7}")
+    for nome, antigo, atual, argumentos in cenarios:
+        medir(db, antigo, argumentos[:200])  # aquecimento
+        medir(db, atual, argumentos[:200])
+        # Melhor de algumas rodadas alternadas, para reduzir o ruído
+        tempo_antigo = tempo_atual = float("inf")
+        for _ in range(args.rodadas):
+            tempo_antigo = min(tempo_antigo, medir(db, antigo, argumentos))
+            tempo_atual = min(tempo_atual, medir(db, atual, argumentos))
+        print(f"{nome:<26} {tempo_antigo:>14.1f} {tempo_atual:>14.1f} {tempo_antigo / tempo_atual:>6.2f}x")
+    db.close()
+
+if __name__ == "__main__":
+    main()
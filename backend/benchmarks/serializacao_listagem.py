@@ -0,0 +1,87 @@
+"""
+Benchmark da serialização das listagens de faturas: caminho ORM + Pydantic
+(o que o FastAPI faz com response_model=List[FaturaSchema]) contra tuplas
+de colunas codificadas direto em JSON (utils.serializacao).
+
+Uso (a partir da raiz do repositório):
+    python -m backend.benchmarks.serializacao_listagem --linhas 1000 10000 --repeticoes 20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.models import Base, Fatura
+from backend.schemas import FaturaSchema
+from backend.utils.serializacao import COLUNAS_FATURA, codificar_linhas
+
+LISTA_FATURAS = TypeAdapter(List[FaturaSchema])
+
+def caminho_orm(db, linhas: int) -> bytes:
+    """Objetos ORM validados um a um pelo FaturaSchema e serializados pelo Pydantic"""
+    faturas = db.execute(select(Fatura).limit(linhas)).scalars().all()
+    validadas = LISTA_FATURAS.validate_python(faturas, from_attributes=True)
+    corpo = LISTA_FATURAS.dump_json(validadas)
+    db.expunge_all()
+    return corpo
+
+def caminho_tuplas(db, linhas: int) -> bytes:
+    """Só as colunas do schema, como tuplas, codificadas direto"""
+    return codificar_linhas(db.execute(select(*COLUNAS_FATURA).limit(linhas)).all())
+
+def medir(funcao, db, linhas: int, repeticoes: int) -> float:
+    """Mediana do tempo em milissegundos"""
+    funcao(db, linhas)  # aquecimento
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(db, linhas)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialização das listagens de faturas")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeticoes", type=int, default=20)
+    args = parser.parse_args()
+    
+    diretorio = tempfile.mkdtemp(prefix="bench_serializacao_")
+    engine = create_engine(f"sqlite:///{os.path.join(diretorio, 'benchmark.db')}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(Fatura.__table__.insert(), [
+            {
+                "nome_cliente": f"Cliente {i}",
+                "documento_cliente": f"{i:011d}",
+                "email_cliente": f"cliente{i}@example.com",
+                "numero_instalacao": f"{i:010d}",
+                "valor_total": 100.0 + i % 500,
+                "mes_referencia": "Agosto/2025",
+                "data_vencimento": "10/09/2025",
+                "url_pdf": f"/tmp/faturas/{i}.pdf",
+                "ja_pago": i % 3 == 0
+            }
+            for i in range(max(args.linhas))
+        ])
+    
+    db = sessionmaker(bind=engine)()
+    print(f"{'linhas':>7} {'orm+pydantic (ms)':>18} {'tuplas+json (ms)':>17} {'ganho':>7}")
+    for linhas in args.linhas:
+        orm = medir(caminho_orm, db, linhas, args.repeticoes)
+        tuplas = medir(caminho_tuplas, db, linhas, args.repeticoes)
+        print(f"{linhas:>7} {orm:>18.2f} {tuplas:>17.2f} {orm / tuplas:>6.1f}x")
+    db.close()
+    engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Benchmark de concorrência do SQLite: escritores (ingestão) e leitores
+(dashboard) simultâneos, comparando a configuração padrão com o modo
+ajustado (WAL, synchronous=NORMAL, busy_timeout, conexão de escrita única
+e pool de leitura). No modo ajustado, os escritores disputam as
+--conexoes-escrita conexões do pool de escrita (SQLITE_WRITE_POOL_SIZE).
+
+Uso (a partir da raiz do repositório):
+    python -m backend.benchmarks.sqlite_concorrencia --segundos 10 --escritores 4 --leitores 8 --lote 50
+    python -m backend.benchmarks.sqlite_concorrencia --conexoes-escrita 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.config import settings
+from backend.database import QueuePoolMedido, configurar_sqlite
+from backend.models import Base, Fatura
+
+def criar_engines(url: str, modo: str, conexoes_escrita: int, leitores: int):
+    """Retorna (engine de escrita, engine de leitura) para o modo informado"""
+    connect_args = {"check_same_thread": False}
+    if modo == "padrao":
+        # Configuração antiga: um engine compartilhado, journal em rollback
+        engine = create_engine(url, connect_args=connect_args)
+        return engine, engine
+    
+    pragmas = settings.get_database_config().get("pragmas") or {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -65536,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY"
+    }
+    escrita = create_engine(
+        url, poolclass=QueuePoolMedido, pool_size=conexoes_escrita, max_overflow=0, connect_args=connect_args
+    )
+    leitura = create_engine(url, poolclass=QueuePoolMedido, pool_size=leitores, max_overflow=0, connect_args=connect_args)
+    configurar_sqlite(escrita, pragmas)
+    configurar_sqlite(leitura, pragmas, somente_leitura=True)
+    return escrita, leitura
+
+def escritor(fabrica, indice: int, lote: int, parar: threading.Event, resultado: dict):
+    """Grava blocos de faturas, um bloco por transação (como na ingestão)"""
+    sequencia = 0
+    while not parar.is_set():
+        db = fabrica()
+        try:
+            for _ in range(lote):
+                sequencia += 1
+                db.add(Fatura(
+                    nome_cliente=f"Cliente {indice}-{sequencia}",
+                    documento_cliente=f"{indice:03d}{sequencia:08d}",
+                    email_cliente=f"cliente{indice}.{sequencia}@example.com",
+                    numero_instalacao=f"{indice:03d}{sequencia:010d}",
+                    valor_total=100.0 + sequencia % 50,
+                    mes_referencia="Agosto/2025",
+                    data_vencimento="10/09/2025",
+                    ja_pago=sequencia % 3 == 0
+                ))
+            db.commit()
+            resultado["ok"] += lote
+        except OperationalError:
+            db.rollback()
+            resultado["erros"] += 1
+        finally:
+            db.close()
+
+def leitor(fabrica, parar: threading.Event, resultado: dict):
+    """Consultas do dashboard: totais agregados e últimas pendentes"""
+    pago = Fatura.ja_pago == True
+    totais = select(
+        func.count(Fatura.id),
+        func.count(Fatura.id).filter(pago),
+        func.coalesce(func.sum(Fatura.valor_total), 0)
+    )
+    pendentes = select(Fatura).where(Fatura.ja_pago == False).order_by(Fatura.id.desc()).limit(50)
+    while not parar.is_set():
+        db = fabrica()
+        try:
+            db.execute(totais).one()
+            db.execute(pendentes).scalars().all()
+            resultado["ok"] += 1
+        except OperationalError:
+            resultado["erros"] += 1
+        finally:
+            db.close()
+
+def executar(
+    modo: str,
+    segundos: float,
+    escritores: int,
+    leitores: int,
+    lote: int,
+    linhas_iniciais: int,
+    conexoes_escrita: int = 1
+) -> dict:
+    """Roda o cenário em um banco temporário e retorna as vazões medidas"""
+    diretorio = tempfile.mkdtemp(prefix=f"bench_sqlite_{modo}_")
+    url = f"sqlite:///{os.path.join(diretorio, 'benchmark.db')}"
+    engine_escrita, engine_leitura = criar_engines(url, modo, conexoes_escrita, leitores)
+    Base.metadata.create_all(bind=engine_escrita)
+    
+    # Base inicial para as leituras terem o que agregar
+    with engine_escrita.begin() as connection:
+        connection.execute(Fatura.__table__.insert(), [
+            {
+                "nome_cliente": f"Base {i}",
+                "documento_cliente": f"999{i:08d}",
+                "email_cliente": f"base{i}@example.com",
+                "numero_instalacao": f"999{i:010d}",
+                "valor_total": 100.0,
+                "mes_referencia": "Julho/2025",
+                "data_vencimento": "10/08/2025",
+                "ja_pago": i % 2 == 0
+            }
+            for i in range(linhas_iniciais)
+        ])
+    
+    fabrica_escrita = sessionmaker(bind=engine_escrita, autoflush=False)
+    fabrica_leitura = sessionmaker(bind=engine_leitura, autoflush=False)
+    parar = threading.Event()
+    resultados_escrita = [{"ok": 0, "erros": 0} for _ in range(escritores)]
+    resultados_leitura = [{"ok": 0, "erros": 0} for _ in range(leitores)]
+    threads = [
+        threading.Thread(target=escritor, args=(fabrica_escrita, i, lote, parar, resultados_escrita[i]))
+        for i in range(escritores)
+    ] + [
+        threading.Thread(target=leitor, args=(fabrica_leitura, parar, resultados_leitura[i]))
+        for i in range(leitores)
+    ]
+    
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(segundos)
+    parar.set()
+    for thread in threads:
+        thread.join()
+    decorrido = time.perf_counter() - inicio
+    
+    engine_escrita.dispose()
+    engine_leitura.dispose()
+    return {
+        "modo": modo,
+        "faturas_por_s": sum(r["ok"] for r in resultados_escrita) / decorrido,
+        "erros_escrita": sum(r["erros"] for r in resultados_escrita),
+        "leituras_por_s": sum(r["ok"] for r in resultados_leitura) / decorrido,
+        "erros_leitura": sum(r["erros"] for r in resultados_leitura)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de concorrência do SQLite")
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--escritores", type=int, default=4)
+    parser.add_argument("--leitores", type=int, default=8)
+    parser.add_argument("--lote", type=int, default=50, help="faturas por transação de escrita")
+    parser.add_argument("--linhas", type=int, default=5000, help="faturas pré-carregadas")
+    parser.add_argument(
+        "--conexoes-escrita", type=int, default=settings.SQLITE_WRITE_POOL_SIZE,
+        help="conexões do pool de escrita no modo wal"
+    )
+    args = parser.parse_args()
+    
+    print(f"📊 {args.escritores} escritores (lotes de {args.lote}) e {args.leitores} leitores por {args.segundos:.0f}s, {args.linhas} faturas iniciais")
+    print(f"   modo wal: {args.conexoes_escrita} conexões de escrita")
+    print(f"{'modo':<8} {'faturas/s':>11} {'erros':>6} {'leituras/s':>11} {'erros':>6}")
+    for modo in ("padrao", "wal"):
+        r = executar(
+            modo, args.segundos, args.escritores, args.leitores, args.lote, args.linhas, args.conexoes_escrita
+        )
+        print(f"{r['modo']:<8} {r['faturas_por_s']:>11.1f} {r['erros_escrita']:>6} {r['leituras_por_s']:>11.1f} {r['erros_leitura']:>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Cache de leitura das faturas do Sistema de Gestão de Faturas
+Duas camadas: memória do processo (TTL + LRU) e, opcionalmente, um servidor
+compatível com o protocolo Redis compartilhado entre workers e instâncias
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import DateTime, event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+# Importações com fallback para Vercel
+try:
+    from .config import settings
+    from .metricas import Contadores
+    from .models import Fatura
+except ImportError:
+    from config import settings
+    from metricas import Contadores
+    from models import Fatura
+
+# Cliente Redis é opcional: sem o pacote, só a camada local é usada
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Chave de Session.info com as chaves invalidadas na transação corrente
+CHAVES_PENDENTES = "cache_faturas_invalidadas"
+
+# Marca gravada no lugar da chave invalidada: enquanto vale, a chave não pode
+# ser preenchida de novo (um leitor que consultou o banco antes do commit não
+# devolve a versão antiga ao cache)
+INVALIDADA = "__invalidada__"
+
+class CacheLocal:
+    """Cache em memória do processo com expiração (TTL) e descarte LRU"""
+
+    def __init__(self, max_itens: int, ttl: float):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave: str) -> Optional[Any]:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def set(self, chave: str, valor: Any, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        """Grava a chave; com `nx`, só se ela não existe (ou venceu), como SET NX"""
+        agora = time.monotonic()
+        with self._lock:
+            if nx:
+                item = self._itens.get(chave)
+                if item is not None and item[0] >= agora:
+                    return False
+            self._itens[chave] = (agora + (self.ttl if ttl is None else ttl), valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+            return True
+
+    def delete(self, *chaves: str) -> None:
+        with self._lock:
+            for chave in chaves:
+                self._itens.pop(chave, None)
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+class RedisMemoria:
+    """
+    Substituto local de um servidor Redis (REDIS_URL=memory://), com os
+    comandos usados pelo cache. Útil em desenvolvimento e testes.
+    """
+
+    def __init__(self):
+        self._dados: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, chave: str) -> Optional[bytes]:
+        with self._lock:
+            expira_em, valor = self._dados.get(chave, (0.0, None))
+            if valor is not None and expira_em < time.monotonic():
+                del self._dados[chave]
+                return None
+            return valor
+
+    def set(self, chave: str, valor: Any, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        if isinstance(valor, str):
+            valor = valor.encode("utf-8")
+        agora = time.monotonic()
+        with self._lock:
+            if nx:
+                expira_em, atual = self._dados.get(chave, (0.0, None))
+                if atual is not None and expira_em >= agora:
+                    return None  # como o redis-py: None quando o NX não grava
+            self._dados[chave] = (agora + (ex or float("inf")), valor)
+        return True
+
+    def delete(self, *chaves: str) -> int:
+        with self._lock:
+            return sum(self._dados.pop(chave, None) is not None for chave in chaves)
+
+def criar_cliente_compartilhado(url: Optional[str]):
+    """Cria o cliente da camada compartilhada a partir de REDIS_URL (ou None)"""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return RedisMemoria()
+    if redis is None:
+        print("⚠️ REDIS_URL configurada, mas o pacote 'redis' não está instalado; usando só o cache local")
+        return None
+    # Timeouts curtos: o cache nunca deve segurar uma requisição
+    return redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.5)
+
+def _serializar(valor: Any) -> Any:
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+# Colunas de data/hora, convertidas de volta ao ler da camada compartilhada
+COLUNAS_DATA_HORA = tuple(
+    coluna.key for coluna in Fatura.__table__.columns if isinstance(coluna.type, DateTime)
+)
+
+class CacheFaturas:
+    """
+    Cache read-through de faturas por ID e por número de instalação.
+    A chave por instalação guarda apenas o ID; os dados ficam na chave por ID.
+    Os dados são guardados como dicionário de colunas e reanexados à sessão
+    sem consultar o banco (merge com load=False).
+
+    A invalidação não apaga as chaves: grava nelas a marca INVALIDADA por
+    `ttl_invalidacao` segundos, e o preenchimento usa SET NX. Assim, um leitor
+    que buscou a versão antiga no banco antes do commit não consegue gravá-la
+    depois da invalidação.
+    """
+
+    def __init__(
+        self,
+        local: Optional[CacheLocal],
+        compartilhado=None,
+        ttl_compartilhado: int = 300,
+        ttl_invalidacao: int = 5
+    ):
+        self.local = local
+        self.compartilhado = compartilhado
+        self.ttl_compartilhado = ttl_compartilhado
+        self.ttl_invalidacao = ttl_invalidacao
+        self.contadores = Contadores(
+            "acertos_local", "acertos_compartilhado", "falhas", "invalidacoes", "erros_compartilhado"
+        )
+
+    @property
+    def ativo(self) -> bool:
+        return self.local is not None or self.compartilhado is not None
+
+    @staticmethod
+    def chave_id(fatura_id: int) -> str:
+        return f"fatura:id:{fatura_id}"
+
+    @staticmethod
+    def chave_instalacao(numero_instalacao: str) -> str:
+        return f"fatura:inst:{numero_instalacao}"
+
+    def _get(self, chave: str) -> Optional[Any]:
+        """Busca nas duas camadas, promovendo à local o que vier da compartilhada"""
+        if self.local is not None:
+            valor = self.local.get(chave)
+            if valor == INVALIDADA:
+                self.contadores.incrementar("falhas")
+                return None
+            if valor is not None:
+                self.contadores.incrementar("acertos_local")
+                return valor
+        if self.compartilhado is not None:
+            try:
+                bruto = self.compartilhado.get(chave)
+            except Exception as e:
+                self.contadores.incrementar("erros_compartilhado")
+                print(f"⚠️ Cache compartilhado indisponível: {e}")
+                bruto = None
+            if bruto is not None and bruto != INVALIDADA.encode("utf-8"):
+                valor = json.loads(bruto)
+                if isinstance(valor, dict):
+                    for coluna in COLUNAS_DATA_HORA:
+                        if valor.get(coluna):
+                            valor[coluna] = datetime.fromisoformat(valor[coluna])
+                if self.local is not None:
+                    self.local.set(chave, valor, nx=True)
+                self.contadores.incrementar("acertos_compartilhado")
+                return valor
+        self.contadores.incrementar("falhas")
+        return None
+
+    def _set(self, chave: str, valor: Any) -> None:
+        # NX: não sobrescreve uma marca de invalidação ainda válida
+        if self.local is not None:
+            self.local.set(chave, valor, nx=True)
+        if self.compartilhado is not None:
+            try:
+                self.compartilhado.set(
+                    chave, json.dumps(valor, default=_serializar), ex=self.ttl_compartilhado, nx=True
+                )
+            except Exception as e:
+                self.contadores.incrementar("erros_compartilhado")
+                print(f"⚠️ Cache compartilhado indisponível: {e}")
+
+    def _invalidar(self, chaves: Iterable[str]) -> None:
+        """Substitui as chaves pela marca INVALIDADA nas duas camadas"""
+        chaves = list(chaves)
+        if not chaves:
+            return
+        self.contadores.incrementar("invalidacoes", len(chaves))
+        if self.local is not None:
+            for chave in chaves:
+                self.local.set(chave, INVALIDADA, ttl=self.ttl_invalidacao)
+        if self.compartilhado is not None:
+            try:
+                for chave in chaves:
+                    self.compartilhado.set(chave, INVALIDADA, ex=self.ttl_invalidacao)
+            except Exception as e:
+                self.contadores.incrementar("erros_compartilhado")
+                print(f"⚠️ Cache compartilhado indisponível: {e}")
+
+    def obter_por_id(self, fatura_id: int) -> Optional[Dict[str, Any]]:
+        """Dados da fatura em cache, ou None"""
+        if not self.ativo:
+            return None
+        return self._get(self.chave_id(fatura_id))
+
+    def obter_id_por_instalacao(self, numero_instalacao: str) -> Optional[int]:
+        """ID da fatura corrente da instalação em cache, ou None"""
+        if not self.ativo:
+            return None
+        return self._get(self.chave_instalacao(numero_instalacao))
+
+    def guardar(self, fatura: Fatura) -> None:
+        """Guarda a fatura (já carregada) nas duas chaves"""
+        if not self.ativo:
+            return
+        dados = {coluna.key: getattr(fatura, coluna.key) for coluna in Fatura.__table__.columns}
+        self._set(self.chave_id(fatura.id), dados)
+        self._set(self.chave_instalacao(fatura.numero_instalacao), fatura.id)
+
+    @staticmethod
+    def instancia(dados: Dict[str, Any]) -> Fatura:
+        """Recria a fatura a partir do cache, como objeto desanexado e limpo"""
+        fatura = Fatura(**dados)
+        make_transient_to_detached(fatura)
+        return fatura
+
+    def invalidar(self, db: Session, ids: Iterable[int] = (), instalacoes: Iterable[str] = ()) -> None:
+        """
+        Invalida as faturas no cache agora e, de novo, após o commit da
+        sessão; a marca de invalidação impede que uma leitura concorrente
+        grave a versão antiga no cache. Aceita Session ou AsyncSession.
+        """
+        if not self.ativo:
+            return
+        chaves = [self.chave_id(fatura_id) for fatura_id in ids if fatura_id is not None]
+        chaves += [self.chave_instalacao(numero) for numero in instalacoes if numero]
+        self._invalidar(chaves)
+        sessao = getattr(db, "sync_session", db)
+        sessao.info.setdefault(CHAVES_PENDENTES, set()).update(chaves)
+
+    def _apos_commit(self, sessao: Session) -> None:
+        self._invalidar(sessao.info.pop(CHAVES_PENDENTES, ()))
+
+    def _apos_rollback(self, sessao: Session) -> None:
+        sessao.info.pop(CHAVES_PENDENTES, None)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Acertos, falhas e taxa de acerto por camada"""
+        contadores = self.contadores.to_dict()
+        acertos = contadores["acertos_local"] + contadores["acertos_compartilhado"]
+        consultas = acertos + contadores["falhas"]
+        return {
+            "camada_local": self.local is not None,
+            "camada_compartilhada": type(self.compartilhado).__name__ if self.compartilhado is not None else None,
+            "itens_locais": len(self.local) if self.local is not None else 0,
+            "taxa_acerto": round(acertos / consultas, 4) if consultas else 0.0,
+            "taxa_acerto_local": round(contadores["acertos_local"] / consultas, 4) if consultas else 0.0,
+            **contadores
+        }
+
+cache_faturas = CacheFaturas(
+    CacheLocal(settings.CACHE_LOCAL_MAX_ITEMS, settings.CACHE_LOCAL_TTL_SECONDS) if settings.CACHE_ENABLED else None,
+    criar_cliente_compartilhado(settings.REDIS_URL) if settings.CACHE_ENABLED else None,
+    settings.CACHE_SHARED_TTL_SECONDS,
+    settings.CACHE_INVALIDATION_TTL_SECONDS
+)
+
+# Vale também para AsyncSession, que usa uma Session síncrona por baixo
+event.listen(Session, "after_commit", cache_faturas._apos_commit)
+event.listen(Session, "after_rollback", cache_faturas._apos_rollback)
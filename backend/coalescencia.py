@@ -0,0 +1,272 @@
+"""
+Coalescência de requisições (single-flight) do Sistema de Gestão de Faturas
+Requisições idênticas e simultâneas se juntam à execução em andamento e
+recebem o mesmo resultado, em vez de repetir o trabalho (IMAP, agregações,
+exportações). Cada chave também tem um intervalo mínimo entre execuções: o
+resultado de uma execução recente é reaproveitado dentro da janela.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+# Importações com fallback para Vercel
+try:
+    from .config import settings
+    from .metricas import Contadores
+except ImportError:
+    from config import settings
+    from metricas import Contadores
+
+T = TypeVar("T")
+
+# Blocos gerados e ainda não lidos por todos os leitores de uma transmissão;
+# ao atingir o limite, o leitor à frente espera o mais lento
+BLOCOS_PENDENTES_MAX = 16
+
+class _Transmissao:
+    """
+    Fluxo compartilhado pelos leitores que chegaram antes do primeiro bloco.
+    Só os blocos que algum leitor ainda não leu ficam em memória (no máximo
+    BLOCOS_PENDENTES_MAX). Quem alcança o fim do que já foi gerado puxa o
+    próximo bloco da origem (um por vez), então a transmissão continua mesmo
+    se o primeiro cliente desconectar.
+    """
+
+    def __init__(self, origem: Iterator[bytes], ao_terminar: Callable[[bool], None]):
+        self._origem = origem
+        self._ao_terminar = ao_terminar
+        self._blocos: List[bytes] = []
+        self._base = 0  # posição do primeiro bloco ainda em memória
+        self._iniciada = False
+        self._fim = False
+        self._erro: Optional[BaseException] = None
+        self._gerando = False
+        # leitor -> posição do próximo bloco a ler
+        self._posicoes: Dict[int, int] = {}
+        self._proximo_leitor = 0
+        self._condicao = threading.Condition()
+
+    def entrar(self) -> Optional[Iterator[bytes]]:
+        """Novo leitor, desde o primeiro bloco; None se a transmissão já começou"""
+        with self._condicao:
+            if self._iniciada or self._fim:
+                return None
+            leitor = self._proximo_leitor
+            self._proximo_leitor += 1
+            self._posicoes[leitor] = 0
+        return self._ler(leitor)
+
+    def _descartar_lidos(self) -> None:
+        # Com a trava: libera os blocos que todos os leitores já leram
+        lidos = min(self._posicoes.values(), default=self._base + len(self._blocos)) - self._base
+        if lidos > 0:
+            del self._blocos[:lidos]
+            self._base += lidos
+            self._condicao.notify_all()
+
+    def _puxar(self) -> None:
+        # Chamado sem a trava, por um único leitor (_gerando)
+        try:
+            bloco = next(self._origem)
+        except StopIteration:
+            bloco, fim, erro = None, True, None
+        except BaseException as e:
+            bloco, fim, erro = None, True, e
+        else:
+            fim, erro = False, None
+        with self._condicao:
+            if bloco is not None:
+                self._blocos.append(bloco)
+                self._iniciada = True
+            self._fim, self._erro = fim, erro
+            self._gerando = False
+            self._condicao.notify_all()
+        if fim:
+            self._ao_terminar(erro is None)
+
+    def _ler(self, leitor: int) -> Iterator[bytes]:
+        try:
+            while True:
+                with self._condicao:
+                    while True:
+                        posicao = self._posicoes[leitor]
+                        if posicao < self._base + len(self._blocos):
+                            bloco = self._blocos[posicao - self._base]
+                            self._posicoes[leitor] = posicao + 1
+                            self._descartar_lidos()
+                            break
+                        if self._fim:
+                            if self._erro is not None:
+                                raise self._erro
+                            return
+                        if not self._gerando and len(self._blocos) < BLOCOS_PENDENTES_MAX:
+                            self._gerando = True
+                            bloco = None
+                            break
+                        # Outro leitor está gerando ou o buffer está cheio
+                        self._condicao.wait()
+                if bloco is None:
+                    self._puxar()
+                    continue
+                yield bloco
+        finally:
+            with self._condicao:
+                del self._posicoes[leitor]
+                self._descartar_lidos()
+                abandonada = not self._posicoes and not self._fim
+                if abandonada:
+                    self._fim = True
+            if abandonada:
+                # Todos os clientes saíram: encerra a origem (fecha o cursor do banco)
+                self._origem.close()
+                self._ao_terminar(False)
+
+class ChamadaUnica:
+    """
+    Grupo single-flight por chave, para chamadas síncronas (threads do
+    threadpool), assíncronas (loop de eventos) e fluxos de bytes.
+
+    Com `intervalo` > 0, cada chave executa no máximo uma vez por intervalo:
+    dentro da janela, o resultado anterior é devolvido. Fluxos não são
+    guardados, então só se juntam os simultâneos.
+    """
+
+    def __init__(self, nome: str, intervalo: float = 0.0):
+        self.nome = nome
+        self.intervalo = intervalo
+        self.contadores = Contadores("execucoes", "coalescidas", "reaproveitadas", "erros")
+        self._em_andamento: Dict[str, Any] = {}
+        # chave -> (instante da última execução, resultado)
+        self._recentes: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _recente(self, chave: str, agora: float) -> Optional[Tuple[float, Any]]:
+        """Última execução da chave, se ainda dentro do intervalo (com a trava)"""
+        recente = self._recentes.get(chave)
+        if recente is None:
+            return None
+        if agora - recente[0] >= self.intervalo:
+            del self._recentes[chave]
+            return None
+        return recente
+
+    def _concluir(self, chave: str, resultado: Any, guardar: bool, em_andamento: Any = None) -> None:
+        """Libera a chave e, se `guardar`, abre a janela do intervalo mínimo"""
+        with self._lock:
+            self._em_andamento.pop(chave if em_andamento is None else em_andamento, None)
+            if guardar and self.intervalo > 0:
+                agora = time.monotonic()
+                # Descarta as janelas vencidas (chaves que não voltaram a ser pedidas)
+                for vencida in [k for k, (instante, _) in self._recentes.items() if agora - instante >= self.intervalo]:
+                    del self._recentes[vencida]
+                self._recentes[chave] = (agora, resultado)
+
+    def _concluir_tarefa(self, chave: str, em_andamento: Tuple[str, int], tarefa: "asyncio.Future") -> None:
+        if tarefa.cancelled() or tarefa.exception() is not None:
+            self.contadores.incrementar("erros")
+            self._concluir(chave, None, False, em_andamento)
+        else:
+            self._concluir(chave, tarefa.result(), True, em_andamento)
+
+    def _concluir_transmissao(self, chave: str, transmissao: _Transmissao) -> None:
+        # Uma transmissão mais nova pode já ocupar a chave
+        with self._lock:
+            if self._em_andamento.get(chave) is transmissao:
+                del self._em_andamento[chave]
+
+    def executar(self, chave: str, funcao: Callable[[], T]) -> T:
+        """Executa `funcao` ou se junta à execução da mesma chave em andamento"""
+        with self._lock:
+            recente = self._recente(chave, time.monotonic())
+            if recente is not None:
+                self.contadores.incrementar("reaproveitadas")
+                return recente[1]
+            futuro = self._em_andamento.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = self._em_andamento[chave] = Future()
+        if not lider:
+            self.contadores.incrementar("coalescidas")
+            return futuro.result()
+
+        self.contadores.incrementar("execucoes")
+        try:
+            resultado = funcao()
+        except BaseException as e:
+            self.contadores.incrementar("erros")
+            self._concluir(chave, None, False)
+            futuro.set_exception(e)
+            raise
+        self._concluir(chave, resultado, True)
+        futuro.set_result(resultado)
+        return resultado
+
+    async def executar_async(self, chave: str, funcao: Callable[[], Awaitable[T]]) -> T:
+        """
+        Versão assíncrona de executar. A execução roda em uma tarefa própria:
+        se o cliente que a iniciou desconectar, as demais continuam esperando
+        por ela (por isso `funcao` deve abrir os próprios recursos, como a
+        sessão do banco, em vez de usar os da requisição). Uma tarefa só pode
+        ser aguardada no seu loop, então a coalescência é por loop de eventos.
+        """
+        em_andamento = (chave, id(asyncio.get_running_loop()))
+        with self._lock:
+            recente = self._recente(chave, time.monotonic())
+            if recente is not None:
+                self.contadores.incrementar("reaproveitadas")
+                return recente[1]
+            tarefa = self._em_andamento.get(em_andamento)
+            lider = tarefa is None
+            if lider:
+                tarefa = self._em_andamento[em_andamento] = asyncio.ensure_future(funcao())
+        if lider:
+            self.contadores.incrementar("execucoes")
+            tarefa.add_done_callback(lambda t: self._concluir_tarefa(chave, em_andamento, t))
+        else:
+            self.contadores.incrementar("coalescidas")
+        return await asyncio.shield(tarefa)
+
+    def transmitir(self, chave: str, criar_origem: Callable[[], Iterator[bytes]]) -> Iterator[bytes]:
+        """
+        Fluxo de bytes compartilhado: quem chega antes do primeiro bloco da
+        transmissão da chave recebe os mesmos blocos; depois disso, uma nova
+        transmissão é iniciada (downloads repetidos nunca são recusados).
+        """
+        with self._lock:
+            transmissao = self._em_andamento.get(chave)
+            blocos = transmissao.entrar() if transmissao is not None else None
+            if blocos is not None:
+                self.contadores.incrementar("coalescidas")
+                return blocos
+            transmissao = _Transmissao(
+                criar_origem(), lambda completa: self._concluir_transmissao(chave, transmissao)
+            )
+            self._em_andamento[chave] = transmissao
+            self.contadores.incrementar("execucoes")
+            return transmissao.entrar()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Execuções, requisições coalescidas/reaproveitadas e chaves em andamento"""
+        with self._lock:
+            em_andamento = len(self._em_andamento)
+        return {
+            "intervalo_segundos": self.intervalo,
+            "em_andamento": em_andamento,
+            **self.contadores.to_dict()
+        }
+
+# Um grupo por endpoint (cada grupo é usado de um só modo: síncrono,
+# assíncrono ou fluxo)
+chamadas_ingestao = ChamadaUnica("ingestao", settings.COALESCE_INGESTION_SECONDS)
+chamadas_estatisticas = ChamadaUnica("estatisticas", settings.COALESCE_STATS_SECONDS)
+transmissoes_exportacao = ChamadaUnica("exportacao")
+
+def estatisticas() -> Dict[str, Any]:
+    """Estatísticas de todos os grupos"""
+    return {
+        grupo.nome: grupo.estatisticas()
+        for grupo in (chamadas_ingestao, chamadas_estatisticas, transmissoes_exportacao)
+    }
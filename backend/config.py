@@ -27,6 +27,63 @@ class Settings:
     # Configurações de banco de dados
     DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL")
     
+    # Pooler externo (PgBouncer/Supavisor em modo transação): "pgbouncer" ativa;
+    # também é detectado por "pgbouncer=true" ou pela porta 6543 na DATABASE_URL
+    DATABASE_POOLER: str = os.getenv("DATABASE_POOLER", "").lower()
+    POOLER_POOL_SIZE: Optional[int] = int(os.getenv("POOLER_POOL_SIZE")) if os.getenv("POOLER_POOL_SIZE") else None
+    
+    # Réplicas de leitura (URLs separadas por vírgula) e atraso máximo tolerado
+    DATABASE_REPLICA_URLS: list = [
+        url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+    ]
+    REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+    
+    # Dimensionamento do pool: perfil, workers por instância e conexões
+    # que o PostgreSQL reserva para esta aplicação
+    POOL_PROFILE: str = os.getenv("POOL_PROFILE", "").lower()
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    DATABASE_MAX_CONNECTIONS: int = int(os.getenv("DATABASE_MAX_CONNECTIONS", "100"))
+    # Engines com pool próprio no primário em cada worker: síncrono e assíncrono
+    ENGINES_POR_WORKER: int = 2
+    # Travas entre instâncias (ingestão, reprocessamento): duração do
+    # arrendamento em segundos, renovado enquanto o dono trabalha
+    LOCK_LEASE_SECONDS: float = float(os.getenv("LOCK_LEASE_SECONDS", "60"))
+    
+    # Perfis de pool por worker: (pool_size, max_overflow, pool_timeout em segundos)
+    POOL_PROFILES: dict = {
+        "serverless": (1, 2, 10),
+        "pequeno": (2, 3, 15),
+        "padrao": (5, 10, 30),
+        "intensivo": (10, 20, 30),
+    }
+    
+    # SQLite: "wal" (conexão de escrita única + pool de leitura, PRAGMAs
+    # ajustados) ou "padrao". O SQLite só admite um escritor por vez: com uma
+    # conexão de escrita, as escritas esperam na fila do pool em vez de
+    # disputar o lock do WAL (busy_timeout fica só para outros processos)
+    SQLITE_MODE: str = os.getenv("SQLITE_MODE", "wal").lower()
+    SQLITE_WRITE_POOL_SIZE: int = int(os.getenv("SQLITE_WRITE_POOL_SIZE", "1"))
+    SQLITE_READ_POOL_SIZE: int = int(os.getenv("SQLITE_READ_POOL_SIZE", "4"))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    
+    # Cache de faturas: camada local por processo (TTL curto, pois outros
+    # workers não a invalidam) e camada compartilhada opcional (Redis)
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_LOCAL_TTL_SECONDS: float = float(os.getenv("CACHE_LOCAL_TTL_SECONDS", "5"))
+    CACHE_LOCAL_MAX_ITEMS: int = int(os.getenv("CACHE_LOCAL_MAX_ITEMS", "2048"))
+    REDIS_URL: Optional[str] = os.getenv("REDIS_URL")
+    CACHE_SHARED_TTL_SECONDS: int = int(os.getenv("CACHE_SHARED_TTL_SECONDS", "300"))
+    # Por quanto tempo uma chave invalidada não pode ser preenchida de novo
+    CACHE_INVALIDATION_TTL_SECONDS: int = int(os.getenv("CACHE_INVALIDATION_TTL_SECONDS", "5"))
+    
+    # Coalescência de requisições idênticas: intervalo mínimo (segundos) entre
+    # execuções da mesma chave; dentro dele o resultado anterior é devolvido.
+    # 0 só junta as simultâneas (a exportação, que não é guardada, sempre)
+    COALESCE_INGESTION_SECONDS: float = float(os.getenv("COALESCE_INGESTION_SECONDS", "10"))
+    COALESCE_STATS_SECONDS: float = float(os.getenv("COALESCE_STATS_SECONDS", "2"))
+    
     # Configurações de email
     EMAIL_USER: Optional[str] = os.getenv("EMAIL_USER")
     EMAIL_PASS: Optional[str] = os.getenv("EMAIL_PASS")
@@ -48,6 +105,65 @@ class Settings:
     STRIPE_PUBLIC_KEY: Optional[str] = os.getenv("STRIPE_PUBLIC_KEY")
     STRIPE_WEBHOOK_SECRET: Optional[str] = os.getenv("STRIPE_WEBHOOK_SECRET")
     
+    # Caixa de entrada do webhook: eventos por lote, intervalo de verificação
+    # (segundos), tentativas antes de marcar o evento como 'erro' e segundos
+    # em 'processando' até o evento ser retomado (processador interrompido)
+    STRIPE_INBOX_BATCH_SIZE: int = int(os.getenv("STRIPE_INBOX_BATCH_SIZE", "100"))
+    STRIPE_INBOX_POLL_SECONDS: float = float(os.getenv("STRIPE_INBOX_POLL_SECONDS", "5"))
+    STRIPE_INBOX_MAX_ATTEMPTS: int = int(os.getenv("STRIPE_INBOX_MAX_ATTEMPTS", "5"))
+    STRIPE_INBOX_CLAIM_TIMEOUT_SECONDS: int = int(os.getenv("STRIPE_INBOX_CLAIM_TIMEOUT_SECONDS", "300"))
+    
+    # Janela de reaproveitamento das sessões de checkout (minutos, 35 a 720):
+    # a sessão expira entre uma e duas janelas após a criação
+    CHECKOUT_SESSION_WINDOW_MINUTES: int = int(os.getenv("CHECKOUT_SESSION_WINDOW_MINUTES", "60"))
+    
+    # Base da API do Stripe (ex.: http://localhost:12111 para o stripe-mock)
+    STRIPE_API_BASE: Optional[str] = os.getenv("STRIPE_API_BASE")
+    
+    # Cliente HTTP do Stripe: timeouts (segundos), retentativas de rede feitas
+    # pela biblioteca (com backoff e jitter) e conexões keep-alive por processo
+    STRIPE_CONNECT_TIMEOUT: float = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3"))
+    STRIPE_READ_TIMEOUT: float = float(os.getenv("STRIPE_READ_TIMEOUT", "20"))
+    STRIPE_NETWORK_RETRIES: int = int(os.getenv("STRIPE_NETWORK_RETRIES", "2"))
+    STRIPE_HTTP_POOL_SIZE: int = int(os.getenv("STRIPE_HTTP_POOL_SIZE", "10"))
+    
+    # Reconciliação: sessões por página e quantos dias olhar para trás na primeira execução
+    STRIPE_RECONCILE_PAGE_SIZE: int = min(int(os.getenv("STRIPE_RECONCILE_PAGE_SIZE", "100")), 100)
+    STRIPE_RECONCILE_LOOKBACK_DAYS: int = int(os.getenv("STRIPE_RECONCILE_LOOKBACK_DAYS", "30"))
+    
+    # Jobs em lote: chamadas por segundo ao Stripe (o modo de teste aceita 25,
+    # o modo live 100), tentativas por chamada e threads da pré-geração dos links de pagamento
+    STRIPE_RATE_LIMIT_PER_SECOND: float = float(os.getenv("STRIPE_RATE_LIMIT_PER_SECOND", "20"))
+    STRIPE_MAX_RETRIES: int = int(os.getenv("STRIPE_MAX_RETRIES", "4"))
+    CHECKOUT_PREGEN_WORKERS: int = int(os.getenv("CHECKOUT_PREGEN_WORKERS", "8"))
+    
+    # Fila de ingestão de emails: workers em threads do próprio processo (0 na
+    # Vercel, onde o worker roda fora da função), intervalo de verificação da
+    # fila, tempo sem heartbeat para considerar o worker interrompido e tentativas
+    INGESTION_WORKERS: int = int(os.getenv("INGESTION_WORKERS", "0" if IS_VERCEL else "1"))
+    INGESTION_POLL_SECONDS: float = float(os.getenv("INGESTION_POLL_SECONDS", "5"))
+    INGESTION_JOB_TIMEOUT_SECONDS: int = int(os.getenv("INGESTION_JOB_TIMEOUT_SECONDS", "900"))
+    INGESTION_MAX_ATTEMPTS: int = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+    
+    # Agendador da ingestão: intervalo entre varreduras (0 desliga; na Vercel use
+    # um cron externo) e variação aleatória, para espalhar as instâncias
+    INGESTION_SCHEDULE_SECONDS: int = int(os.getenv("INGESTION_SCHEDULE_SECONDS", "0" if IS_VERCEL else "600"))
+    INGESTION_SCHEDULE_JITTER_SECONDS: int = int(os.getenv("INGESTION_SCHEDULE_JITTER_SECONDS", "60"))
+    
+    # Prazo de cada execução da ingestão em segundos (0 = sem prazo; na Vercel,
+    # abaixo do limite da função) e emails lidos na primeira execução, sem checkpoint
+    INGESTION_TIME_BUDGET_SECONDS: float = float(os.getenv("INGESTION_TIME_BUDGET_SECONDS", "50" if IS_VERCEL else "0"))
+    INGESTION_INITIAL_EMAILS: int = int(os.getenv("INGESTION_INITIAL_EMAILS", "10"))
+    
+    # Reprocessamento de PDFs com falha de extração: espera inicial e máxima
+    # entre tentativas (dobra a cada falha), tentativas até desistir, PDFs por
+    # lote e threads de extração
+    EXTRACTION_RETRY_BASE_SECONDS: int = int(os.getenv("EXTRACTION_RETRY_BASE_SECONDS", "300"))
+    EXTRACTION_RETRY_MAX_SECONDS: int = int(os.getenv("EXTRACTION_RETRY_MAX_SECONDS", "86400"))
+    EXTRACTION_MAX_ATTEMPTS: int = int(os.getenv("EXTRACTION_MAX_ATTEMPTS", "8"))
+    EXTRACTION_RETRY_BATCH_SIZE: int = int(os.getenv("EXTRACTION_RETRY_BATCH_SIZE", "20"))
+    EXTRACTION_RETRY_WORKERS: int = int(os.getenv("EXTRACTION_RETRY_WORKERS", "4"))
+    
     # URLs do frontend
     FRONTEND_SUCCESS_URL: str = os.getenv(
         "FRONTEND_SUCCESS_URL", 
@@ -74,10 +190,68 @@ class Settings:
         else "data/sample_emails"
     )
     
+    @classmethod
+    def usa_pooler_externo(cls) -> bool:
+        """Indica se a conexão passa por um pooler externo em modo transação"""
+        url = cls.DATABASE_URL or ""
+        return (
+            cls.DATABASE_POOLER in ("pgbouncer", "transaction")
+            or "pgbouncer=true" in url.lower()
+            or ":6543/" in url
+        )
+    
+    @classmethod
+    def get_pool_sizing(cls) -> dict:
+        """
+        Calcula o pool de cada engine a partir do perfil, limitado pela fatia
+        de DATABASE_MAX_CONNECTIONS de cada worker (80%; o restante fica para
+        jobs, migrações e acesso administrativo), dividida entre os engines
+        que cada worker abre com o primário (síncrono e assíncrono).
+        """
+        perfil = cls.POOL_PROFILE
+        if perfil not in cls.POOL_PROFILES:
+            perfil = "serverless" if cls.IS_VERCEL else "padrao"
+        
+        pool_size, max_overflow, pool_timeout = cls.POOL_PROFILES[perfil]
+        workers = max(cls.WEB_CONCURRENCY, 1)
+        por_worker = max(int(cls.DATABASE_MAX_CONNECTIONS * 0.8) // workers, 1)
+        por_engine = max(por_worker // cls.ENGINES_POR_WORKER, 1)
+        
+        pool_size = min(pool_size, por_engine)
+        max_overflow = max(min(max_overflow, por_engine - pool_size), 0)
+        return {
+            "perfil": perfil,
+            "workers": workers,
+            "conexoes_por_worker": por_worker,
+            "engines_por_worker": cls.ENGINES_POR_WORKER,
+            "conexoes_por_engine": por_engine,
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": pool_timeout
+        }
+    
     @classmethod
     def get_database_config(cls) -> dict:
         """Retorna configuração específica do banco baseada no ambiente"""
-        if cls.IS_VERCEL:
+        if (cls.IS_VERCEL or cls.IS_HOSTINGER) and cls.usa_pooler_externo():
+            # O pooler mantém as conexões com o PostgreSQL; aqui basta um pool
+            # pequeno que sobrevive entre invocações "quentes" da função
+            sizing = cls.get_pool_sizing()
+            return {
+                "type": "postgresql",
+                "pool_class": "QueuePool",
+                "pooler": "pgbouncer",
+                "pool_size": cls.POOLER_POOL_SIZE or sizing["pool_size"],
+                "max_overflow": sizing["max_overflow"],
+                "pool_timeout": sizing["pool_timeout"],
+                "pool_pre_ping": True,
+                "pool_recycle": 300,
+                "connect_args": {
+                    "connect_timeout": 10,
+                    "application_name": "moara_faturas"
+                }
+            }
+        elif cls.IS_VERCEL:
             return {
                 "type": "postgresql",
                 "pool_class": "NullPool",
@@ -87,11 +261,13 @@ class Settings:
                 }
             }
         elif cls.IS_HOSTINGER:
+            sizing = cls.get_pool_sizing()
             return {
                 "type": "postgresql",
                 "pool_class": "QueuePool",
-                "pool_size": 5,
-                "max_overflow": 10,
+                "pool_size": sizing["pool_size"],
+                "max_overflow": sizing["max_overflow"],
+                "pool_timeout": sizing["pool_timeout"],
                 "pool_pre_ping": True,
                 "pool_recycle": 3600,
                 "connect_args": {
@@ -102,6 +278,18 @@ class Settings:
         else:
             return {
                 "type": "sqlite",
+                "modo": cls.SQLITE_MODE,
+                "pool_escrita": max(cls.SQLITE_WRITE_POOL_SIZE, 1),
+                "pool_leitura": max(cls.SQLITE_READ_POOL_SIZE, 1),
+                "pool_timeout": 30,
+                "pragmas": {
+                    "journal_mode": "WAL",
+                    "synchronous": "NORMAL",
+                    "busy_timeout": cls.SQLITE_BUSY_TIMEOUT_MS,
+                    "cache_size": -cls.SQLITE_CACHE_SIZE_KB,  # negativo = KiB
+                    "mmap_size": cls.SQLITE_MMAP_SIZE,
+                    "temp_store": "MEMORY"
+                },
                 "connect_args": {"check_same_thread": False}
             }
     
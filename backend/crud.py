@@ -3,17 +3,96 @@ Operações CRUD para o Sistema de Gestão de Faturas
 Implementa todas as operações de banco de dados para faturas
 """
 
-from sqlalchemy.orm import Session
+import json
+import re
+import unicodedata
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import and_, bindparam, case, func, or_, select, update
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Sequence, Tuple
 
 # Importações com fallback para Vercel
 try:
-    from .models import Fatura
+    from .models import CheckoutSessao, Checkpoint, Cliente, FalhaExtracao, Instalacao, Fatura, FaturaHistorico, JobIngestao, LinkPagamento, StripeEvento
     from .schemas import FaturaCreate, FaturaUpdate
+    from .database import criar_particao_historico
+    from .cache import cache_faturas
 except ImportError:
-    from models import Fatura
+    from models import CheckoutSessao, Checkpoint, Cliente, FalhaExtracao, Instalacao, Fatura, FaturaHistorico, JobIngestao, LinkPagamento, StripeEvento
     from schemas import FaturaCreate, FaturaUpdate
+    from database import criar_particao_historico
+    from cache import cache_faturas
+
+# Meses por extenso ou abreviados, sem acentos
+MESES = {
+    "janeiro": 1, "jan": 1, "fevereiro": 2, "fev": 2, "marco": 3, "mar": 3,
+    "abril": 4, "abr": 4, "maio": 5, "mai": 5, "junho": 6, "jun": 6,
+    "julho": 7, "jul": 7, "agosto": 8, "ago": 8, "setembro": 9, "set": 9,
+    "outubro": 10, "out": 10, "novembro": 11, "nov": 11, "dezembro": 12, "dez": 12
+}
+
+# IDs por instrução UPDATE ... IN (...) (abaixo do limite de parâmetros do SQLite)
+LIMITE_IDS_POR_UPDATE = 10000
+
+# Partições de histórico já garantidas neste processo
+_particoes_garantidas = set()
+
+def competencia_de_referencia(mes_referencia: Optional[str]) -> Optional[date]:
+    """
+    Converte o mês de referência ('Agosto/2025', 'AGO/2025' ou '08/2025')
+    no primeiro dia do mês correspondente.
+    
+    Returns:
+        Data da competência ou None se o formato não for reconhecido
+    """
+    if not mes_referencia:
+        return None
+    
+    match = re.match(r"^\s*(\w+)\s*/\s*(\d{4})\s*$", mes_referencia)
+    if not match:
+        return None
+    
+    mes_texto, ano = match.group(1), int(match.group(2))
+    if mes_texto.isdigit():
+        mes = int(mes_texto)
+    else:
+        mes_texto = unicodedata.normalize("NFKD", mes_texto.lower())
+        mes = MESES.get("".join(c for c in mes_texto if not unicodedata.combining(c)))
+    
+    if not mes or not 1 <= mes <= 12:
+        return None
+    return date(ano, mes, 1)
+
+def _insert_dialeto(db: Session, tabela):
+    """Retorna um INSERT com suporte a ON CONFLICT para o dialeto da sessão"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(tabela)
+
+# Consultas quentes construídas uma única vez, com parâmetros nomeados:
+# a chave de cache fica memorizada no próprio statement e o SQL compilado
+# é reaproveitado do cache do engine, sem reconstruir a consulta a cada chamada
+STMT_FATURA_POR_ID = select(Fatura).where(Fatura.id == bindparam("fatura_id"))
+STMT_FATURA_POR_INSTALACAO = (
+    select(Fatura)
+    .where(Fatura.numero_instalacao == bindparam("numero_instalacao"))
+    .limit(1)
+)
+STMT_FATURAS = select(Fatura).offset(bindparam("skip")).limit(bindparam("limit"))
+STMT_FATURAS_POR_STATUS = STMT_FATURAS.where(Fatura.ja_pago == bindparam("ja_pago"))
+
+def _condicoes_job_ingestao(agora: datetime, timeout: int, max_tentativas: int):
+    """
+    Condições de job em execução sem heartbeat há mais de `timeout` segundos
+    (worker interrompido) e de job disponível para um worker
+    """
+    travado = and_(JobIngestao.status == "executando", JobIngestao.heartbeat_em < agora - timedelta(seconds=timeout))
+    disponivel = or_(JobIngestao.status == "pendente", and_(travado, JobIngestao.tentativas < max_tentativas))
+    return travado, disponivel
 
 class FaturaCRUD:
     """Classe para operações CRUD de faturas"""
@@ -30,9 +109,16 @@ class FaturaCRUD:
         Returns:
             Fatura encontrada ou None
         """
-        return db.query(Fatura).filter(
-            Fatura.numero_instalacao == numero_instalacao
+        fatura_id = cache_faturas.obter_id_por_instalacao(numero_instalacao)
+        if fatura_id is not None:
+            return FaturaCRUD.get_fatura_by_id(db, fatura_id)
+        
+        fatura = db.scalars(
+            STMT_FATURA_POR_INSTALACAO, {"numero_instalacao": numero_instalacao}
         ).first()
+        if fatura is not None and not db.is_modified(fatura):
+            cache_faturas.guardar(fatura)
+        return fatura
     
     @staticmethod
     def get_fatura_by_id(db: Session, fatura_id: int) -> Optional[Fatura]:
@@ -46,7 +132,14 @@ class FaturaCRUD:
         Returns:
             Fatura encontrada ou None
         """
-        return db.query(Fatura).filter(Fatura.id == fatura_id).first()
+        dados = cache_faturas.obter_por_id(fatura_id)
+        if dados is not None:
+            return db.merge(cache_faturas.instancia(dados), load=False)
+        
+        fatura = db.scalars(STMT_FATURA_POR_ID, {"fatura_id": fatura_id}).first()
+        if fatura is not None and not db.is_modified(fatura):
+            cache_faturas.guardar(fatura)
+        return fatura
     
     @staticmethod
     def get_faturas(
@@ -67,21 +160,57 @@ class FaturaCRUD:
         Returns:
             Lista de faturas
         """
-        query = db.query(Fatura)
+        if ja_pago is not None:
+            return list(db.scalars(STMT_FATURAS_POR_STATUS, {"skip": skip, "limit": limit, "ja_pago": ja_pago}))
+        return list(db.scalars(STMT_FATURAS, {"skip": skip, "limit": limit}))
+    
+    @staticmethod
+    def iter_faturas_exportacao(
+        db: Session,
+        colunas: Sequence[str],
+        ja_pago: Optional[bool] = None,
+        documento_cliente: Optional[str] = None,
+        numero_instalacao: Optional[str] = None,
+        lote: int = 1000
+    ) -> Iterator[tuple]:
+        """
+        Percorre as faturas como tuplas, buscando em lotes por um cursor do
+        lado do servidor (stream_results) para manter a memória constante.
+        
+        Args:
+            db: Sessão do banco de dados
+            colunas: Nomes das colunas de Fatura a selecionar
+            ja_pago: Filtro por status de pagamento
+            documento_cliente: Filtro por CPF/CNPJ do cliente
+            numero_instalacao: Filtro por número da instalação
+            lote: Linhas buscadas por ida ao banco
+            
+        Returns:
+            Iterador de tuplas na ordem de `colunas`
+        """
+        stmt = select(*[getattr(Fatura, coluna) for coluna in colunas])
         
         if ja_pago is not None:
-            query = query.filter(Fatura.ja_pago == ja_pago)
+            stmt = stmt.where(Fatura.ja_pago == ja_pago)
+        if documento_cliente:
+            stmt = stmt.where(Fatura.documento_cliente == documento_cliente)
+        if numero_instalacao:
+            stmt = stmt.where(Fatura.numero_instalacao == numero_instalacao)
         
-        return query.offset(skip).limit(limit).all()
+        stmt = stmt.order_by(Fatura.id).execution_options(stream_results=True, yield_per=lote)
+        for linha in db.execute(stmt):
+            yield tuple(linha)
     
     @staticmethod
-    def create_fatura(db: Session, fatura_data: Dict[str, Any]) -> Fatura:
+    def create_fatura(db: Session, fatura_data: Dict[str, Any], commit: bool = True) -> Fatura:
         """
         Cria uma nova fatura no banco de dados.
         
         Args:
             db: Sessão do banco de dados
             fatura_data: Dados da fatura
+            commit: Com False, só envia ao banco (flush): o chamador faz o
+                commit ou o rollback da transação inteira
             
         Returns:
             Fatura criada
@@ -92,21 +221,28 @@ class FaturaCRUD:
         try:
             db_fatura = Fatura(**fatura_data)
             db.add(db_fatura)
+            cache_faturas.invalidar(db, instalacoes=[db_fatura.numero_instalacao])
+            if not commit:
+                db.flush()
+                return db_fatura
             db.commit()
             db.refresh(db_fatura)
             return db_fatura
         except IntegrityError as e:
-            db.rollback()
+            if commit:
+                db.rollback()
             raise ValueError(f"Erro de integridade: {str(e)}")
         except Exception as e:
-            db.rollback()
+            if commit:
+                db.rollback()
             raise ValueError(f"Erro ao criar fatura: {str(e)}")
     
     @staticmethod
     def update_fatura(
         db: Session, 
         db_fatura: Fatura, 
-        fatura_data: Dict[str, Any]
+        fatura_data: Dict[str, Any],
+        commit: bool = True
     ) -> Fatura:
         """
         Atualiza uma fatura existente com novos dados.
@@ -115,20 +251,27 @@ class FaturaCRUD:
             db: Sessão do banco de dados
             db_fatura: Fatura existente
             fatura_data: Novos dados para atualizar
+            commit: Com False, só envia ao banco (flush), como em create_fatura
             
         Returns:
             Fatura atualizada
         """
         try:
+            instalacoes = [db_fatura.numero_instalacao, fatura_data.get("numero_instalacao")]
             for key, value in fatura_data.items():
                 if hasattr(db_fatura, key):
                     setattr(db_fatura, key, value)
             
+            cache_faturas.invalidar(db, ids=[db_fatura.id], instalacoes=instalacoes)
+            if not commit:
+                db.flush()
+                return db_fatura
             db.commit()
             db.refresh(db_fatura)
             return db_fatura
         except Exception as e:
-            db.rollback()
+            if commit:
+                db.rollback()
             raise ValueError(f"Erro ao atualizar fatura: {str(e)}")
     
     @staticmethod
@@ -147,6 +290,7 @@ class FaturaCRUD:
             db_fatura = FaturaCRUD.get_fatura_by_id(db, fatura_id)
             if db_fatura:
                 db_fatura.ja_pago = True
+                cache_faturas.invalidar(db, ids=[fatura_id])
                 db.commit()
                 db.refresh(db_fatura)
                 return db_fatura
@@ -155,6 +299,42 @@ class FaturaCRUD:
             db.rollback()
             raise ValueError(f"Erro ao atualizar status de pagamento: {str(e)}")
     
+    @staticmethod
+    def mark_paid_many(db: Session, fatura_ids: List[int]) -> Dict[str, List[int]]:
+        """
+        Marca várias faturas como pagas com UPDATE ... WHERE id IN (...) RETURNING id,
+        sem carregar as faturas na sessão.
+        
+        Args:
+            db: Sessão do banco de dados
+            fatura_ids: IDs das faturas
+            
+        Returns:
+            Dicionário com os IDs 'atualizadas' e 'nao_encontradas'
+        """
+        ids = sorted(set(fatura_ids))
+        atualizadas = set()
+        try:
+            for inicio in range(0, len(ids), LIMITE_IDS_POR_UPDATE):
+                stmt = (
+                    update(Fatura)
+                    .where(Fatura.id.in_(ids[inicio:inicio + LIMITE_IDS_POR_UPDATE]))
+                    .values(ja_pago=True)
+                    .returning(Fatura.id)
+                    .execution_options(synchronize_session=False)
+                )
+                atualizadas.update(db.execute(stmt).scalars())
+            cache_faturas.invalidar(db, ids=atualizadas)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise ValueError(f"Erro ao atualizar status de pagamento em lote: {str(e)}")
+        
+        return {
+            "atualizadas": sorted(atualizadas),
+            "nao_encontradas": [fatura_id for fatura_id in ids if fatura_id not in atualizadas]
+        }
+    
     @staticmethod
     def delete_fatura(db: Session, fatura_id: int) -> bool:
         """
@@ -170,6 +350,7 @@ class FaturaCRUD:
         try:
             db_fatura = FaturaCRUD.get_fatura_by_id(db, fatura_id)
             if db_fatura:
+                cache_faturas.invalidar(db, ids=[fatura_id], instalacoes=[db_fatura.numero_instalacao])
                 db.delete(db_fatura)
                 db.commit()
                 return True
@@ -222,6 +403,1098 @@ class FaturaCRUD:
             Lista de faturas pagas
         """
         return db.query(Fatura).filter(Fatura.ja_pago == True).all()
+    
+    @staticmethod
+    def garantir_particao_historico(db: Session, competencia: date) -> None:
+        """
+        Garante que a partição mensal do histórico existe (PostgreSQL).
+        
+        Args:
+            db: Sessão do banco de dados
+            competencia: Primeiro dia do mês de referência
+        """
+        if competencia in _particoes_garantidas or db.get_bind().dialect.name != "postgresql":
+            return
+        # Transação própria: a partição persiste mesmo se a sessão fizer rollback
+        with db.get_bind().begin() as connection:
+            criar_particao_historico(connection, competencia)
+        _particoes_garantidas.add(competencia)
+    
+    @staticmethod
+    def registrar_historico(db: Session, fatura_data: Dict[str, Any]) -> Optional[date]:
+        """
+        Grava (ou atualiza) a fatura no histórico mensal, chaveado por
+        instalação e mês de referência. Não faz commit.
+        
+        Args:
+            db: Sessão do banco de dados
+            fatura_data: Dados da fatura
+            
+        Returns:
+            Competência gravada ou None se o mês de referência for inválido
+        """
+        competencia = competencia_de_referencia(fatura_data.get("mes_referencia"))
+        if not competencia:
+            return None
+        
+        FaturaCRUD.garantir_particao_historico(db, competencia)
+        
+        valores = {
+            "numero_instalacao": fatura_data["numero_instalacao"],
+            "instalacao_id": fatura_data.get("instalacao_id"),
+            "competencia": competencia,
+            "mes_referencia": fatura_data["mes_referencia"],
+            "valor_total": fatura_data["valor_total"],
+            "data_vencimento": fatura_data["data_vencimento"],
+            "url_pdf": fatura_data.get("url_pdf"),
+        }
+        stmt = _insert_dialeto(db, FaturaHistorico).values(**valores)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["numero_instalacao", "competencia"],
+            set_={
+                "mes_referencia": stmt.excluded.mes_referencia,
+                "valor_total": stmt.excluded.valor_total,
+                "data_vencimento": stmt.excluded.data_vencimento,
+                "url_pdf": stmt.excluded.url_pdf,
+                "instalacao_id": func.coalesce(stmt.excluded.instalacao_id, FaturaHistorico.instalacao_id),
+                "data_ultima_atualizacao": func.now(),
+            }
+        )
+        db.execute(stmt)
+        return competencia
+    
+    @staticmethod
+    def garantir_cliente_instalacao(db: Session, fatura_data: Dict[str, Any]) -> Optional[int]:
+        """
+        Cria ou atualiza o cliente e a instalação da fatura. Nome e email
+        vazios não sobrescrevem os já cadastrados. Não faz commit.
+        
+        Args:
+            db: Sessão do banco de dados
+            fatura_data: Dados da fatura (documento, nome, email e instalação)
+            
+        Returns:
+            ID da instalação ou None se faltar documento ou instalação
+        """
+        documento = fatura_data.get("documento_cliente")
+        numero_instalacao = fatura_data.get("numero_instalacao")
+        if not documento or not numero_instalacao:
+            return None
+        
+        stmt = _insert_dialeto(db, Cliente).values(
+            documento=documento,
+            nome=fatura_data.get("nome_cliente") or "",
+            email=fatura_data.get("email_cliente") or None
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["documento"],
+            set_={
+                "nome": func.coalesce(func.nullif(stmt.excluded.nome, ""), Cliente.nome),
+                "email": func.coalesce(stmt.excluded.email, Cliente.email),
+                "data_ultima_atualizacao": func.now(),
+            }
+        ).returning(Cliente.id)
+        cliente_id = db.execute(stmt).scalar_one()
+        
+        stmt = _insert_dialeto(db, Instalacao).values(numero=numero_instalacao, cliente_id=cliente_id)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["numero"],
+            set_={"cliente_id": stmt.excluded.cliente_id}
+        ).returning(Instalacao.id)
+        return db.execute(stmt).scalar_one()
+    
+    @staticmethod
+    def upsert_faturas_lote(db: Session, faturas_data: List[Dict[str, Any]]) -> int:
+        """
+        Grava um lote de faturas validadas com INSERT ... ON CONFLICT em
+        poucas instruções: clientes, instalações, histórico mensal e, para
+        cada instalação, a fatura corrente (apenas se for o mês mais recente).
+        Não faz commit.
+        
+        Args:
+            db: Sessão do banco de dados
+            faturas_data: Dados das faturas (mes_referencia reconhecível)
+            
+        Returns:
+            Número de faturas gravadas no histórico
+        """
+        if not faturas_data:
+            return 0
+        
+        # Ordem de competência: nos dicionários abaixo, o registro mais
+        # recente de cada documento e instalação prevalece, seja qual for a
+        # ordem do arquivo
+        faturas_data = sorted(faturas_data, key=lambda dados: competencia_de_referencia(dados["mes_referencia"]))
+        
+        # Clientes (nome e email do registro mais recente de cada documento)
+        clientes = {
+            dados["documento_cliente"]: {
+                "documento": dados["documento_cliente"],
+                "nome": dados["nome_cliente"],
+                "email": dados.get("email_cliente"),
+            }
+            for dados in faturas_data
+        }
+        stmt = _insert_dialeto(db, Cliente.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["documento"],
+            set_={
+                "nome": func.coalesce(func.nullif(stmt.excluded.nome, ""), Cliente.nome),
+                "email": func.coalesce(stmt.excluded.email, Cliente.email),
+                "data_ultima_atualizacao": func.now(),
+            }
+        ).returning(Cliente.id, Cliente.documento)
+        cliente_ids = {
+            documento: cliente_id
+            for cliente_id, documento in db.execute(stmt, list(clientes.values()))
+        }
+        
+        # Instalações, agrupadas pela competência do registro mais recente: o
+        # dono só muda se ela não for anterior ao mês corrente já gravado
+        instalacoes = {
+            dados["numero_instalacao"]: (
+                competencia_de_referencia(dados["mes_referencia"]),
+                {"numero": dados["numero_instalacao"], "cliente_id": cliente_ids[dados["documento_cliente"]]}
+            )
+            for dados in faturas_data
+        }
+        por_competencia: Dict[date, List[Dict[str, Any]]] = {}
+        for competencia, valores in instalacoes.values():
+            por_competencia.setdefault(competencia, []).append(valores)
+        
+        competencia_gravada = (
+            select(func.max(FaturaHistorico.competencia))
+            .where(FaturaHistorico.numero_instalacao == Instalacao.numero)
+            .scalar_subquery()
+        )
+        instalacao_ids = {}
+        for competencia, valores in por_competencia.items():
+            stmt = _insert_dialeto(db, Instalacao.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["numero"],
+                set_={"cliente_id": stmt.excluded.cliente_id},
+                where=func.coalesce(competencia_gravada, competencia) <= competencia
+            ).returning(Instalacao.id, Instalacao.numero)
+            instalacao_ids.update(
+                (numero, instalacao_id) for instalacao_id, numero in db.execute(stmt, valores)
+            )
+        
+        # Instalações mantidas com o dono atual (registro anterior ao mês gravado)
+        mantidas = [numero for numero in instalacoes if numero not in instalacao_ids]
+        if mantidas:
+            instalacao_ids.update(db.execute(
+                select(Instalacao.numero, Instalacao.id).where(Instalacao.numero.in_(mantidas))
+            ).all())
+        
+        # Histórico mensal, uma linha por (instalação, competência)
+        historico = {}
+        for dados in faturas_data:
+            competencia = competencia_de_referencia(dados["mes_referencia"])
+            historico[(dados["numero_instalacao"], competencia)] = dados
+        
+        for competencia in {competencia for _, competencia in historico}:
+            FaturaCRUD.garantir_particao_historico(db, competencia)
+        
+        stmt = _insert_dialeto(db, FaturaHistorico.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["numero_instalacao", "competencia"],
+            set_={
+                "instalacao_id": stmt.excluded.instalacao_id,
+                "mes_referencia": stmt.excluded.mes_referencia,
+                "valor_total": stmt.excluded.valor_total,
+                "data_vencimento": stmt.excluded.data_vencimento,
+                "url_pdf": stmt.excluded.url_pdf,
+                "data_ultima_atualizacao": func.now(),
+            }
+        )
+        db.execute(stmt, [
+            {
+                "numero_instalacao": numero_instalacao,
+                "instalacao_id": instalacao_ids[numero_instalacao],
+                "competencia": competencia,
+                "mes_referencia": dados["mes_referencia"],
+                "valor_total": dados["valor_total"],
+                "data_vencimento": dados["data_vencimento"],
+                "url_pdf": dados.get("url_pdf"),
+            }
+            for (numero_instalacao, competencia), dados in historico.items()
+        ])
+        
+        # Fatura corrente: só o mês mais recente de cada instalação (incluindo o banco)
+        mais_recentes = dict(db.execute(
+            select(FaturaHistorico.numero_instalacao, func.max(FaturaHistorico.competencia))
+            .where(FaturaHistorico.numero_instalacao.in_(list(instalacoes)))
+            .group_by(FaturaHistorico.numero_instalacao)
+        ).all())
+        correntes = [
+            dict(dados, instalacao_id=instalacao_ids[numero_instalacao])
+            for (numero_instalacao, competencia), dados in historico.items()
+            if mais_recentes.get(numero_instalacao) == competencia
+        ]
+        
+        if correntes:
+            stmt = _insert_dialeto(db, Fatura.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["numero_instalacao"],
+                set_={
+                    coluna: getattr(stmt.excluded, coluna)
+                    for coluna in (
+                        "nome_cliente", "documento_cliente", "email_cliente", "instalacao_id",
+                        "valor_total", "mes_referencia", "data_vencimento", "url_pdf"
+                    )
+                } | {"data_ultima_atualizacao": func.now(), "versao": Fatura.versao + 1}
+            ).returning(Fatura.id)
+            cache_faturas.invalidar(
+                db,
+                ids=db.execute(stmt, correntes).scalars().all(),
+                instalacoes=[dados["numero_instalacao"] for dados in correntes]
+            )
+        
+        return len(historico)
+    
+    @staticmethod
+    def get_cliente_by_documento(db: Session, documento: str) -> Optional[Cliente]:
+        """
+        Busca um cliente pelo CPF/CNPJ.
+        
+        Args:
+            db: Sessão do banco de dados
+            documento: CPF/CNPJ do cliente
+            
+        Returns:
+            Cliente encontrado ou None
+        """
+        return db.query(Cliente).filter(Cliente.documento == documento).first()
+    
+    @staticmethod
+    def get_instalacoes_cliente(db: Session, documento: str) -> List[Instalacao]:
+        """
+        Retorna as instalações de um cliente.
+        
+        Args:
+            db: Sessão do banco de dados
+            documento: CPF/CNPJ do cliente
+            
+        Returns:
+            Lista de instalações do cliente
+        """
+        return db.query(Instalacao).join(
+            Cliente, Instalacao.cliente_id == Cliente.id
+        ).filter(Cliente.documento == documento).order_by(Instalacao.numero).all()
+    
+    @staticmethod
+    def get_faturas_cliente(db: Session, documento: str) -> List[Fatura]:
+        """
+        Retorna as faturas correntes de todas as instalações de um cliente,
+        navegando pelos índices de clientes.documento, instalacoes.cliente_id
+        e faturas.instalacao_id.
+        
+        Args:
+            db: Sessão do banco de dados
+            documento: CPF/CNPJ do cliente
+            
+        Returns:
+            Lista de faturas do cliente
+        """
+        return db.query(Fatura).join(
+            Instalacao, Fatura.instalacao_id == Instalacao.id
+        ).join(
+            Cliente, Instalacao.cliente_id == Cliente.id
+        ).filter(Cliente.documento == documento).order_by(Fatura.numero_instalacao).all()
+    
+    @staticmethod
+    def get_historico_cliente(
+        db: Session,
+        documento: str,
+        competencia: Optional[date] = None,
+        limit: int = 100
+    ) -> List[FaturaHistorico]:
+        """
+        Retorna o histórico mensal de todas as instalações de um cliente.
+        
+        Args:
+            db: Sessão do banco de dados
+            documento: CPF/CNPJ do cliente
+            competencia: Filtra um único mês (poda as demais partições)
+            limit: Número máximo de registros
+            
+        Returns:
+            Lista de faturas do histórico, da mais recente à mais antiga
+        """
+        query = db.query(FaturaHistorico).join(
+            Instalacao, FaturaHistorico.instalacao_id == Instalacao.id
+        ).join(
+            Cliente, Instalacao.cliente_id == Cliente.id
+        ).filter(Cliente.documento == documento)
+        
+        if competencia is not None:
+            query = query.filter(FaturaHistorico.competencia == competencia)
+        
+        return query.order_by(
+            FaturaHistorico.competencia.desc(), FaturaHistorico.numero_instalacao
+        ).limit(limit).all()
+    
+    @staticmethod
+    def get_historico_por_competencia(
+        db: Session,
+        competencia: date,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[FaturaHistorico]:
+        """
+        Retorna as faturas de um ciclo mensal. O filtro por competencia
+        permite ao PostgreSQL podar as demais partições.
+        
+        Args:
+            db: Sessão do banco de dados
+            competencia: Primeiro dia do mês de referência
+            skip: Número de registros para pular
+            limit: Número máximo de registros
+            
+        Returns:
+            Lista de faturas do ciclo
+        """
+        return db.query(FaturaHistorico).filter(
+            FaturaHistorico.competencia == competencia
+        ).order_by(FaturaHistorico.numero_instalacao).offset(skip).limit(limit).all()
+    
+    @staticmethod
+    def get_historico_instalacao(
+        db: Session,
+        numero_instalacao: str,
+        limit: int = 24
+    ) -> List[FaturaHistorico]:
+        """
+        Retorna o histórico mensal de uma instalação, do mais recente ao mais antigo.
+        
+        Args:
+            db: Sessão do banco de dados
+            numero_instalacao: Número da instalação
+            limit: Número máximo de meses
+            
+        Returns:
+            Lista de faturas do histórico
+        """
+        return db.query(FaturaHistorico).filter(
+            FaturaHistorico.numero_instalacao == numero_instalacao
+        ).order_by(FaturaHistorico.competencia.desc()).limit(limit).all()
+    
+    @staticmethod
+    def get_checkout_sessao(db: Session, fatura_id: int) -> Optional[CheckoutSessao]:
+        """
+        Busca a última sessão de checkout registrada para a fatura.
+        
+        Args:
+            db: Sessão do banco de dados
+            fatura_id: ID da fatura
+            
+        Returns:
+            Sessão de checkout ou None
+        """
+        return db.scalars(
+            select(CheckoutSessao).where(CheckoutSessao.fatura_id == fatura_id)
+        ).first()
+    
+    @staticmethod
+    def get_link_pagamento(db: Session, fatura_id: int) -> Optional[LinkPagamento]:
+        """
+        Busca o Payment Link registrado para a fatura.
+        
+        Args:
+            db: Sessão do banco de dados
+            fatura_id: ID da fatura
+            
+        Returns:
+            Link de pagamento ou None
+        """
+        return db.scalars(
+            select(LinkPagamento).where(LinkPagamento.fatura_id == fatura_id)
+        ).first()
+    
+    @staticmethod
+    def get_faturas_pendentes_link(db: Session) -> List[Any]:
+        """
+        Faturas não pagas com o Payment Link registrado (se houver), em
+        linhas com id, mes_referencia, valor_total e os campos
+        payment_link_id, valor_centavos e ativo do link (None quando não existe).
+        """
+        return db.execute(
+            select(
+                Fatura.id, Fatura.mes_referencia, Fatura.valor_total,
+                LinkPagamento.payment_link_id, LinkPagamento.valor_centavos, LinkPagamento.ativo
+            )
+            .outerjoin(LinkPagamento, LinkPagamento.fatura_id == Fatura.id)
+            .where(Fatura.ja_pago == False)
+            .order_by(Fatura.id)
+        ).all()
+    
+    @staticmethod
+    def salvar_links_pagamento(db: Session, lista_dados: List[Dict[str, Any]]) -> None:
+        """
+        Registra os Payment Links de várias faturas em uma única instrução
+        (executemany), substituindo os anteriores.
+        """
+        if not lista_dados:
+            return
+        stmt = _insert_dialeto(db, LinkPagamento.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["fatura_id"],
+            set_={
+                coluna: getattr(stmt.excluded, coluna)
+                for coluna in ("payment_link_id", "url", "valor_centavos", "ativo")
+            } | {"data_ultima_atualizacao": func.now()}
+        )
+        try:
+            db.execute(stmt, lista_dados)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise ValueError(f"Erro ao registrar link de pagamento: {str(e)}")
+    
+    @staticmethod
+    def salvar_checkout_sessao(db: Session, dados: Dict[str, Any]) -> None:
+        """
+        Registra a sessão de checkout da fatura, substituindo a anterior.
+        
+        Args:
+            db: Sessão do banco de dados
+            dados: fatura_id, session_id, checkout_url, valor_centavos, expira_em e status
+        """
+        FaturaCRUD.salvar_checkout_sessoes(db, [dados])
+    
+    @staticmethod
+    def salvar_checkout_sessoes(db: Session, lista_dados: List[Dict[str, Any]]) -> None:
+        """
+        Registra as sessões de checkout de várias faturas em uma única
+        instrução (executemany), substituindo as anteriores.
+        """
+        if not lista_dados:
+            return
+        stmt = _insert_dialeto(db, CheckoutSessao.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["fatura_id"],
+            set_={
+                coluna: getattr(stmt.excluded, coluna)
+                for coluna in ("session_id", "checkout_url", "valor_centavos", "expira_em", "status")
+            } | {"data_ultima_atualizacao": func.now()}
+        )
+        try:
+            db.execute(stmt, lista_dados)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise ValueError(f"Erro ao registrar sessão de checkout: {str(e)}")
+    
+    @staticmethod
+    def atualizar_checkout_sessoes(db: Session, session_ids: List[str], status: str) -> None:
+        """
+        Atualiza o status das sessões de checkout registradas. Não faz commit.
+        """
+        if session_ids:
+            db.execute(
+                update(CheckoutSessao)
+                .where(CheckoutSessao.session_id.in_(session_ids))
+                .values(status=status)
+                .execution_options(synchronize_session=False)
+            )
+    
+    @staticmethod
+    def get_checkpoint(db: Session, nome: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca o estado salvo de um job retomável.
+        
+        Args:
+            db: Sessão do banco de dados
+            nome: Nome do job
+            
+        Returns:
+            Estado do job ou None se ainda não houver checkpoint
+        """
+        valor = db.scalar(select(Checkpoint.valor).where(Checkpoint.nome == nome))
+        return json.loads(valor) if valor else None
+    
+    @staticmethod
+    def salvar_checkpoint(db: Session, nome: str, estado: Dict[str, Any]) -> None:
+        """
+        Grava o estado de um job retomável. Não faz commit, para que o
+        checkpoint seja gravado na mesma transação do trabalho que ele registra.
+        """
+        stmt = _insert_dialeto(db, Checkpoint.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["nome"],
+            set_={"valor": stmt.excluded.valor, "data_ultima_atualizacao": func.now()}
+        )
+        db.execute(stmt, {"nome": nome, "valor": json.dumps(estado)})
+
+    @staticmethod
+    def enfileirar_job_ingestao(db: Session) -> JobIngestao:
+        """
+        Enfileira um job de ingestão de emails. Se já houver um job pendente
+        (ainda não iniciado), ele é reaproveitado: cobriria os mesmos emails.
+        
+        Returns:
+            Job pendente
+        """
+        try:
+            job = db.scalars(
+                select(JobIngestao).where(JobIngestao.status == "pendente").order_by(JobIngestao.id).limit(1)
+            ).first()
+            if job is None:
+                job = JobIngestao(status="pendente")
+                db.add(job)
+            db.commit()
+            db.refresh(job)
+            return job
+        except Exception as e:
+            db.rollback()
+            raise ValueError(f"Erro ao enfileirar job de ingestão: {str(e)}")
+    
+    @staticmethod
+    def get_job_ingestao(db: Session, job_id: int) -> Optional[JobIngestao]:
+        """Busca um job de ingestão por ID"""
+        return db.get(JobIngestao, job_id)
+    
+    @staticmethod
+    def existe_job_ingestao_disponivel(db: Session, timeout: int, max_tentativas: int) -> bool:
+        """Indica, sem travar nada, se há job que um worker poderia reivindicar"""
+        agora = datetime.now(timezone.utc).replace(tzinfo=None)
+        _, disponivel = _condicoes_job_ingestao(agora, timeout, max_tentativas)
+        return db.scalar(select(JobIngestao.id).where(disponivel).limit(1)) is not None
+    
+    @staticmethod
+    def reivindicar_job_ingestao(db: Session, worker: str, timeout: int, max_tentativas: int) -> Optional[int]:
+        """
+        Reivindica o job mais antigo disponível: pendente ou em execução sem
+        heartbeat há mais de `timeout` segundos (worker interrompido). No
+        PostgreSQL a linha é travada com FOR UPDATE SKIP LOCKED, então workers
+        concorrentes pegam jobs diferentes sem esperar; o UPDATE condicional
+        garante o mesmo no SQLite, que ignora o FOR UPDATE.
+        
+        Args:
+            db: Sessão do banco de dados
+            worker: Identificação do worker
+            timeout: Segundos sem heartbeat para retomar um job em execução
+            max_tentativas: Jobs interrompidos esse número de vezes viram 'erro'
+            
+        Returns:
+            ID do job reivindicado ou None se a fila estiver vazia
+        """
+        agora = datetime.now(timezone.utc).replace(tzinfo=None)
+        travado, disponivel = _condicoes_job_ingestao(agora, timeout, max_tentativas)
+        try:
+            db.execute(
+                update(JobIngestao)
+                .where(travado, JobIngestao.tentativas >= max_tentativas)
+                .values(status="erro", concluido_em=agora, mensagem="Worker interrompido; tentativas esgotadas")
+                .execution_options(synchronize_session=False)
+            )
+            job_id = db.scalars(
+                select(JobIngestao.id)
+                .where(disponivel)
+                .order_by(JobIngestao.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).first()
+            if job_id is not None:
+                job_id = db.scalars(
+                    update(JobIngestao)
+                    .where(JobIngestao.id == job_id, disponivel)
+                    .values(
+                        status="executando", worker=worker, tentativas=JobIngestao.tentativas + 1,
+                        iniciado_em=agora, heartbeat_em=agora, mensagem=None
+                    )
+                    .returning(JobIngestao.id)
+                    .execution_options(synchronize_session=False)
+                ).first()
+            db.commit()
+            return job_id
+        except Exception as e:
+            db.rollback()
+            raise ValueError(f"Erro ao reivindicar job de ingestão: {str(e)}")
+    
+    @staticmethod
+    def atualizar_job_ingestao(db: Session, job_id: int, **valores: Any) -> None:
+        """
+        Registra o progresso (ou o resultado) do job e renova o heartbeat.
+        Faz commit.
+        """
+        valores["heartbeat_em"] = datetime.now(timezone.utc).replace(tzinfo=None)
+        if valores.get("status") in ("concluido", "erro"):
+            valores["concluido_em"] = valores["heartbeat_em"]
+        try:
+            db.execute(
+                update(JobIngestao)
+                .where(JobIngestao.id == job_id)
+                .values(**valores)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise ValueError(f"Erro ao atualizar job de ingestão: {str(e)}")
+    
+    @staticmethod
+    def registrar_falha_extracao(db: Session, dados: Dict[str, Any]) -> None:
+        """
+        Registra a falha de extração de um PDF na fila de reprocessamento.
+        Se o PDF já estiver na fila, conta mais uma tentativa e volta a
+        pendente. Não faz commit (entra na transação do checkpoint da ingestão).
+        
+        Args:
+            db: Sessão do banco de dados
+            dados: hash_pdf, nome_arquivo, caminho_pdf, conteudo_pdf, classe_erro,
+                mensagem e proxima_tentativa_em
+        """
+        stmt = _insert_dialeto(db, FalhaExtracao.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["hash_pdf"],
+            set_={
+                coluna: getattr(stmt.excluded, coluna)
+                for coluna in ("nome_arquivo", "caminho_pdf", "classe_erro", "mensagem", "proxima_tentativa_em")
+            } | {
+                "conteudo_pdf": func.coalesce(stmt.excluded.conteudo_pdf, FalhaExtracao.__table__.c.conteudo_pdf),
+                "status": "pendente",
+                "tentativas": FalhaExtracao.__table__.c.tentativas + 1,
+                "data_ultima_atualizacao": func.now()
+            }
+        )
+        db.execute(stmt, {"status": "pendente", "tentativas": 1, **dados})
+    
+    @staticmethod
+    def get_falhas_extracao_elegiveis(
+        db: Session,
+        max_tentativas: int,
+        limite: int,
+        apos_id: int = 0,
+        forcar: bool = False
+    ) -> List[FalhaExtracao]:
+        """
+        Falhas prontas para nova tentativa: pendentes com a próxima tentativa
+        vencida, em ordem de ID a partir de `apos_id` (cursor do lote). Com
+        `forcar` (ex.: após corrigir o parser), todas as que não foram
+        resolvidas, inclusive as esgotadas.
+        """
+        agora = datetime.now(timezone.utc).replace(tzinfo=None)
+        consulta = select(FalhaExtracao).where(FalhaExtracao.id > apos_id)
+        if forcar:
+            consulta = consulta.where(FalhaExtracao.status != "resolvida")
+        else:
+            consulta = consulta.where(
+                FalhaExtracao.status == "pendente",
+                FalhaExtracao.tentativas < max_tentativas,
+                or_(FalhaExtracao.proxima_tentativa_em.is_(None), FalhaExtracao.proxima_tentativa_em <= agora)
+            )
+        return list(db.scalars(consulta.order_by(FalhaExtracao.id).limit(limite)))
+    
+    @staticmethod
+    def atualizar_falhas_extracao(db: Session, resultados: List[Dict[str, Any]]) -> None:
+        """
+        Grava o resultado de um lote de tentativas (UPDATE por chave primária
+        em uma única instrução executemany). Não faz commit, para que as
+        faturas recuperadas e o status das falhas entrem na mesma transação.
+        
+        Args:
+            db: Sessão do banco de dados
+            resultados: id e as colunas a atualizar (status, tentativas, classe_erro, ...)
+        """
+        if resultados:
+            db.execute(update(FalhaExtracao), resultados)
+    
+    @staticmethod
+    def listar_falhas_extracao(db: Session, status: Optional[str] = None, limit: int = 100) -> List[FalhaExtracao]:
+        """Falhas de extração, das mais recentes para as mais antigas (sem o conteúdo do PDF)"""
+        consulta = select(FalhaExtracao).options(defer(FalhaExtracao.conteudo_pdf))
+        if status:
+            consulta = consulta.where(FalhaExtracao.status == status)
+        return list(db.scalars(consulta.order_by(FalhaExtracao.data_ultima_atualizacao.desc()).limit(limit)))
+
+class FaturaCRUDAsync:
+    """Operações CRUD de faturas para sessões assíncronas (AsyncSession)"""
+    
+    @staticmethod
+    async def get_fatura_by_instalacao(db: AsyncSession, numero_instalacao: str) -> Optional[Fatura]:
+        """
+        Busca uma fatura pelo número de instalação.
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            numero_instalacao: Número da instalação
+            
+        Returns:
+            Fatura encontrada ou None
+        """
+        fatura_id = cache_faturas.obter_id_por_instalacao(numero_instalacao)
+        if fatura_id is not None:
+            return await FaturaCRUDAsync.get_fatura_by_id(db, fatura_id)
+        
+        fatura = (await db.scalars(
+            STMT_FATURA_POR_INSTALACAO, {"numero_instalacao": numero_instalacao}
+        )).first()
+        if fatura is not None and not db.is_modified(fatura):
+            cache_faturas.guardar(fatura)
+        return fatura
+    
+    @staticmethod
+    async def get_fatura_by_id(db: AsyncSession, fatura_id: int) -> Optional[Fatura]:
+        """
+        Busca uma fatura pelo seu ID primário.
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            fatura_id: ID da fatura
+            
+        Returns:
+            Fatura encontrada ou None
+        """
+        dados = cache_faturas.obter_por_id(fatura_id)
+        if dados is not None:
+            return await db.merge(cache_faturas.instancia(dados), load=False)
+        
+        fatura = (await db.scalars(STMT_FATURA_POR_ID, {"fatura_id": fatura_id})).first()
+        if fatura is not None and not db.is_modified(fatura):
+            cache_faturas.guardar(fatura)
+        return fatura
+    
+    @staticmethod
+    async def get_validador_faturas(
+        db: AsyncSession,
+        ja_pago: Optional[bool] = None
+    ) -> Tuple[int, int, Optional[datetime], int, Optional[int]]:
+        """
+        Validador de uma coleção de faturas para requisições condicionais:
+        quantidade, quantidade paga, última atualização, soma das versões
+        (muda a cada UPDATE, mesmo dentro do mesmo segundo) e maior ID (muda
+        se uma fatura é trocada por outra), em uma consulta agregada.
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            ja_pago: Filtro por status de pagamento
+            
+        Returns:
+            Tupla (total, pagas, maior data_ultima_atualizacao, soma das versões, maior id)
+        """
+        stmt = select(
+            func.count(Fatura.id),
+            func.count(Fatura.id).filter(Fatura.ja_pago == True),
+            func.max(Fatura.data_ultima_atualizacao),
+            func.coalesce(func.sum(Fatura.versao), 0),
+            func.max(Fatura.id),
+        )
+        if ja_pago is not None:
+            stmt = stmt.where(Fatura.ja_pago == ja_pago)
+        return tuple((await db.execute(stmt)).one())
+    
+    @staticmethod
+    async def get_validador_fatura(db: AsyncSession, fatura_id: int) -> Optional[Tuple[datetime, int]]:
+        """
+        Validador de uma fatura: data da última atualização e versão da linha.
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            fatura_id: ID da fatura
+            
+        Returns:
+            Tupla (data_ultima_atualizacao, versao) ou None se não existir
+        """
+        result = await db.execute(
+            select(Fatura.data_ultima_atualizacao, Fatura.versao).where(Fatura.id == fatura_id)
+        )
+        linha = result.first()
+        return tuple(linha) if linha else None
+    
+    @staticmethod
+    async def get_faturas(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        ja_pago: Optional[bool] = None
+    ) -> List[Fatura]:
+        """
+        Retorna uma lista de faturas com paginação e filtros opcionais.
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            skip: Número de registros para pular
+            limit: Número máximo de registros
+            ja_pago: Filtro por status de pagamento
+            
+        Returns:
+            Lista de faturas
+        """
+        if ja_pago is not None:
+            return list(await db.scalars(STMT_FATURAS_POR_STATUS, {"skip": skip, "limit": limit, "ja_pago": ja_pago}))
+        return list(await db.scalars(STMT_FATURAS, {"skip": skip, "limit": limit}))
+    
+    @staticmethod
+    async def get_faturas_linhas(
+        db: AsyncSession,
+        colunas: Sequence[Any],
+        skip: int = 0,
+        limit: Optional[int] = None,
+        ja_pago: Optional[bool] = None
+    ) -> List[Tuple]:
+        """
+        Retorna as faturas como tuplas com apenas as colunas informadas,
+        sem instanciar objetos ORM (usado nas listagens serializadas direto).
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            colunas: Colunas de Fatura a selecionar, na ordem desejada
+            skip: Número de registros para pular
+            limit: Número máximo de registros (None = todos)
+            ja_pago: Filtro por status de pagamento
+            
+        Returns:
+            Lista de tuplas
+        """
+        stmt = select(*colunas)
+        
+        if ja_pago is not None:
+            stmt = stmt.where(Fatura.ja_pago == ja_pago)
+        if skip:
+            stmt = stmt.offset(skip)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        
+        result = await db.execute(stmt)
+        return list(result)
+    
+    @staticmethod
+    async def get_fatura_colunas(db: AsyncSession, fatura_id: int, colunas: Sequence[Any]) -> Optional[Tuple]:
+        """
+        Retorna apenas as colunas informadas de uma fatura, como tupla.
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            fatura_id: ID da fatura
+            colunas: Colunas de Fatura a selecionar, na ordem desejada
+            
+        Returns:
+            Tupla com os valores ou None se não encontrada
+        """
+        result = await db.execute(select(*colunas).where(Fatura.id == fatura_id))
+        return result.first()
+    
+    @staticmethod
+    async def get_faturas_pendentes(db: AsyncSession) -> List[Fatura]:
+        """
+        Retorna todas as faturas pendentes de pagamento.
+        """
+        result = await db.execute(select(Fatura).where(Fatura.ja_pago == False))
+        return list(result.scalars())
+    
+    @staticmethod
+    async def get_faturas_pagas(db: AsyncSession) -> List[Fatura]:
+        """
+        Retorna todas as faturas já pagas.
+        """
+        result = await db.execute(select(Fatura).where(Fatura.ja_pago == True))
+        return list(result.scalars())
+    
+    @staticmethod
+    async def get_estatisticas(db: AsyncSession) -> Dict[str, Any]:
+        """
+        Calcula os totais do dashboard em uma única consulta agregada.
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            
+        Returns:
+            Quantidades e valores totais, pendentes e pagos
+        """
+        pago = Fatura.ja_pago == True
+        stmt = select(
+            func.count(Fatura.id),
+            func.count(Fatura.id).filter(pago),
+            func.coalesce(func.sum(Fatura.valor_total), 0),
+            func.coalesce(func.sum(Fatura.valor_total).filter(pago), 0),
+        )
+        total, pagas, valor_total, valor_recebido = (await db.execute(stmt)).one()
+        return {
+            "total_faturas": total,
+            "faturas_pendentes": total - pagas,
+            "faturas_pagas": pagas,
+            "valor_total": float(valor_total),
+            "valor_pendente": float(valor_total) - float(valor_recebido),
+            "valor_recebido": float(valor_recebido),
+        }
+    
+    @staticmethod
+    async def update_fatura_ja_pago(db: AsyncSession, fatura_id: int) -> Optional[Fatura]:
+        """
+        Atualiza o status 'ja_pago' de uma fatura para True.
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            fatura_id: ID da fatura
+            
+        Returns:
+            Fatura atualizada ou None se não encontrada
+        """
+        try:
+            db_fatura = await FaturaCRUDAsync.get_fatura_by_id(db, fatura_id)
+            if db_fatura:
+                db_fatura.ja_pago = True
+                cache_faturas.invalidar(db, ids=[fatura_id])
+                await db.commit()
+                await db.refresh(db_fatura)
+                return db_fatura
+            return None
+        except Exception as e:
+            await db.rollback()
+            raise ValueError(f"Erro ao atualizar status de pagamento: {str(e)}")
+    
+    @staticmethod
+    async def mark_paid_many(db: AsyncSession, fatura_ids: List[int]) -> Dict[str, List[int]]:
+        """
+        Marca várias faturas como pagas com UPDATE ... WHERE id IN (...) RETURNING id.
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            fatura_ids: IDs das faturas
+            
+        Returns:
+            Dicionário com os IDs 'atualizadas' e 'nao_encontradas'
+        """
+        ids = sorted(set(fatura_ids))
+        atualizadas = set()
+        try:
+            for inicio in range(0, len(ids), LIMITE_IDS_POR_UPDATE):
+                stmt = (
+                    update(Fatura)
+                    .where(Fatura.id.in_(ids[inicio:inicio + LIMITE_IDS_POR_UPDATE]))
+                    .values(ja_pago=True)
+                    .returning(Fatura.id)
+                    .execution_options(synchronize_session=False)
+                )
+                atualizadas.update((await db.execute(stmt)).scalars())
+            cache_faturas.invalidar(db, ids=atualizadas)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise ValueError(f"Erro ao atualizar status de pagamento em lote: {str(e)}")
+        
+        return {
+            "atualizadas": sorted(atualizadas),
+            "nao_encontradas": [fatura_id for fatura_id in ids if fatura_id not in atualizadas]
+        }
+
+    @staticmethod
+    async def registrar_evento_stripe(db: AsyncSession, event_id: str, tipo: str, payload: str) -> bool:
+        """
+        Grava o evento do webhook na caixa de entrada (INSERT ... ON CONFLICT DO NOTHING).
+        
+        Args:
+            db: Sessão assíncrona do banco de dados
+            event_id: ID do evento no Stripe
+            tipo: Tipo do evento (ex.: checkout.session.completed)
+            payload: Objeto do evento em JSON
+            
+        Returns:
+            True se o evento é novo, False se já havia sido recebido
+        """
+        stmt = _insert_dialeto(db, StripeEvento.__table__).values(
+            event_id=event_id, tipo=tipo, payload=payload
+        ).on_conflict_do_nothing(index_elements=["event_id"])
+        try:
+            result = await db.execute(stmt)
+            await db.commit()
+            return result.rowcount == 1
+        except Exception as e:
+            await db.rollback()
+            raise ValueError(f"Erro ao registrar evento do Stripe: {str(e)}")
+    
+    @staticmethod
+    async def reivindicar_eventos_stripe(db: AsyncSession, limite: int, timeout: int) -> List[Any]:
+        """
+        Reivindica os eventos pendentes mais antigos da caixa de entrada
+        (status 'processando'), para que processadores concorrentes (várias
+        instâncias, webhook e cron) não apliquem o mesmo lote. Eventos em
+        'processando' há mais de `timeout` segundos (processador interrompido)
+        voltam a ser elegíveis. No PostgreSQL as linhas são travadas com FOR
+        UPDATE SKIP LOCKED; o UPDATE condicional garante o mesmo no SQLite.
+        
+        Returns:
+            Linhas com event_id, tipo e payload dos eventos reivindicados
+        """
+        agora = datetime.now(timezone.utc).replace(tzinfo=None)
+        disponivel = or_(
+            StripeEvento.status == "pendente",
+            and_(
+                StripeEvento.status == "processando",
+                StripeEvento.reivindicado_em < agora - timedelta(seconds=timeout)
+            )
+        )
+        try:
+            event_ids = list((await db.scalars(
+                select(StripeEvento.event_id)
+                .where(disponivel)
+                .order_by(StripeEvento.recebido_em)
+                .limit(limite)
+                .with_for_update(skip_locked=True)
+            )).all())
+            eventos = []
+            if event_ids:
+                eventos = list((await db.execute(
+                    update(StripeEvento)
+                    .where(StripeEvento.event_id.in_(event_ids), disponivel)
+                    .values(status="processando", reivindicado_em=agora)
+                    .returning(StripeEvento.event_id, StripeEvento.tipo, StripeEvento.payload, StripeEvento.recebido_em)
+                    .execution_options(synchronize_session=False)
+                )).all())
+            await db.commit()
+            return sorted(eventos, key=lambda evento: evento.recebido_em)
+        except Exception as e:
+            await db.rollback()
+            raise ValueError(f"Erro ao reivindicar eventos do Stripe: {str(e)}")
+    
+    @staticmethod
+    async def atualizar_checkout_sessoes(db: AsyncSession, session_ids: List[str], status: str) -> None:
+        """
+        Atualiza o status das sessões de checkout registradas. Não faz commit.
+        """
+        if session_ids:
+            await db.execute(
+                update(CheckoutSessao)
+                .where(CheckoutSessao.session_id.in_(session_ids))
+                .values(status=status)
+                .execution_options(synchronize_session=False)
+            )
+    
+    @staticmethod
+    async def marcar_eventos_stripe(
+        db: AsyncSession,
+        event_ids: List[str],
+        status: str,
+        erro: Optional[str] = None,
+        max_tentativas: Optional[int] = None
+    ) -> None:
+        """
+        Marca eventos da caixa de entrada como processados ou registra a falha.
+        Em falha, o evento volta a 'pendente' até atingir max_tentativas.
+        """
+        if not event_ids:
+            return
+        valores: Dict[str, Any] = {"tentativas": StripeEvento.tentativas + 1, "erro": erro}
+        if status == "processado":
+            valores.update(status="processado", processado_em=func.now())
+        elif max_tentativas is not None:
+            valores["status"] = case(
+                (StripeEvento.tentativas + 1 >= max_tentativas, "erro"), else_="pendente"
+            )
+        else:
+            valores["status"] = status
+        try:
+            await db.execute(
+                update(StripeEvento)
+                .where(StripeEvento.event_id.in_(event_ids))
+                .values(**valores)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise ValueError(f"Erro ao atualizar eventos do Stripe: {str(e)}")
 
 # Funções de conveniência para compatibilidade com código existente
 def get_fatura_by_instalacao(db: Session, numero_instalacao: str) -> Optional[Fatura]:
@@ -233,11 +1506,20 @@ def get_fatura_by_id(db: Session, fatura_id: int) -> Optional[Fatura]:
 def get_faturas(db: Session, skip: int = 0, limit: int = 100) -> List[Fatura]:
     return FaturaCRUD.get_faturas(db, skip, limit)
 
-def create_fatura(db: Session, fatura_data: Dict[str, Any]) -> Fatura:
-    return FaturaCRUD.create_fatura(db, fatura_data)
+def create_fatura(db: Session, fatura_data: Dict[str, Any], commit: bool = True) -> Fatura:
+    return FaturaCRUD.create_fatura(db, fatura_data, commit)
 
-def update_fatura(db: Session, db_fatura: Fatura, fatura_data: Dict[str, Any]) -> Fatura:
-    return FaturaCRUD.update_fatura(db, db_fatura, fatura_data)
+def update_fatura(db: Session, db_fatura: Fatura, fatura_data: Dict[str, Any], commit: bool = True) -> Fatura:
+    return FaturaCRUD.update_fatura(db, db_fatura, fatura_data, commit)
 
 def update_fatura_ja_pago(db: Session, fatura_id: int) -> Optional[Fatura]:
-    return FaturaCRUD.update_fatura_ja_pago(db, fatura_id)
\ No newline at end of file
+    return FaturaCRUD.update_fatura_ja_pago(db, fatura_id)
+
+def mark_paid_many(db: Session, fatura_ids: List[int]) -> Dict[str, List[int]]:
+    return FaturaCRUD.mark_paid_many(db, fatura_ids)
+
+def registrar_historico(db: Session, fatura_data: Dict[str, Any]) -> Optional[date]:
+    return FaturaCRUD.registrar_historico(db, fatura_data)
+
+def garantir_cliente_instalacao(db: Session, fatura_data: Dict[str, Any]) -> Optional[int]:
+    return FaturaCRUD.garantir_cliente_instalacao(db, fatura_data)
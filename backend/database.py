@@ -3,47 +3,141 @@ Configuração unificada de banco de dados
 Suporta SQLite (desenvolvimento), PostgreSQL (Vercel) e PostgreSQL (Hostinger)
 """
 
+import itertools
 import os
-from sqlalchemy import create_engine, text
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from datetime import date, timedelta
+from uuid import uuid4
+from sqlalchemy import DateTime, LargeBinary, create_engine, event, func, inspect, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.pool import NullPool, QueuePool
-from typing import Generator
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from typing import AsyncGenerator, Dict, Generator, Iterator, List, Optional, Tuple
 
 # Importações com fallback para Vercel
 try:
     from .config import settings
-    from .models import Base
+    from .models import Base, Trava
+    from .metricas import Contadores, Histograma
 except ImportError:
     from config import settings
-    from models import Base
+    from models import Base, Trava
+    from metricas import Contadores, Histograma
+
+# Métricas por pool (chave: pool_logging_name do engine)
+METRICAS_POOL: Dict[str, dict] = {}
+
+def metricas_pool(nome: str) -> dict:
+    """Retorna (criando se necessário) as métricas de um pool"""
+    if nome not in METRICAS_POOL:
+        METRICAS_POOL[nome] = {
+            "espera_checkout_ms": Histograma(),
+            "contadores": Contadores("checkouts", "checkins", "conexoes_criadas", "timeouts")
+        }
+    return METRICAS_POOL[nome]
+
+class _CheckoutMedido:
+    """Mede o tempo de espera por uma conexão do pool e conta os timeouts"""
+    
+    def connect(self):
+        metricas = metricas_pool(self.logging_name or "primario")
+        inicio = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            metricas["contadores"].incrementar("timeouts")
+            raise
+        finally:
+            metricas["espera_checkout_ms"].observar((time.perf_counter() - inicio) * 1000)
+
+class QueuePoolMedido(_CheckoutMedido, QueuePool):
+    pass
+
+class NullPoolMedido(_CheckoutMedido, NullPool):
+    pass
+
+class AsyncQueuePoolMedido(_CheckoutMedido, AsyncAdaptedQueuePool):
+    pass
+
+def instrumentar_engine(engine, nome: str) -> None:
+    """Registra os eventos do pool (conexões criadas, checkouts e checkins)"""
+    contadores = metricas_pool(nome)["contadores"]
+    event.listen(engine, "connect", lambda *args: contadores.incrementar("conexoes_criadas"))
+    event.listen(engine, "checkout", lambda *args: contadores.incrementar("checkouts"))
+    event.listen(engine, "checkin", lambda *args: contadores.incrementar("checkins"))
+
+def configurar_sqlite(engine, pragmas: Dict[str, object], somente_leitura: bool = False) -> None:
+    """
+    Aplica os PRAGMAs do modo de alta concorrência a cada nova conexão SQLite.
+    No WAL leitores não bloqueiam o escritor (nem o contrário); busy_timeout
+    faz a conexão esperar pelo lock em vez de falhar com "database is locked".
+    """
+    def aplicar_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma, valor in pragmas.items():
+                cursor.execute(f"PRAGMA {pragma}={valor}")
+            if somente_leitura:
+                cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+    
+    event.listen(engine, "connect", aplicar_pragmas)
+
+def relatorio_pool(engine, nome: str) -> dict:
+    """Estado atual e métricas acumuladas de um pool"""
+    pool = engine.pool
+    contadores = metricas_pool(nome)["contadores"].to_dict()
+    relatorio = {
+        "classe": type(pool).__name__,
+        "em_uso": contadores["checkouts"] - contadores["checkins"],
+        "contadores": contadores,
+        "espera_checkout_ms": metricas_pool(nome)["espera_checkout_ms"].to_dict()
+    }
+    if isinstance(pool, QueuePool):
+        relatorio.update({
+            "pool_size": pool.size(),
+            "conexoes_livres": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout()
+        })
+    return relatorio
+
+# Parâmetros de pooler (formato Prisma/Supabase) que o libpq não aceita na URL
+POOLER_PARAMS = [
+    "pgbouncer",
+    "pooling",
+    "connection_limit",
+    "pool_timeout",
+    "connect_timeout"
+]
 
 def clean_database_url(database_url: str) -> str:
     """
-    Limpa o DATABASE_URL removendo parâmetros incompatíveis
-    como pgbouncer que causam erros no SQLAlchemy
+    Limpa o DATABASE_URL removendo parâmetros de pooler que o driver não
+    reconhece. Host e porta do pooler são mantidos; os valores removidos
+    são lidos por get_pooler_url_options.
     """
     if not database_url or "postgresql" not in database_url:
         return database_url
     
-    # Remove parâmetros problemáticos
-    problematic_params = [
-        "pgbouncer",
-        "pooling",
-        "connection_limit",
-        "connect_timeout"
-    ]
-    
     # Divide a URL em partes
     if "?" in database_url:
         base_url, params = database_url.split("?", 1)
         param_pairs = params.split("&")
         
-        # Filtra parâmetros problemáticos
+        # Filtra parâmetros de pooler
         clean_params = []
         for param in param_pairs:
             param_name = param.split("=")[0]
-            if param_name not in problematic_params:
+            if param_name not in POOLER_PARAMS:
                 clean_params.append(param)
         
         # Reconstrói a URL
@@ -54,6 +148,30 @@ def clean_database_url(database_url: str) -> str:
     else:
         return database_url
 
+def get_pooler_url_options(database_url: str) -> dict:
+    """Lê os parâmetros de pooler da URL (ex.: connection_limit=1&pgbouncer=true)"""
+    if not database_url or "?" not in database_url:
+        return {}
+    
+    options = {}
+    for param in database_url.split("?", 1)[1].split("&"):
+        name, _, value = param.partition("=")
+        if name in POOLER_PARAMS:
+            options[name] = value
+    return options
+
+def aplicar_opcoes_pooler(config: dict) -> dict:
+    """
+    Ajusta o tamanho do pool ao connection_limit informado na URL do pooler,
+    dividido entre os engines do worker
+    """
+    if config.get("pooler"):
+        options = get_pooler_url_options(settings.DATABASE_URL)
+        if options.get("connection_limit", "").isdigit() and not settings.POOLER_POOL_SIZE:
+            limite = max(int(options["connection_limit"]) // settings.ENGINES_POR_WORKER, 1)
+            config = dict(config, pool_size=limite, max_overflow=0)
+    return config
+
 def get_database_url() -> str:
     """Retorna a URL do banco de dados baseada no ambiente"""
     if settings.IS_VERCEL or settings.IS_HOSTINGER:
@@ -65,13 +183,100 @@ def get_database_url() -> str:
     else:
         return "sqlite:///./usina_cliente.db"
 
-def create_database_engine():
+def get_async_database_url(database_url: str) -> str:
+    """
+    Converte a URL síncrona para o driver assíncrono equivalente:
+    asyncpg (PostgreSQL) ou aiosqlite (SQLite)
+    """
+    if database_url.startswith("sqlite:"):
+        return database_url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    
+    for prefixo in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if database_url.startswith(prefixo):
+            database_url = "postgresql+asyncpg://" + database_url[len(prefixo):]
+            break
+    
+    # asyncpg usa "ssl" no lugar de "sslmode"
+    return database_url.replace("sslmode=", "ssl=")
+
+def create_async_database_engine(
+    database_url: Optional[str] = None,
+    nome: str = "primario_async",
+    somente_leitura: bool = False
+):
+    """Cria o engine assíncrono com a mesma política de pool do engine síncrono"""
+    try:
+        database_url = get_async_database_url(database_url or get_database_url())
+        config = aplicar_opcoes_pooler(settings.get_database_config())
+        
+        connect_args = {}
+        if config.get("pooler"):
+            # Modo transação: sem cache de prepared statements no servidor e
+            # nomes únicos, pois cada transação pode cair em outra conexão
+            connect_args = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            }
+        
+        if config["type"] == "postgresql" and config["pool_class"] == "NullPool":
+            async_engine = create_async_engine(
+                database_url,
+                poolclass=NullPoolMedido,
+                pool_logging_name=nome,
+                echo=settings.DEBUG
+            )
+        elif config["type"] == "postgresql":
+            async_engine = create_async_engine(
+                database_url,
+                poolclass=AsyncQueuePoolMedido,
+                pool_size=config.get("pool_size", 5),
+                max_overflow=config.get("max_overflow", 10),
+                pool_timeout=config.get("pool_timeout", 30),
+                pool_pre_ping=config.get("pool_pre_ping", True),
+                pool_recycle=config.get("pool_recycle", 3600),
+                pool_reset_on_return="rollback",
+                pool_logging_name=nome,
+                connect_args=connect_args,
+                echo=settings.DEBUG
+            )
+        elif config.get("modo") == "wal":
+            tamanho = config["pool_leitura"] if somente_leitura else config["pool_escrita"]
+            async_engine = create_async_engine(
+                database_url,
+                poolclass=AsyncQueuePoolMedido,
+                pool_size=tamanho,
+                max_overflow=tamanho if somente_leitura else 0,
+                pool_timeout=config.get("pool_timeout", 30),
+                pool_logging_name=nome,
+                echo=settings.DEBUG
+            )
+            configurar_sqlite(async_engine.sync_engine, config["pragmas"], somente_leitura)
+        else:
+            async_engine = create_async_engine(
+                database_url,
+                poolclass=AsyncQueuePoolMedido,
+                pool_logging_name=nome,
+                echo=settings.DEBUG
+            )
+        
+        instrumentar_engine(async_engine.sync_engine, nome)
+        return async_engine
+    except ImportError as e:
+        print(f"❌ Driver assíncrono não instalado (asyncpg/aiosqlite): {e}")
+        raise
+
+def create_database_engine(
+    database_url: Optional[str] = None,
+    nome: str = "primario",
+    somente_leitura: bool = False
+):
     """Cria o engine do banco baseado na configuração"""
     try:
-        database_url = get_database_url()
-        config = settings.get_database_config()
+        database_url = database_url or get_database_url()
+        config = aplicar_opcoes_pooler(settings.get_database_config())
         
-        print(f"🔧 Criando engine para: {config['type']}")
+        print(f"🔧 Criando engine para: {config['type']}{' via pooler externo' if config.get('pooler') else ''}")
         print(f"📡 URL: {database_url.replace(database_url.split('@')[0].split(':')[-1], '***') if '@' in database_url else database_url}")
         
         if config["type"] == "postgresql":
@@ -79,29 +284,55 @@ def create_database_engine():
             if config["pool_class"] == "NullPool":
                 engine = create_engine(
                     database_url,
-                    poolclass=NullPool,
+                    poolclass=NullPoolMedido,
+                    pool_logging_name=nome,
                     echo=settings.DEBUG,
                     # NullPool não suporta connect_args
                 )
             else:
+                # Com pooler externo, o rollback na devolução limpa o estado da
+                # transação; nenhum SET de sessão é usado pela aplicação
                 engine = create_engine(
                     database_url,
-                    poolclass=QueuePool,
+                    poolclass=QueuePoolMedido,
                     pool_size=config.get("pool_size", 5),
                     max_overflow=config.get("max_overflow", 10),
+                    pool_timeout=config.get("pool_timeout", 30),
+                    pool_logging_name=nome,
                     pool_pre_ping=config.get("pool_pre_ping", True),
                     pool_recycle=config.get("pool_recycle", 3600),
+                    pool_reset_on_return="rollback",
                     echo=settings.DEBUG,
-                    **config.get("connect_args", {})
+                    connect_args=config.get("connect_args", {})
                 )
+        elif config.get("modo") == "wal":
+            # SQLite ajustado: escritas serializadas na fila do pool de
+            # escrita (SQLITE_WRITE_POOL_SIZE, uma conexão por padrão; quem
+            # faz I/O de rede libera a sessão antes) e um pool separado,
+            # somente leitura, para consultas
+            tamanho = config["pool_leitura"] if somente_leitura else config["pool_escrita"]
+            engine = create_engine(
+                database_url,
+                poolclass=QueuePoolMedido,
+                pool_size=tamanho,
+                max_overflow=tamanho if somente_leitura else 0,
+                pool_timeout=config.get("pool_timeout", 30),
+                pool_logging_name=nome,
+                echo=settings.DEBUG,
+                connect_args=config.get("connect_args", {})
+            )
+            configurar_sqlite(engine, config["pragmas"], somente_leitura)
         else:
             # SQLite (desenvolvimento local)
             engine = create_engine(
                 database_url,
-                echo=settings.DEBUG
-                # SQLite não suporta connect_args complexos
+                poolclass=QueuePoolMedido,
+                pool_logging_name=nome,
+                echo=settings.DEBUG,
+                connect_args=config.get("connect_args", {})
             )
         
+        instrumentar_engine(engine, nome)
         print(f"✅ Engine criado com sucesso para {config['type']}")
         return engine
         
@@ -116,16 +347,433 @@ engine = create_database_engine()
 # Cria a sessão
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def usa_sqlite_wal() -> bool:
+    """Indica se o SQLite está no modo ajustado (WAL, pools de escrita e de leitura)"""
+    config = settings.get_database_config()
+    return config["type"] == "sqlite" and config.get("modo") == "wal"
+
+# Engine de leitura padrão: pool próprio no SQLite ajustado (leitores do WAL
+# enxergam os commits na hora), o próprio primário nos demais casos
+engine_leitura = create_database_engine(nome="leitura", somente_leitura=True) if usa_sqlite_wal() else engine
+
+# Atraso de replicação em segundos (0 quando a réplica já aplicou tudo que recebeu)
+# Sem linha em pg_stat_wal_receiver a réplica não está recebendo WAL do
+# primário (desconectada): receive e replay ficam iguais e pareceriam em dia,
+# então o atraso é NULL (tratado como infinito)
+CONSULTA_ATRASO_REPLICA = text("""
+    SELECT CASE
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+# Leitura após escrita por cliente: o instante (epoch) da última escrita do
+# cliente, recebido no cookie ou no cabeçalho, e o da escrita feita na
+# requisição corrente
+COOKIE_ULTIMA_ESCRITA = "ultima_escrita"
+CABECALHO_ULTIMA_ESCRITA = "X-Ultima-Escrita"
+_escritas_requisicao: ContextVar[Optional[Dict[str, float]]] = ContextVar("escritas_requisicao", default=None)
+
+class ReplicaRouter:
+    """
+    Escolhe o engine de leitura: réplicas em round-robin, com volta ao
+    primário quando a réplica está atrasada, desconectada, indisponível ou
+    quando o próprio cliente escreveu há menos de `max_atraso` segundos
+    (leitura após escrita). O instante da escrita viaja com o cliente em um
+    cookie (ou no cabeçalho X-Ultima-Escrita), então só quem escreveu lê do
+    primário, em qualquer instância.
+    """
+    
+    def __init__(self, urls: List[str], max_atraso: float, intervalo_verificacao: float = 5.0):
+        self.urls = [clean_database_url(url) for url in urls]
+        self.max_atraso = max_atraso
+        self.intervalo_verificacao = intervalo_verificacao
+        self.engines = [
+            create_database_engine(url, nome=f"replica_{indice}")
+            for indice, url in enumerate(self.urls)
+        ]
+        self._async_engines = None
+        self._contador = itertools.count()
+        self._atrasos: Dict[int, Tuple[float, float]] = {}  # índice -> (verificado_em, atraso)
+    
+    def iniciar_requisicao(self, ultima_escrita: Optional[str]) -> Token:
+        """Abre o contexto da requisição com a última escrita informada pelo cliente"""
+        try:
+            cliente = float(ultima_escrita) if ultima_escrita else 0.0
+        except ValueError:
+            cliente = 0.0
+        return _escritas_requisicao.set({"cliente": cliente, "requisicao": 0.0})
+    
+    def encerrar_requisicao(self, token: Token) -> Optional[float]:
+        """Fecha o contexto; retorna o instante da escrita feita na requisição, se houve"""
+        escritas = _escritas_requisicao.get()
+        _escritas_requisicao.reset(token)
+        return (escritas or {}).get("requisicao") or None
+    
+    def registrar_escrita(self, *args) -> None:
+        """
+        Marca uma escrita no primário na requisição corrente (listener de
+        commit). Commits fora de requisições (workers, agendador) são ignorados.
+        """
+        escritas = _escritas_requisicao.get()
+        if escritas is not None:
+            escritas["requisicao"] = time.time()
+    
+    def _escrita_recente(self) -> bool:
+        escritas = _escritas_requisicao.get()
+        if escritas is None:
+            return False
+        return time.time() - max(escritas["cliente"], escritas["requisicao"]) < self.max_atraso
+    
+    def _candidatos(self) -> List[int]:
+        """Réplicas na ordem de tentativa; vazio quando a leitura deve ir ao primário"""
+        if not self.engines:
+            return []
+        if self._escrita_recente():
+            return []
+        inicio = next(self._contador)
+        return [(inicio + deslocamento) % len(self.engines) for deslocamento in range(len(self.engines))]
+    
+    def _atraso_em_cache(self, indice: int) -> Optional[float]:
+        verificado_em, atraso = self._atrasos.get(indice, (0.0, 0.0))
+        if time.monotonic() - verificado_em < self.intervalo_verificacao:
+            return atraso
+        return None
+    
+    def _registrar_atraso(self, indice: int, atraso: Optional[float]) -> float:
+        if atraso is None:
+            print(f"⚠️ Réplica {indice} sem conexão com o primário, usando o primário")
+            atraso = float("inf")
+        atraso = float(atraso)  # EXTRACT devolve numeric
+        self._atrasos[indice] = (time.monotonic(), atraso)
+        if self.max_atraso < atraso < float("inf"):
+            print(f"⚠️ Réplica {indice} atrasada ({atraso:.1f}s), usando o primário")
+        return atraso
+    
+    def escolher_engine(self):
+        """Retorna o engine síncrono de leitura"""
+        for indice in self._candidatos():
+            atraso = self._atraso_em_cache(indice)
+            if atraso is None:
+                try:
+                    with self.engines[indice].connect() as connection:
+                        atraso = connection.execute(CONSULTA_ATRASO_REPLICA).scalar()
+                except Exception as e:
+                    print(f"⚠️ Réplica {indice} indisponível: {e}")
+                    atraso = float("inf")
+                atraso = self._registrar_atraso(indice, atraso)
+            if atraso <= self.max_atraso:
+                return self.engines[indice]
+        return engine_leitura
+    
+    async def escolher_async_engine(self):
+        """Retorna o engine assíncrono de leitura"""
+        candidatos = self._candidatos()
+        if candidatos and self._async_engines is None:
+            self._async_engines = [
+                create_async_database_engine(url, nome=f"replica_{indice}_async")
+                for indice, url in enumerate(self.urls)
+            ]
+        
+        for indice in candidatos:
+            atraso = self._atraso_em_cache(indice)
+            if atraso is None:
+                try:
+                    async with self._async_engines[indice].connect() as connection:
+                        atraso = (await connection.execute(CONSULTA_ATRASO_REPLICA)).scalar()
+                except Exception as e:
+                    print(f"⚠️ Réplica {indice} indisponível: {e}")
+                    atraso = float("inf")
+                atraso = self._registrar_atraso(indice, atraso)
+            if atraso <= self.max_atraso:
+                return self._async_engines[indice]
+        
+        get_async_sessionmaker()
+        return async_engine_leitura
+
+# Réplicas só se aplicam ao PostgreSQL
+replica_router = ReplicaRouter(
+    settings.DATABASE_REPLICA_URLS if settings.get_database_config()["type"] == "postgresql" else [],
+    settings.REPLICA_MAX_LAG_SECONDS
+)
+event.listen(engine, "commit", replica_router.registrar_escrita)
+
+def proxima_competencia(competencia: date) -> date:
+    """Retorna o primeiro dia do mês seguinte à competência"""
+    if competencia.month == 12:
+        return date(competencia.year + 1, 1, 1)
+    return date(competencia.year, competencia.month + 1, 1)
+
+def criar_particao_historico(connection, competencia: date) -> None:
+    """
+    Cria (se necessário) a partição mensal de faturas_historico no PostgreSQL.
+    No SQLite a tabela não é particionada e nada é feito.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    
+    inicio = competencia.replace(day=1)
+    fim = proxima_competencia(inicio)
+    nome = f"faturas_historico_{inicio:%Y_%m}"
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {nome} PARTITION OF faturas_historico "
+        f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')"
+    ))
+
+def migrar_schema_normalizado() -> dict:
+    """
+    Migra bases existentes para o schema normalizado (clientes / instalacoes / faturas).
+    Usa operações em lote (INSERT ... SELECT e UPDATE com subconsulta) e pode
+    ser executada mais de uma vez sem efeitos colaterais.
+    
+    Returns:
+        Número de linhas afetadas em cada etapa
+    """
+    with engine.begin() as connection:
+        # Inspeciona pela mesma conexão: uma segunda conexão de escrita no
+        # SQLite esperaria pelo lock desta transação
+        inspector = inspect(connection)
+        
+        # Chave estrangeira para instalacoes nas tabelas de faturas
+        for tabela in ("faturas", "faturas_historico"):
+            colunas = {coluna["name"] for coluna in inspector.get_columns(tabela)}
+            if "instalacao_id" not in colunas:
+                connection.execute(text(
+                    f"ALTER TABLE {tabela} ADD COLUMN instalacao_id INTEGER REFERENCES instalacoes(id)"
+                ))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{tabela}_instalacao_id ON {tabela} (instalacao_id)"
+            ))
+        
+        # Emails restantes do job de ingestão com prazo
+        if "restantes" not in {coluna["name"] for coluna in inspector.get_columns("jobs_ingestao")}:
+            connection.execute(text("ALTER TABLE jobs_ingestao ADD COLUMN restantes INTEGER"))
+        
+        # Conteúdo do PDF na fila de falhas de extração
+        if "conteudo_pdf" not in {coluna["name"] for coluna in inspector.get_columns("falhas_extracao")}:
+            tipo = LargeBinary().compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE falhas_extracao ADD COLUMN conteudo_pdf {tipo}"))
+        
+        # Versão das faturas (ETag)
+        if "versao" not in {coluna["name"] for coluna in inspector.get_columns("faturas")}:
+            connection.execute(text("ALTER TABLE faturas ADD COLUMN versao INTEGER NOT NULL DEFAULT 1"))
+        
+        # Reivindicação dos eventos do Stripe pelo processador
+        if "reivindicado_em" not in {coluna["name"] for coluna in inspector.get_columns("stripe_eventos")}:
+            connection.execute(text("ALTER TABLE stripe_eventos ADD COLUMN reivindicado_em TIMESTAMP"))
+        
+        # documento_cliente deixa de ser único (um cliente, várias instalações)
+        indices = {indice["name"]: indice for indice in inspector.get_indexes("faturas")}
+        indice_documento = indices.get("ix_faturas_documento_cliente")
+        if indice_documento and indice_documento.get("unique"):
+            connection.execute(text("DROP INDEX ix_faturas_documento_cliente"))
+            connection.execute(text(
+                "CREATE INDEX ix_faturas_documento_cliente ON faturas (documento_cliente)"
+            ))
+        
+        clientes = connection.execute(text("""
+            INSERT INTO clientes (documento, nome, email, data_criacao, data_ultima_atualizacao)
+            SELECT f.documento_cliente, MAX(f.nome_cliente), MAX(f.email_cliente),
+                   CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            FROM faturas f
+            WHERE NOT EXISTS (SELECT 1 FROM clientes c WHERE c.documento = f.documento_cliente)
+            GROUP BY f.documento_cliente
+        """)).rowcount
+        
+        instalacoes = connection.execute(text("""
+            INSERT INTO instalacoes (numero, cliente_id, data_criacao)
+            SELECT f.numero_instalacao, MIN(c.id), CURRENT_TIMESTAMP
+            FROM faturas f
+            JOIN clientes c ON c.documento = f.documento_cliente
+            WHERE NOT EXISTS (SELECT 1 FROM instalacoes i WHERE i.numero = f.numero_instalacao)
+            GROUP BY f.numero_instalacao
+        """)).rowcount
+        
+        vinculadas = {}
+        for tabela in ("faturas", "faturas_historico"):
+            vinculadas[tabela] = connection.execute(text(f"""
+                UPDATE {tabela}
+                SET instalacao_id = (
+                    SELECT i.id FROM instalacoes i WHERE i.numero = {tabela}.numero_instalacao
+                )
+                WHERE instalacao_id IS NULL
+            """)).rowcount
+    
+    resultado = {
+        "clientes_criados": clientes,
+        "instalacoes_criadas": instalacoes,
+        "faturas_vinculadas": vinculadas["faturas"],
+        "historico_vinculado": vinculadas["faturas_historico"]
+    }
+    print(f"✅ Schema normalizado: {resultado}")
+    return resultado
+
+# Engine assíncrono criado sob demanda (o driver só é exigido por quem o usa)
+async_engine = None
+async_engine_leitura = None
+AsyncSessionLocal = None
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    """Retorna a fábrica de sessões assíncronas, criando o engine na primeira chamada"""
+    global async_engine, async_engine_leitura, AsyncSessionLocal
+    if AsyncSessionLocal is None:
+        async_engine = create_async_database_engine()
+        async_engine_leitura = (
+            create_async_database_engine(nome="leitura_async", somente_leitura=True)
+            if usa_sqlite_wal() else async_engine
+        )
+        AsyncSessionLocal = async_sessionmaker(
+            bind=async_engine,
+            autoflush=False,
+            expire_on_commit=False
+        )
+        event.listen(async_engine.sync_engine, "commit", replica_router.registrar_escrita)
+    return AsyncSessionLocal
+
 def create_tables():
     """Cria todas as tabelas no banco de dados"""
     try:
         Base.metadata.create_all(bind=engine)
+        
+        # Garante as partições do mês corrente e do próximo
+        competencia_atual = date.today().replace(day=1)
+        with engine.begin() as connection:
+            criar_particao_historico(connection, competencia_atual)
+            criar_particao_historico(connection, proxima_competencia(competencia_atual))
+        
+        # Atualiza bases criadas antes da normalização
+        migrar_schema_normalizado()
+        
         print("✅ Tabelas criadas com sucesso")
         return True
     except Exception as e:
         print(f"❌ Erro ao criar tabelas: {e}")
         return False
 
+def _insert_trava(connection):
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(Trava.__table__)
+
+def _relogio_banco(connection, segundos: float = 0):
+    """
+    Agora (UTC) mais `segundos` pelo relógio do banco: todas as instâncias
+    comparam a expiração das travas com o mesmo relógio
+    """
+    if connection.dialect.name == "postgresql":
+        return func.timezone("utc", func.now(), type_=DateTime) + timedelta(seconds=segundos)
+    return func.strftime("%Y-%m-%d %H:%M:%f", "now", f"{segundos:+f} seconds")
+
+class TravaPerdida(RuntimeError):
+    """A trava expirou e foi obtida por outra instância enquanto o bloco rodava"""
+
+class Arrendamento:
+    """
+    Trava obtida (ou não) por trava_exclusiva. Verdadeiro se obtida; o evento
+    `perdida` é sinalizado se a renovação descobre que outra instância a tomou.
+    """
+
+    def __init__(self, nome: str, obtida: bool):
+        self.nome = nome
+        self.obtida = obtida
+        self.perdida = threading.Event()
+
+    def __bool__(self) -> bool:
+        return self.obtida
+
+# Travas mantidas pelo contexto corrente (thread ou tarefa), para verificar_travas
+_travas_mantidas: ContextVar[Tuple[Arrendamento, ...]] = ContextVar("travas_mantidas", default=())
+
+def verificar_travas() -> None:
+    """
+    Chamada entre os passos de um trabalho feito sob trava_exclusiva.
+
+    Raises:
+        TravaPerdida: alguma trava mantida neste contexto foi perdida
+    """
+    for arrendamento in _travas_mantidas.get():
+        if arrendamento.perdida.is_set():
+            raise TravaPerdida(f"Trava '{arrendamento.nome}' perdida para outra instância; trabalho interrompido")
+
+def _renovar_trava(arrendamento: Arrendamento, dono: str, duracao: float, parar: threading.Event) -> None:
+    """Estende a expiração da trava a cada terço da duração, até `parar`"""
+    tabela = Trava.__table__
+    while not parar.wait(duracao / 3):
+        try:
+            with engine.begin() as connection:
+                renovada = connection.execute(
+                    tabela.update()
+                    .where(tabela.c.nome == arrendamento.nome, tabela.c.dono == dono)
+                    .values(expira_em=_relogio_banco(connection, duracao))
+                ).rowcount
+            if not renovada:
+                print(f"⚠️ Trava '{arrendamento.nome}' perdida (expirou e foi obtida por outra instância)")
+                arrendamento.perdida.set()
+                return
+        except Exception as e:
+            # A próxima renovação tenta de novo; a trava só se perde se expirar
+            print(f"⚠️ Erro ao renovar a trava '{arrendamento.nome}': {e}")
+
+@contextmanager
+def trava_exclusiva(nome: str, duracao: Optional[float] = None) -> Iterator[Arrendamento]:
+    """
+    Trava entre processos e instâncias, sem espera: produz um Arrendamento,
+    verdadeiro se a trava foi obtida (e é mantida até o fim do bloco) ou
+    falso se outra instância a detém.
+    
+    É um arrendamento na tabela travas: uma linha com o dono e a expiração,
+    obtida por um upsert condicional (só substitui a linha vencida). Cada
+    operação é uma transação curta, então nenhuma conexão do pool fica presa
+    durante o trabalho (o que vale também atrás do PgBouncer em modo
+    transação); uma thread renova a expiração enquanto o bloco roda e, se o
+    processo morrer, a trava se libera sozinha após `duracao` segundos. A
+    expiração usa o relógio do banco, não o de cada instância.
+    
+    Se a renovação falhar por tempo demais, outra instância pode tomar a
+    trava: o bloco deve chamar verificar_travas entre seus passos. No SQLite,
+    com uma conexão de escrita, quem chama não deve manter uma transação
+    aberta na sessão ao obter a trava nem durante o bloco (a renovação usa a
+    mesma conexão).
+    """
+    duracao = duracao or settings.LOCK_LEASE_SECONDS
+    dono = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex}"
+    tabela = Trava.__table__
+    with engine.begin() as connection:
+        stmt = _insert_trava(connection).values(
+            nome=nome, dono=dono, expira_em=_relogio_banco(connection, duracao)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["nome"],
+            set_={"dono": stmt.excluded.dono, "expira_em": stmt.excluded.expira_em},
+            where=tabela.c.expira_em < _relogio_banco(connection)
+        )
+        obtida = connection.execute(stmt.returning(tabela.c.dono)).scalar() == dono
+    arrendamento = Arrendamento(nome, obtida)
+    if not obtida:
+        yield arrendamento
+        return
+    
+    parar = threading.Event()
+    renovacao = threading.Thread(
+        target=_renovar_trava, args=(arrendamento, dono, duracao, parar), name=f"trava-{nome}", daemon=True
+    )
+    renovacao.start()
+    token = _travas_mantidas.set(_travas_mantidas.get() + (arrendamento,))
+    try:
+        yield arrendamento
+    finally:
+        _travas_mantidas.reset(token)
+        parar.set()
+        renovacao.join()
+        try:
+            with engine.begin() as connection:
+                connection.execute(tabela.delete().where(tabela.c.nome == nome, tabela.c.dono == dono))
+        except Exception as e:
+            print(f"⚠️ Erro ao liberar a trava '{nome}' (expira sozinha): {e}")
+
 def get_db() -> Generator:
     """Dependência para obter sessão do banco"""
     db = SessionLocal()
@@ -134,6 +782,47 @@ def get_db() -> Generator:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Dependência para obter sessão assíncrona do banco"""
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+def get_read_db() -> Generator:
+    """Dependência para obter sessão de leitura (réplica, quando disponível)"""
+    db = SessionLocal(bind=replica_router.escolher_engine())
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def criar_sessao_async_leitura() -> AsyncSession:
+    """Sessão assíncrona de leitura (réplica, quando disponível), fora de uma requisição"""
+    return get_async_sessionmaker()(bind=await replica_router.escolher_async_engine())
+
+async def get_async_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """Dependência para obter sessão assíncrona de leitura (réplica, quando disponível)"""
+    async with await criar_sessao_async_leitura() as db:
+        yield db
+
+def get_pool_metrics() -> dict:
+    """Métricas de todos os pools do processo e o dimensionamento em uso"""
+    pools = {"primario": relatorio_pool(engine, "primario")}
+    if engine_leitura is not engine:
+        pools["leitura"] = relatorio_pool(engine_leitura, "leitura")
+    if async_engine is not None:
+        pools["primario_async"] = relatorio_pool(async_engine.sync_engine, "primario_async")
+    if async_engine_leitura is not None and async_engine_leitura is not async_engine:
+        pools["leitura_async"] = relatorio_pool(async_engine_leitura.sync_engine, "leitura_async")
+    for indice, replica in enumerate(replica_router.engines):
+        pools[f"replica_{indice}"] = relatorio_pool(replica, f"replica_{indice}")
+    for indice, replica in enumerate(replica_router._async_engines or []):
+        pools[f"replica_{indice}_async"] = relatorio_pool(replica.sync_engine, f"replica_{indice}_async")
+    
+    return {
+        "dimensionamento": settings.get_pool_sizing(),
+        "pools": pools
+    }
+
 def test_connection() -> bool:
     """Testa a conexão com o banco de dados"""
     try:
@@ -1,27 +1,12 @@
 # Configuração de banco de dados local (SQLite)
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+# O engine é criado em database.py, que aplica o modo SQLite ajustado
+# (WAL, pools de escrita e de leitura); este módulo só o reexporta.
+try:
+    from .database import SessionLocal, create_tables, engine, engine_leitura, get_db, get_read_db
+    from .models import Base
+except ImportError:
+    from database import SessionLocal, create_tables, engine, engine_leitura, get_db, get_read_db
+    from models import Base
 
 # Para desenvolvimento local
 DATABASE_URL = "sqlite:///./usina_cliente.db"
-
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Necessário para SQLite
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base = declarative_base()
-
-def create_tables():
-    """Cria todas as tabelas no banco de dados"""
-    Base.metadata.create_all(bind=engine)
-
-def get_db():
-    """Dependência para obter sessão do banco"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close() 
\ No newline at end of file
@@ -0,0 +1,465 @@
+"""
+Ingestão de faturas por email para o Sistema de Gestão de Faturas
+Busca as faturas nos emails (bot_mail) e grava no banco. Roda a partir da fila
+jobs_ingestao: o endpoint só enfileira e os workers executam, seja em threads
+do processo da API (INGESTION_WORKERS) ou em processos separados:
+
+    python -m backend.ingestao [--uma-vez]
+"""
+
+import argparse
+import imaplib
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+# Importações com fallback para Vercel
+try:
+    from .config import settings
+    from . import crud
+    from .database import SessionLocal, TravaPerdida, trava_exclusiva, verificar_travas
+    from .metricas import Contadores, Histograma
+    from .utils import bot_mail
+except ImportError:
+    from config import settings
+    import crud
+    from database import SessionLocal, TravaPerdida, trava_exclusiva, verificar_travas
+    from metricas import Contadores, Histograma
+    from utils import bot_mail
+
+# Recebe (faturas encontradas, faturas salvas)
+Progresso = Callable[[int, int], None]
+
+# Trava da caixa de email: uma varredura por vez entre todas as instâncias
+TRAVA_INGESTAO = "ingestao_emails"
+
+# Checkpoint da varredura (tabela checkpoints): UIDVALIDITY, último email
+# concluído e o email/anexo em andamento
+CHECKPOINT_INGESTAO = "ingestao_emails"
+
+# Erros de conexão com o servidor IMAP: interrompem a varredura sem avançar o
+# checkpoint (os demais erros ao ler um email só fazem pular aquele email)
+ERROS_CONEXAO_IMAP = (imaplib.IMAP4.abort, OSError)
+
+# Folga mínima antes do prazo (segundos), além do passo mais demorado observado
+MARGEM_MINIMA_SEGUNDOS = 1.0
+
+# Tempo com a trava (ms; uma varredura pode levar minutos) e disputas perdidas
+METRICAS_TRAVA = {
+    "retencao_ms": Histograma((100, 500, 1000, 5000, 10000, 30000, 60000, 120000, 300000, 600000)),
+    "contadores": Contadores("obtida", "ocupada")
+}
+
+def proxima_tentativa_extracao(tentativas: int, agora: Optional[datetime] = None) -> datetime:
+    """
+    Quando tentar de novo um PDF que falhou `tentativas` vezes: espera
+    exponencial a partir de EXTRACTION_RETRY_BASE_SECONDS, limitada a
+    EXTRACTION_RETRY_MAX_SECONDS (UTC, sem fuso, como as demais colunas)
+    """
+    agora = agora or datetime.now(timezone.utc).replace(tzinfo=None)
+    espera = min(
+        settings.EXTRACTION_RETRY_BASE_SECONDS * 2 ** max(tentativas - 1, 0),
+        settings.EXTRACTION_RETRY_MAX_SECONDS
+    )
+    return agora + timedelta(seconds=espera)
+
+def registrar_falha_extracao(db: Session, erro: bot_mail.ErroExtracao) -> None:
+    """Coloca o PDF na fila de falhas de extração (sem commit)"""
+    print(f"⚠️ {erro}; PDF enviado para a fila de reprocessamento")
+    crud.FaturaCRUD.registrar_falha_extracao(db, {
+        "hash_pdf": erro.hash_pdf,
+        "nome_arquivo": erro.nome,
+        "caminho_pdf": erro.caminho_pdf,
+        "conteudo_pdf": erro.conteudo,
+        "classe_erro": erro.classe_erro,
+        "mensagem": str(erro.causa or erro),
+        "proxima_tentativa_em": proxima_tentativa_extracao(1)
+    })
+
+def salvar_faturas(
+    db: Session,
+    dados_emails: List[Dict[str, Any]],
+    progresso: Optional[Progresso] = None,
+    commit: bool = True
+) -> int:
+    """
+    Grava as faturas extraídas dos emails: vincula cliente e instalação,
+    preserva o mês no histórico e cria ou atualiza a fatura corrente.
+
+    Com `commit=True` cada fatura é confirmada em separado e uma que falha é
+    desfeita e pulada. Com `commit=False` nada é confirmado e o primeiro erro
+    é propagado: o chamador decide o commit ou o rollback da transação.
+
+    Returns:
+        Número de faturas salvas
+    """
+    faturas_salvas = 0
+    for fatura_data in dados_emails:
+        try:
+            print(f"💾 Salvando fatura: {fatura_data.get('nome_cliente', 'N/A')}")
+
+            # Verifica se a fatura já existe
+            fatura_existente = crud.get_fatura_by_instalacao(db, fatura_data["numero_instalacao"])
+
+            # Vincula a fatura ao cliente e à instalação normalizados
+            instalacao_id = crud.garantir_cliente_instalacao(db, fatura_data)
+            if instalacao_id:
+                fatura_data["instalacao_id"] = instalacao_id
+
+            # Preserva o mês no histórico antes de sobrescrever a fatura corrente
+            competencia = crud.registrar_historico(db, fatura_data)
+            if not competencia:
+                print(f"⚠️ Mês de referência inválido, histórico não gravado: {fatura_data.get('mes_referencia')}")
+
+            if fatura_existente:
+                # Atualiza fatura existente (e invalida o cache)
+                crud.update_fatura(db, fatura_existente, fatura_data, commit=commit)
+                print(f"✅ Fatura atualizada: {fatura_data['nome_cliente']} (Instalação: {fatura_data['numero_instalacao']})")
+            else:
+                # Cria nova fatura
+                crud.create_fatura(db, fatura_data, commit=commit)
+                if commit:
+                    db.commit()
+                print(f"✅ Nova fatura criada: {fatura_data['nome_cliente']} (Instalação: {fatura_data['numero_instalacao']})")
+            faturas_salvas += 1
+
+        except Exception as e:
+            print(f"❌ Erro ao processar fatura {fatura_data.get('numero_instalacao', 'N/A')}: {e}")
+            if not commit:
+                raise
+            db.rollback()
+            continue
+
+        if progresso is not None:
+            progresso(len(dados_emails), faturas_salvas)
+
+    return faturas_salvas
+
+def _resultado_erro(mensagem: str) -> Dict[str, Any]:
+    print(f"❌ {mensagem}")
+    return {"status": "error", "faturas_processadas": 0, "message": mensagem}
+
+def executar_ingestao(
+    db: Session,
+    progresso: Optional[Progresso] = None,
+    prazo_segundos: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Busca as faturas nos emails e grava no banco, retomando do checkpoint.
+
+    Os emails são lidos em ordem de UID a partir do último processado; sem
+    checkpoint, os últimos INGESTION_INITIAL_EMAILS. Depois de cada anexo
+    (fatura gravada) o checkpoint registra o email e o anexo seguinte, então
+    uma interrupção perde no máximo o anexo em andamento, que é refeito na
+    próxima execução. Com `prazo_segundos`, para antes do prazo, deixando
+    folga para o passo mais demorado já observado, e informa em `remaining`
+    quantos emails ficaram para a próxima execução.
+
+    Um email que não pode ser lido (resposta malformada, conteúdo que não
+    decodifica) é pulado e listado em `ignorados`; só a perda da conexão
+    interrompe a varredura. Se a trava da caixa for perdida para outra
+    instância, a varredura para no próximo email ou anexo.
+
+    Returns:
+        status ('success' ou 'error'), faturas_processadas, faturas_salvas,
+        remaining, ignorados e message
+    """
+    try:
+        print("🚀 Iniciando processamento de emails...")
+
+        # Valida configurações básicas
+        if not settings.EMAIL_USER or not settings.EMAIL_PASS:
+            return _resultado_erro("Credenciais de email não configuradas")
+
+        print(f"🔧 Configurações válidas:")
+        print(f"   - EMAIL_USER: {settings.EMAIL_USER}")
+        print(f"   - EMAIL_HOST: {settings.EMAIL_HOST}")
+        print(f"   - EMAIL_PORT: {settings.EMAIL_PORT}")
+        print(f"   - EMAIL_PASS: {'***CONFIGURADO***' if settings.EMAIL_PASS else 'NÃO CONFIGURADO'}")
+
+        prazo = time.monotonic() + prazo_segundos if prazo_segundos else None
+        mail = bot_mail.conectar_email()
+        if not mail:
+            return _resultado_erro("Falha na conexão com o servidor de email")
+    except Exception as e:
+        traceback.print_exc()
+        return _resultado_erro(f"Erro no processamento: {str(e)}")
+
+    encontradas = salvas = 0
+    restantes = 0
+    ignorados: List[int] = []
+    try:
+        validade = bot_mail.obter_uidvalidity(mail)
+        estado = crud.FaturaCRUD.get_checkpoint(db, CHECKPOINT_INGESTAO) or {}
+        db.commit()  # não segura a conexão durante o IMAP
+        if estado.get("uidvalidity") != validade:
+            if estado:
+                print("⚠️ UIDVALIDITY da caixa de entrada mudou; checkpoint descartado")
+            estado = {"uidvalidity": validade, "ultimo_uid": None, "em_andamento": None}
+        em_andamento = estado.get("em_andamento") or {}
+
+        uids = bot_mail.listar_uids(mail, estado["ultimo_uid"], settings.INGESTION_INITIAL_EMAILS)
+        restantes = len(uids)
+        print(f"📋 {restantes} emails a processar" + (f" (após o UID {estado['ultimo_uid']})" if estado["ultimo_uid"] else ""))
+
+        # Retomando: o primeiro anexo pode ter sido salvo em disco sem ter sido gravado no banco
+        reprocessar = bool(estado["ultimo_uid"] or em_andamento)
+        maior_passo = MARGEM_MINIMA_SEGUNDOS
+
+        def salvar_posicao() -> None:
+            crud.FaturaCRUD.salvar_checkpoint(db, CHECKPOINT_INGESTAO, estado)
+            db.commit()
+
+        for uid in uids:
+            # Outra instância tomou a trava: interrompe, ela continua do checkpoint
+            verificar_travas()
+            if prazo is not None and time.monotonic() + maior_passo > prazo:
+                break
+            inicio_passo = time.monotonic()
+            try:
+                anexos = bot_mail.anexos_pdf(mail, uid)
+            except ERROS_CONEXAO_IMAP:
+                raise  # conexão perdida: a próxima execução retoma deste email
+            except Exception as e:
+                # Email malformado: registra e segue, senão a ingestão pararia nele para sempre
+                print(f"⚠️ Email UID {uid} ignorado: {type(e).__name__}: {e}")
+                traceback.print_exc()
+                ignorados.append(uid)
+                estado.update(ultimo_uid=uid, em_andamento=None)
+                salvar_posicao()
+                restantes -= 1
+                continue
+            primeiro = em_andamento.get("anexo", 0) if em_andamento.get("uid") == uid else 0
+
+            interrompido = False
+            for indice in range(primeiro, len(anexos)):
+                verificar_travas()
+                if prazo is not None and time.monotonic() + maior_passo > prazo:
+                    interrompido = True
+                    break
+                nome, conteudo = anexos[indice]
+                try:
+                    dados = bot_mail.processar_anexo(nome, conteudo, reprocessar=reprocessar)
+                except bot_mail.ErroExtracao as e:
+                    # Gravada com o checkpoint: o anexo não volta a ser lido do email
+                    registrar_falha_extracao(db, e)
+                    dados = None
+                reprocessar = False
+                if dados:
+                    encontradas += 1
+                    salvas += salvar_faturas(db, [dados])
+                estado["em_andamento"] = {"uid": uid, "anexo": indice + 1}
+                salvar_posicao()
+                if progresso is not None:
+                    progresso(encontradas, salvas)
+                maior_passo = max(maior_passo, time.monotonic() - inicio_passo)
+                inicio_passo = time.monotonic()
+            if interrompido:
+                break
+
+            estado.update(ultimo_uid=uid, em_andamento=None)
+            salvar_posicao()
+            reprocessar = False
+            restantes -= 1
+            maior_passo = max(maior_passo, time.monotonic() - inicio_passo)
+            print("-" * 60)
+
+    except Exception as e:
+        print(f"❌ Erro no processamento: {str(e)}")
+        if not isinstance(e, TravaPerdida):
+            traceback.print_exc()
+        db.rollback()
+        return {
+            "status": "error",
+            "faturas_processadas": encontradas,
+            "faturas_salvas": salvas,
+            "remaining": restantes,
+            "message": f"Erro no processamento: {str(e)}"
+        }
+    finally:
+        bot_mail.desconectar_email(mail)
+
+    print("=" * 80)
+    print(f"🎯 PROCESSAMENTO FINALIZADO" + (f" (prazo atingido, {restantes} emails restantes)" if restantes else ""))
+    print(f"📊 Faturas encontradas: {encontradas}")
+    print(f"💾 Faturas salvas: {salvas}")
+    print("=" * 80)
+
+    if restantes:
+        mensagem = f"Processamento parcial: {encontradas} faturas encontradas, {salvas} salvas; {restantes} emails restantes"
+    elif encontradas:
+        mensagem = f"Processamento concluído: {encontradas} faturas encontradas, {salvas} salvas"
+    else:
+        mensagem = "Nenhum novo email com fatura encontrado"
+    if ignorados:
+        mensagem += f"; {len(ignorados)} emails ilegíveis ignorados (UIDs {', '.join(map(str, ignorados))})"
+    return {
+        "status": "success",
+        "faturas_processadas": encontradas,
+        "faturas_salvas": salvas,
+        "remaining": restantes,
+        "ignorados": ignorados,
+        "message": mensagem
+    }
+
+def processar_job(db: Session, job_id: int, prazo_segundos: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Executa um job já reivindicado, registrando progresso e resultado. Se o
+    prazo acabar antes de esvaziar a caixa, enfileira a continuação.
+    """
+    def progresso(encontradas: int, salvas: int) -> None:
+        crud.FaturaCRUD.atualizar_job_ingestao(db, job_id, faturas_encontradas=encontradas, faturas_salvas=salvas)
+
+    if prazo_segundos is None:
+        prazo_segundos = settings.INGESTION_TIME_BUDGET_SECONDS or None
+    resultado = executar_ingestao(db, progresso, prazo_segundos)
+    crud.FaturaCRUD.atualizar_job_ingestao(
+        db, job_id,
+        status="concluido" if resultado["status"] == "success" else "erro",
+        faturas_encontradas=resultado["faturas_processadas"],
+        faturas_salvas=resultado.get("faturas_salvas", 0),
+        restantes=resultado.get("remaining"),
+        mensagem=resultado["message"]
+    )
+    if resultado["status"] == "success" and resultado["remaining"]:
+        continuacao = crud.FaturaCRUD.enfileirar_job_ingestao(db)
+        print(f"📥 Continuação enfileirada (job {continuacao.id})")
+    return {"job_id": job_id, **resultado}
+
+def reivindicar_e_executar(nome: str, prazo_segundos: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Reivindica e executa o próximo job da fila (a trava já deve estar obtida).
+
+    Returns:
+        Resultado do job (com job_id) ou None se a fila estiver vazia
+    """
+    with SessionLocal() as db:
+        job_id = crud.FaturaCRUD.reivindicar_job_ingestao(
+            db, nome, settings.INGESTION_JOB_TIMEOUT_SECONDS, settings.INGESTION_MAX_ATTEMPTS
+        )
+        if job_id is None:
+            return None
+        print(f"📥 Job de ingestão {job_id} iniciado por {nome}")
+        return processar_job(db, job_id, prazo_segundos)
+
+def executar_com_trava(funcao: Callable[[], Any]) -> Tuple[bool, Any]:
+    """
+    Executa `funcao` com a trava da caixa de email, sem esperar por ela.
+
+    Returns:
+        (obtida, resultado); com a trava ocupada, (False, None)
+    """
+    with trava_exclusiva(TRAVA_INGESTAO) as obtida:
+        if not obtida:
+            METRICAS_TRAVA["contadores"].incrementar("ocupada")
+            return False, None
+        METRICAS_TRAVA["contadores"].incrementar("obtida")
+        inicio = time.perf_counter()
+        try:
+            return True, funcao()
+        finally:
+            METRICAS_TRAVA["retencao_ms"].observar((time.perf_counter() - inicio) * 1000)
+
+def executar_proximo_job(nome: str, prazo_segundos: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Executa o próximo job da fila com a trava da caixa de email.
+
+    Returns:
+        Resultado do job executado, ou None se a fila estava vazia ou outra
+        instância está processando emails (o job continua na fila)
+    """
+    with SessionLocal() as db:
+        if not crud.FaturaCRUD.existe_job_ingestao_disponivel(
+            db, settings.INGESTION_JOB_TIMEOUT_SECONDS, settings.INGESTION_MAX_ATTEMPTS
+        ):
+            return None
+    return executar_com_trava(lambda: reivindicar_e_executar(nome, prazo_segundos))[1]
+
+def nome_worker() -> str:
+    """Identificação do worker: host, processo e thread"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+def executar_worker(parar: threading.Event, sinal: Optional[threading.Event] = None, uma_vez: bool = False) -> int:
+    """
+    Consome a fila até `parar` ser sinalizado. Com a fila vazia, espera
+    INGESTION_POLL_SECONDS ou até `sinal` (novo job enfileirado neste processo).
+
+    Args:
+        parar: Evento de encerramento
+        sinal: Evento que acorda o worker antes do intervalo
+        uma_vez: Retorna assim que a fila estiver vazia
+
+    Returns:
+        Número de jobs processados
+    """
+    nome = nome_worker()
+    espera = sinal or parar
+    processados = 0
+    while not parar.is_set():
+        try:
+            if executar_proximo_job(nome) is not None:
+                processados += 1
+                continue
+        except Exception as e:
+            print(f"❌ Erro no worker de ingestão: {e}")
+        if uma_vez:
+            break
+        espera.wait(settings.INGESTION_POLL_SECONDS)
+        if sinal is not None:
+            sinal.clear()
+    return processados
+
+class WorkersIngestao:
+    """Workers da fila de ingestão em threads do processo da API"""
+
+    def __init__(self, quantidade: int):
+        self.quantidade = quantidade
+        self._parar = threading.Event()
+        self._sinal = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def iniciar(self) -> None:
+        """Inicia as threads (se ainda não estiverem rodando)"""
+        if self._threads or self.quantidade <= 0:
+            return
+        self._parar.clear()
+        for indice in range(self.quantidade):
+            thread = threading.Thread(
+                target=executar_worker, args=(self._parar, self._sinal),
+                name=f"ingestao-{indice}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        print(f"📥 {self.quantidade} worker(s) de ingestão iniciado(s)")
+
+    def notificar(self) -> None:
+        """Acorda os workers (job enfileirado)"""
+        self._sinal.set()
+
+    def parar(self, timeout: float = 5.0) -> None:
+        """Sinaliza o encerramento e aguarda as threads (jobs em andamento são retomados por outro worker)"""
+        self._parar.set()
+        self._sinal.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+workers_ingestao = WorkersIngestao(settings.INGESTION_WORKERS)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker da fila de ingestão de emails")
+    parser.add_argument("--uma-vez", action="store_true", help="Encerra quando a fila estiver vazia")
+    args = parser.parse_args()
+
+    parar = threading.Event()
+    try:
+        total = executar_worker(parar, uma_vez=args.uma_vez)
+        print(f"📊 Jobs processados: {total}")
+    except KeyboardInterrupt:
+        parar.set()
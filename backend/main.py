@@ -3,43 +3,86 @@ API principal do Sistema de Gestão de Faturas - Moara Energia
 Implementa todos os endpoints da API usando FastAPI
 """
 
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import stripe
-from datetime import datetime
+from datetime import date, datetime
+import json
+import math
 import os
 
 # Importações locais com fallback para Vercel
 try:
     # Desenvolvimento local
     from .config import settings
-    from .database import get_db, create_tables
+    from .database import SessionLocal, get_db, get_read_db, get_async_db, get_async_read_db, criar_sessao_async_leitura, get_pool_metrics, replica_router, create_tables
+    from .database import CABECALHO_ULTIMA_ESCRITA, COOKIE_ULTIMA_ESCRITA
+    from .cache import cache_faturas
+    from .coalescencia import chamadas_estatisticas, chamadas_ingestao, transmissoes_exportacao
+    from . import coalescencia
     from . import crud
     from .schemas import (
         FaturaSchema, 
+        FaturaParcialSchema,
         FaturaCreate, 
         FaturaUpdate,
+        FaturaHistoricoSchema,
+        ClienteSchema,
+        InstalacaoSchema,
+        ImportacaoLoteResponse,
+        PagamentoLoteRequest,
+        PagamentoLoteResponse,
+        EstatisticasResponse,
         CheckoutSessionResponse,
+        LinkPagamentoSchema,
         ProcessamentoEmailResponse,
+        JobIngestaoSchema,
+        FalhaExtracaoSchema,
         HealthCheckResponse
     )
-    from .utils import bot_mail
+    from .utils import checkout_lote, exportacao, importacao, serializacao, stripe_checkout, stripe_http, stripe_reconciliacao, validacao_http
+    from .utils.stripe_eventos import processador_eventos_stripe
+    from .ingestao import executar_proximo_job, nome_worker, workers_ingestao
+    from .agendador import agendador_ingestao
+    from .reprocessamento import reprocessar_falhas
 except ImportError:
     # Vercel - imports absolutos
     from config import settings
-    from database import get_db, create_tables
+    from database import SessionLocal, get_db, get_read_db, get_async_db, get_async_read_db, criar_sessao_async_leitura, get_pool_metrics, replica_router, create_tables
+    from database import CABECALHO_ULTIMA_ESCRITA, COOKIE_ULTIMA_ESCRITA
+    from cache import cache_faturas
+    from coalescencia import chamadas_estatisticas, chamadas_ingestao, transmissoes_exportacao
+    import coalescencia
     import crud
     from schemas import (
         FaturaSchema, 
+        FaturaParcialSchema,
         FaturaCreate, 
         FaturaUpdate,
+        FaturaHistoricoSchema,
+        ClienteSchema,
+        InstalacaoSchema,
+        ImportacaoLoteResponse,
+        PagamentoLoteRequest,
+        PagamentoLoteResponse,
+        EstatisticasResponse,
         CheckoutSessionResponse,
+        LinkPagamentoSchema,
         ProcessamentoEmailResponse,
+        JobIngestaoSchema,
+        FalhaExtracaoSchema,
         HealthCheckResponse
     )
-    from utils import bot_mail
+    from utils import checkout_lote, exportacao, importacao, serializacao, stripe_checkout, stripe_http, stripe_reconciliacao, validacao_http
+    from utils.stripe_eventos import processador_eventos_stripe
+    from ingestao import executar_proximo_job, nome_worker, workers_ingestao
+    from agendador import agendador_ingestao
+    from reprocessamento import reprocessar_falhas
 
 # Inicializa o aplicativo FastAPI
 app = FastAPI(
@@ -57,10 +100,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", CABECALHO_ULTIMA_ESCRITA],
 )
 
+def rota_cron(caminho: str):
+    """
+    Registra uma rota disparada pelo cron da Vercel (que só chama com GET) e
+    também manualmente (POST). Cada método é uma rota separada, para que o
+    OpenAPI gere um operation_id distinto para cada um.
+    """
+    def registrar(funcao):
+        return app.post(caminho)(app.get(caminho)(funcao))
+    return registrar
+
+@app.middleware("http")
+async def leitura_apos_escrita(request: Request, call_next):
+    """
+    Leitura após escrita por cliente: repassa ao roteador de réplicas a
+    última escrita do cliente (cookie ou cabeçalho X-Ultima-Escrita) e
+    devolve a desta requisição, que vale por REPLICA_MAX_LAG_SECONDS.
+    """
+    if not replica_router.engines:
+        return await call_next(request)
+    
+    token = replica_router.iniciar_requisicao(
+        request.headers.get(CABECALHO_ULTIMA_ESCRITA) or request.cookies.get(COOKIE_ULTIMA_ESCRITA)
+    )
+    try:
+        response = await call_next(request)
+    finally:
+        escrita = replica_router.encerrar_requisicao(token)
+    if escrita:
+        valor = f"{escrita:.3f}"
+        response.set_cookie(
+            COOKIE_ULTIMA_ESCRITA, valor,
+            max_age=max(math.ceil(settings.REPLICA_MAX_LAG_SECONDS), 1),
+            httponly=True, samesite="lax"
+        )
+        response.headers[CABECALHO_ULTIMA_ESCRITA] = valor
+    return response
+
 # Configuração do Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+stripe_http.configurar_stripe()
 
 # Criação das tabelas (apenas se estiver na Vercel)
 if settings.IS_VERCEL:
@@ -82,11 +163,24 @@ async def startup_event():
         print("⚠️ Problemas de configuração detectados:")
         for issue in issues:
             print(f"   - {issue}")
+    
+    # Processa eventos do Stripe que ficaram pendentes na caixa de entrada (na
+    # Vercel não há tarefa em segundo plano: o webhook e o cron os aplicam)
+    if not settings.IS_VERCEL:
+        processador_eventos_stripe.iniciar()
+    
+    # Workers da fila e agendador da ingestão de emails (INGESTION_WORKERS=0 e
+    # INGESTION_SCHEDULE_SECONDS=0 desligam)
+    workers_ingestao.iniciar()
+    agendador_ingestao.iniciar()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Evento executado no encerramento da aplicação"""
     print(f"🛑 {settings.APP_NAME} encerrando...")
+    await processador_eventos_stripe.parar()
+    await run_in_threadpool(agendador_ingestao.parar)
+    await run_in_threadpool(workers_ingestao.parar)
 
 # Endpoints da API
 
@@ -212,160 +306,447 @@ def health_check():
             services={"error": str(e)}
         )
 
-@app.post("/processar_email/")
+@app.post("/processar_email/", status_code=202)
 def processar_emails(db_session: Session = Depends(get_db)):
     """
-    Processa emails para buscar novas faturas.
-    BASEADO NO SISTEMA FUNCIONAL
+    Enfileira a busca de novas faturas nos emails e retorna o job na hora.
+    Um worker da fila faz o processamento (na Vercel, onde não há workers,
+    uma varredura com prazo roda nesta requisição); o progresso é consultado em
+    /jobs/ingestao/{job_id}. Se já houver um job aguardando, ele é reaproveitado;
+    cliques simultâneos (ou dentro de COALESCE_INGESTION_SECONDS) recebem a
+    mesma resposta.
     """
-    try:
-        print("🚀 Iniciando processamento de emails...")
-        
-        # Valida configurações básicas
-        if not settings.EMAIL_USER or not settings.EMAIL_PASS:
-            error_msg = "Credenciais de email não configuradas"
-            print(f"❌ {error_msg}")
-            return {
-                "status": "error",
-                "faturas_processadas": 0,
-                "message": error_msg
-            }
-        
-        print(f"🔧 Configurações válidas:")
-        print(f"   - EMAIL_USER: {settings.EMAIL_USER}")
-        print(f"   - EMAIL_HOST: {settings.EMAIL_HOST}")
-        print(f"   - EMAIL_PORT: {settings.EMAIL_PORT}")
-        print(f"   - EMAIL_PASS: {'***CONFIGURADO***' if settings.EMAIL_PASS else 'NÃO CONFIGURADO'}")
-        
-        # Processa os emails usando a lógica que funciona
-        print("📧 Iniciando processamento de emails...")
-        dados_emails = bot_mail.buscar_e_processar_emails()
-        
-        if not dados_emails:
-            print("ℹ️ Nenhum novo email com fatura encontrado")
-            return {
-                "status": "success",
-                "faturas_processadas": 0,
-                "message": "Nenhum novo email com fatura encontrado"
-            }
-        
-        print(f"📊 Processamento concluído: {len(dados_emails)} faturas encontradas")
-        
-        # Salva as faturas no banco (lógica que funciona)
-        faturas_salvas = 0
-        for fatura_data in dados_emails:
-            try:
-                print(f"💾 Salvando fatura: {fatura_data.get('nome_cliente', 'N/A')}")
-                
-                # Verifica se a fatura já existe
-                fatura_existente = crud.get_fatura_by_instalacao(db_session, fatura_data["numero_instalacao"])
-                
-                if fatura_existente:
-                    # Atualiza fatura existente
-                    for key, value in fatura_data.items():
-                        if hasattr(fatura_existente, key):
-                            setattr(fatura_existente, key, value)
-                    db_session.commit()
-                    print(f"✅ Fatura atualizada: {fatura_data['nome_cliente']} (Instalação: {fatura_data['numero_instalacao']})")
-                    faturas_salvas += 1
-                else:
-                    # Cria nova fatura
-                    nova_fatura = crud.create_fatura(db_session, fatura_data)
-                    db_session.commit()
-                    print(f"✅ Nova fatura criada: {fatura_data['nome_cliente']} (Instalação: {fatura_data['numero_instalacao']})")
-                    faturas_salvas += 1
-                    
-            except Exception as e:
-                print(f"❌ Erro ao processar fatura {fatura_data.get('numero_instalacao', 'N/A')}: {e}")
-                db_session.rollback()
-                continue
-        
-        print("=" * 80)
-        print(f"🎯 PROCESSAMENTO FINALIZADO")
-        print(f"📊 Faturas encontradas: {len(dados_emails)}")
-        print(f"💾 Faturas salvas: {faturas_salvas}")
-        print("=" * 80)
-        
-        return {
-            "status": "success",
-            "faturas_processadas": len(dados_emails),
-            "faturas_salvas": faturas_salvas,
-            "message": f"Processamento concluído: {len(dados_emails)} faturas encontradas, {faturas_salvas} salvas"
-        }
-        
-    except Exception as e:
-        print(f"❌ Erro no processamento: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    # Valida configurações básicas antes de enfileirar
+    if not settings.EMAIL_USER or not settings.EMAIL_PASS:
+        error_msg = "Credenciais de email não configuradas"
+        print(f"❌ {error_msg}")
         return {
             "status": "error",
             "faturas_processadas": 0,
-            "message": f"Erro no processamento: {str(e)}"
+            "message": error_msg
+        }
+    
+    def enfileirar():
+        job = crud.FaturaCRUD.enfileirar_job_ingestao(db_session)
+        workers_ingestao.notificar()
+        print(f"📥 Processamento de emails enfileirado (job {job.id})")
+        if settings.IS_VERCEL:
+            # Sem workers na Vercel: executa uma varredura com prazo nesta
+            # requisição (o que sobrar fica na continuação, retomada pelo cron)
+            db_session.close()
+            executar_proximo_job(nome_worker())
+        return {
+            "status": "enfileirado",
+            "job_id": job.id,
+            "message": f"Processamento enfileirado (job {job.id})"
         }
+    
+    try:
+        return chamadas_ingestao.executar("processar_email", enfileirar)
+    except Exception as e:
+        print(f"❌ Erro ao enfileirar processamento: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar processamento: {str(e)}")
 
+@rota_cron("/jobs/ingestao/executar")
+def executar_job_ingestao(
+    prazo: Optional[float] = Query(None, gt=0, description="Prazo em segundos (padrão: INGESTION_TIME_BUDGET_SECONDS)"),
+    db_session: Session = Depends(get_db)
+):
+    """
+    Enfileira e executa uma varredura nesta chamada, dentro do prazo (para um
+    cron onde não há workers, como o da Vercel em vercel.json, que chama com
+    GET). O que não couber no prazo fica
+    em um job de continuação, retomado do checkpoint na próxima chamada.
+    Chamadas simultâneas neste processo aguardam a mesma varredura.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    if not settings.EMAIL_USER or not settings.EMAIL_PASS:
+        raise HTTPException(status_code=400, detail="Credenciais de email não configuradas")
+    
+    def varrer():
+        crud.FaturaCRUD.enfileirar_job_ingestao(db_session)
+        db_session.close()  # libera a conexão durante a varredura
+        resultado = executar_proximo_job(nome_worker(), prazo)
+        if resultado is None:
+            return {"status": "ocupado", "message": "Outra instância está processando emails"}
+        return resultado
+    
+    return chamadas_ingestao.executar("executar_ingestao", varrer)
 
+@app.get("/jobs/ingestao/{job_id}", response_model=JobIngestaoSchema)
+def obter_job_ingestao(job_id: int, db_session: Session = Depends(get_db)):
+    """
+    Status e progresso de um job de ingestão de emails.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    job = crud.FaturaCRUD.get_job_ingestao(db_session, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
 
-@app.get("/faturas/", response_model=List[FaturaSchema])
-def listar_faturas(
+@app.get("/falhas-extracao", response_model=List[FalhaExtracaoSchema])
+def listar_falhas_extracao(
+    status: Optional[str] = Query(None, pattern="^(pendente|resolvida|esgotada)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    db_session: Session = Depends(get_read_db)
+):
+    """
+    PDFs cuja extração falhou, com a classe do erro, as tentativas e a
+    próxima tentativa.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    return crud.FaturaCRUD.listar_falhas_extracao(db_session, status=status, limit=limit)
+
+@rota_cron("/falhas-extracao/reprocessar")
+def reprocessar_falhas_extracao(
+    forcar: bool = Query(False, description="Ignora a espera e o limite de tentativas (ex.: após corrigir o parser)"),
+    db_session: Session = Depends(get_db)
+):
+    """
+    Reprocessa agora os PDFs com falha de extração elegíveis (o agendador da
+    ingestão também faz isso após cada varredura; na Vercel, o cron).
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    try:
+        return reprocessar_falhas(db_session, forcar=forcar)
+    except Exception as e:
+        print(f"❌ Erro no reprocessamento de PDFs: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro no reprocessamento de PDFs: {str(e)}")
+
+# Parâmetro de projeção das rotas de faturas
+DESCRICAO_FIELDS = (
+    "Campos da fatura separados por vírgula (ex.: nome_cliente,valor_total,data_vencimento,ja_pago). "
+    "Só essas colunas são lidas do banco e enviadas; o id é sempre incluído."
+)
+
+def campos_da_requisicao(fields: Optional[str]) -> tuple:
+    """Valida o parâmetro fields= e retorna os campos da resposta (400 se inválido)"""
+    try:
+        return serializacao.campos_solicitados(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/faturas/", response_model=List[FaturaParcialSchema])
+async def listar_faturas(
+    request: Request,
     skip: int = 0, 
     limit: int = 100, 
-    db_session: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description=DESCRICAO_FIELDS),
+    db_session: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Retorna uma lista de todas as faturas cadastradas.
+    Responde 304 quando o ETag/Last-Modified do cliente ainda é válido.
     """
     if not db_session:
         raise HTTPException(status_code=500, detail="Banco de dados não disponível")
     
+    campos = campos_da_requisicao(fields)
     try:
-        faturas = crud.get_faturas(db_session, skip=skip, limit=limit)
-        return faturas
+        validador = await crud.FaturaCRUDAsync.get_validador_faturas(db_session)
+        ultima_atualizacao = validador[2]
+        etag = validacao_http.gerar_etag("faturas", skip, limit, campos, *validador)
+        if validacao_http.nao_modificado(request, etag, ultima_atualizacao):
+            return validacao_http.resposta_304(etag, ultima_atualizacao)
+        
+        # Tuplas codificadas direto em JSON; o response_model segue documentando o formato
+        linhas = await crud.FaturaCRUDAsync.get_faturas_linhas(
+            db_session, serializacao.colunas_de(campos), skip=skip, limit=limit
+        )
+        return serializacao.resposta_linhas(
+            linhas, campos, headers=validacao_http.cabecalhos_validacao(etag, ultima_atualizacao)
+        )
     except Exception as e:
         print(f"❌ Erro ao listar faturas: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao listar faturas: {str(e)}")
 
-@app.get("/faturas/pendentes", response_model=List[FaturaSchema])
-def listar_faturas_pendentes(db_session: Session = Depends(get_db)):
+@app.get("/faturas/pendentes", response_model=List[FaturaParcialSchema])
+async def listar_faturas_pendentes(
+    request: Request,
+    fields: Optional[str] = Query(None, description=DESCRICAO_FIELDS),
+    db_session: AsyncSession = Depends(get_async_read_db)
+):
     """
     Retorna uma lista de faturas pendentes de pagamento.
+    Responde 304 quando o ETag/Last-Modified do cliente ainda é válido.
     """
     if not db_session:
         raise HTTPException(status_code=500, detail="Banco de dados não disponível")
     
+    campos = campos_da_requisicao(fields)
     try:
-        faturas = crud.FaturaCRUD.get_faturas_pendentes(db_session)
-        return faturas
+        validador = await crud.FaturaCRUDAsync.get_validador_faturas(db_session, ja_pago=False)
+        ultima_atualizacao = validador[2]
+        etag = validacao_http.gerar_etag("faturas_pendentes", campos, *validador)
+        if validacao_http.nao_modificado(request, etag, ultima_atualizacao):
+            return validacao_http.resposta_304(etag, ultima_atualizacao)
+        
+        linhas = await crud.FaturaCRUDAsync.get_faturas_linhas(
+            db_session, serializacao.colunas_de(campos), ja_pago=False
+        )
+        return serializacao.resposta_linhas(
+            linhas, campos, headers=validacao_http.cabecalhos_validacao(etag, ultima_atualizacao)
+        )
     except Exception as e:
         print(f"❌ Erro ao listar faturas pendentes: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao listar faturas pendentes: {str(e)}")
 
-@app.get("/faturas/pagas", response_model=List[FaturaSchema])
-def listar_faturas_pagas(db_session: Session = Depends(get_db)):
+@app.get("/faturas/pagas", response_model=List[FaturaParcialSchema])
+async def listar_faturas_pagas(
+    request: Request,
+    fields: Optional[str] = Query(None, description=DESCRICAO_FIELDS),
+    db_session: AsyncSession = Depends(get_async_read_db)
+):
     """
     Retorna uma lista de faturas já pagas.
+    Responde 304 quando o ETag/Last-Modified do cliente ainda é válido.
     """
     if not db_session:
         raise HTTPException(status_code=500, detail="Banco de dados não disponível")
     
+    campos = campos_da_requisicao(fields)
     try:
-        faturas = crud.FaturaCRUD.get_faturas_pagas(db_session)
-        return faturas
+        validador = await crud.FaturaCRUDAsync.get_validador_faturas(db_session, ja_pago=True)
+        ultima_atualizacao = validador[2]
+        etag = validacao_http.gerar_etag("faturas_pagas", campos, *validador)
+        if validacao_http.nao_modificado(request, etag, ultima_atualizacao):
+            return validacao_http.resposta_304(etag, ultima_atualizacao)
+        
+        linhas = await crud.FaturaCRUDAsync.get_faturas_linhas(
+            db_session, serializacao.colunas_de(campos), ja_pago=True
+        )
+        return serializacao.resposta_linhas(
+            linhas, campos, headers=validacao_http.cabecalhos_validacao(etag, ultima_atualizacao)
+        )
     except Exception as e:
         print(f"❌ Erro ao listar faturas pagas: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao listar faturas pagas: {str(e)}")
 
-@app.get("/faturas/{fatura_id}", response_model=FaturaSchema)
-def obter_fatura(fatura_id: int, db_session: Session = Depends(get_db)):
+@app.get("/faturas/export")
+def exportar_faturas(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Formato: ndjson ou csv"),
+    ja_pago: Optional[bool] = None,
+    documento_cliente: Optional[str] = None,
+    numero_instalacao: Optional[str] = None
+):
+    """
+    Exporta as faturas em NDJSON ou CSV via streaming, lendo do banco
+    por cursor do lado do servidor. Exportações idênticas que chegam antes
+    do primeiro bloco compartilham a mesma leitura.
+    """
+    def gerar():
+        # Sessão própria (réplica, quando disponível): o streaming continua
+        # após o retorno do endpoint
+        db_session = SessionLocal(bind=replica_router.escolher_engine())
+        try:
+            linhas = crud.FaturaCRUD.iter_faturas_exportacao(
+                db_session,
+                exportacao.COLUNAS_EXPORTACAO,
+                ja_pago=ja_pago,
+                documento_cliente=documento_cliente,
+                numero_instalacao=numero_instalacao
+            )
+            if format == "csv":
+                yield from exportacao.gerar_csv(linhas)
+            else:
+                yield from exportacao.gerar_ndjson(linhas)
+        except Exception as e:
+            print(f"❌ Erro na exportação de faturas: {str(e)}")
+            raise
+        finally:
+            db_session.close()
+    
+    chave = json.dumps([format, ja_pago, documento_cliente, numero_instalacao])
+    blocos = transmissoes_exportacao.transmitir(chave, gerar)
+    
+    nome_arquivo = f"faturas_{datetime.now():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(
+        blocos,
+        media_type=exportacao.FORMATOS_EXPORTACAO[format],
+        headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}"'}
+    )
+
+def _gravar_bloco_importacao(db_session: Session, validos: list) -> list:
+    """
+    Grava um bloco validado em uma transação. Se o bloco falhar, grava os
+    registros um a um, para que só os que falham de fato voltem como erro.
+    """
+    try:
+        crud.FaturaCRUD.upsert_faturas_lote(db_session, [dados for _, dados in validos])
+        db_session.commit()
+        return []
+    except Exception as e:
+        db_session.rollback()
+        print(f"⚠️ Erro ao gravar bloco de importação, gravando registro a registro: {str(e)}")
+    
+    erros = []
+    for numero, dados in validos:
+        try:
+            crud.FaturaCRUD.upsert_faturas_lote(db_session, [dados])
+            db_session.commit()
+        except Exception as e:
+            db_session.rollback()
+            erros.append({"linha": numero, "erro": f"Erro ao gravar: {str(e)}"})
+    if erros:
+        print(f"❌ {len(erros)} de {len(validos)} registros do bloco não foram gravados")
+    return erros
+
+@app.post("/faturas/bulk", response_model=ImportacaoLoteResponse)
+async def importar_faturas(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$", description="Formato: ndjson ou csv (padrão: pelo Content-Type)"),
+    db_session: Session = Depends(get_db)
+):
+    """
+    Importa faturas em lote a partir de um corpo NDJSON ou CSV enviado em streaming.
+    Os registros são validados e gravados em blocos; erros não interrompem o lote.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    formato = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    
+    recebidos, gravados, erros = 0, 0, []
+    async for validos, erros_bloco in importacao.ler_blocos(request.stream(), formato):
+        recebidos += len(validos) + len(erros_bloco)
+        erros.extend(erros_bloco)
+        if validos:
+            erros_gravacao = await run_in_threadpool(_gravar_bloco_importacao, db_session, validos)
+            erros.extend(erros_gravacao)
+            gravados += len(validos) - len(erros_gravacao)
+    
+    print(f"📥 Importação em lote: {recebidos} recebidos, {gravados} gravados, {len(erros)} erros")
+    return ImportacaoLoteResponse(
+        registros_recebidos=recebidos,
+        registros_gravados=gravados,
+        erros=sorted(erros, key=lambda erro: erro["linha"])
+    )
+
+@app.post("/faturas/pagamentos", response_model=PagamentoLoteResponse)
+async def registrar_pagamentos(pagamentos: PagamentoLoteRequest, db_session: AsyncSession = Depends(get_async_db)):
+    """
+    Marca várias faturas como pagas em uma única operação
+    (conciliação bancária ou baixas manuais).
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    try:
+        resultado = await crud.FaturaCRUDAsync.mark_paid_many(db_session, pagamentos.fatura_ids)
+        print(f"✅ Pagamentos registrados: {len(resultado['atualizadas'])} faturas, {len(resultado['nao_encontradas'])} não encontradas")
+        return PagamentoLoteResponse(**resultado)
+    except Exception as e:
+        print(f"❌ Erro ao registrar pagamentos: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao registrar pagamentos: {str(e)}")
+
+@app.get("/faturas/ciclo", response_model=List[FaturaHistoricoSchema])
+def listar_faturas_ciclo(
+    competencia: Optional[date] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db_session: Session = Depends(get_read_db)
+):
+    """
+    Retorna as faturas de um ciclo mensal do histórico (padrão: mês corrente).
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    try:
+        competencia = (competencia or date.today()).replace(day=1)
+        return crud.FaturaCRUD.get_historico_por_competencia(
+            db_session, competencia, skip=skip, limit=limit
+        )
+    except Exception as e:
+        print(f"❌ Erro ao listar faturas do ciclo: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao listar faturas do ciclo: {str(e)}")
+
+@app.get("/faturas/historico/{numero_instalacao}", response_model=List[FaturaHistoricoSchema])
+def listar_historico_instalacao(
+    numero_instalacao: str,
+    limit: int = 24,
+    db_session: Session = Depends(get_read_db)
+):
+    """
+    Retorna o histórico mensal de faturas de uma instalação.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    try:
+        return crud.FaturaCRUD.get_historico_instalacao(db_session, numero_instalacao, limit=limit)
+    except Exception as e:
+        print(f"❌ Erro ao listar histórico: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao listar histórico: {str(e)}")
+
+@app.get("/faturas/estatisticas", response_model=EstatisticasResponse)
+async def obter_estatisticas():
+    """
+    Retorna os totais do dashboard (quantidades e valores por status).
+    Cargas simultâneas (ou dentro de COALESCE_STATS_SECONDS) compartilham
+    a mesma consulta.
+    """
+    async def calcular():
+        # Sessão própria: a consulta continua para as demais requisições
+        # se a que a iniciou for cancelada
+        async with await criar_sessao_async_leitura() as db_session:
+            return await crud.FaturaCRUDAsync.get_estatisticas(db_session)
+    
+    try:
+        return EstatisticasResponse(**await chamadas_estatisticas.executar_async("estatisticas", calcular))
+    except Exception as e:
+        print(f"❌ Erro ao calcular estatísticas: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular estatísticas: {str(e)}")
+
+@app.get("/faturas/{fatura_id}", response_model=FaturaParcialSchema)
+async def obter_fatura(
+    fatura_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description=DESCRICAO_FIELDS),
+    db_session: AsyncSession = Depends(get_async_db)
+):
     """
     Retorna uma fatura específica pelo ID.
+    Responde 304 quando o ETag/Last-Modified do cliente ainda é válido.
     """
     if not db_session:
         raise HTTPException(status_code=500, detail="Banco de dados não disponível")
     
+    campos = campos_da_requisicao(fields) if fields else None
     try:
-        fatura = crud.get_fatura_by_id(db_session, fatura_id)
+        validador = await crud.FaturaCRUDAsync.get_validador_fatura(db_session, fatura_id)
+        if not validador:
+            raise HTTPException(status_code=404, detail="Fatura não encontrada")
+        
+        ultima_atualizacao, versao = validador
+        etag = validacao_http.gerar_etag("fatura", fatura_id, campos, versao)
+        if validacao_http.nao_modificado(request, etag, ultima_atualizacao):
+            return validacao_http.resposta_304(etag, ultima_atualizacao)
+        
+        if campos:
+            linha = await crud.FaturaCRUDAsync.get_fatura_colunas(
+                db_session, fatura_id, serializacao.colunas_de(campos)
+            )
+            if not linha:
+                raise HTTPException(status_code=404, detail="Fatura não encontrada")
+            return serializacao.resposta_linha(
+                linha, campos, headers=validacao_http.cabecalhos_validacao(etag, ultima_atualizacao)
+            )
+        
+        fatura = await crud.FaturaCRUDAsync.get_fatura_by_id(db_session, fatura_id)
         if not fatura:
             raise HTTPException(status_code=404, detail="Fatura não encontrada")
+        response.headers.update(validacao_http.cabecalhos_validacao(etag, ultima_atualizacao))
         return fatura
     except HTTPException:
         raise
@@ -373,10 +754,67 @@ def obter_fatura(fatura_id: int, db_session: Session = Depends(get_db)):
         print(f"❌ Erro ao obter fatura: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao obter fatura: {str(e)}")
 
+@app.get("/clientes/{documento_cliente}/instalacoes", response_model=List[InstalacaoSchema])
+def listar_instalacoes_cliente(documento_cliente: str, db_session: Session = Depends(get_read_db)):
+    """
+    Retorna as instalações de um cliente.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    try:
+        if not crud.FaturaCRUD.get_cliente_by_documento(db_session, documento_cliente):
+            raise HTTPException(status_code=404, detail="Cliente não encontrado")
+        return crud.FaturaCRUD.get_instalacoes_cliente(db_session, documento_cliente)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Erro ao listar instalações: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao listar instalações: {str(e)}")
+
+@app.get("/clientes/{documento_cliente}/faturas", response_model=List[FaturaSchema])
+def listar_faturas_cliente(documento_cliente: str, db_session: Session = Depends(get_read_db)):
+    """
+    Retorna as faturas correntes de todas as instalações de um cliente.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    try:
+        return crud.FaturaCRUD.get_faturas_cliente(db_session, documento_cliente)
+    except Exception as e:
+        print(f"❌ Erro ao listar faturas do cliente: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao listar faturas do cliente: {str(e)}")
+
+@app.get("/clientes/{documento_cliente}/historico", response_model=List[FaturaHistoricoSchema])
+def listar_historico_cliente(
+    documento_cliente: str,
+    competencia: Optional[date] = None,
+    limit: int = 100,
+    db_session: Session = Depends(get_read_db)
+):
+    """
+    Retorna o histórico mensal de faturas de todas as instalações de um cliente.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    try:
+        if competencia is not None:
+            competencia = competencia.replace(day=1)
+        return crud.FaturaCRUD.get_historico_cliente(
+            db_session, documento_cliente, competencia=competencia, limit=limit
+        )
+    except Exception as e:
+        print(f"❌ Erro ao listar histórico do cliente: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao listar histórico do cliente: {str(e)}")
+
 @app.post("/create-checkout-session/{fatura_id}", response_model=CheckoutSessionResponse)
 def create_checkout_session(fatura_id: int, db_session: Session = Depends(get_db)):
     """
     Cria uma sessão de checkout do Stripe para pagamento de uma fatura.
+    Reaproveita a sessão aberta da fatura quando ainda é válida e o valor
+    não mudou, sem chamar o Stripe.
     """
     if not db_session:
         raise HTTPException(status_code=500, detail="Banco de dados não disponível")
@@ -388,39 +826,70 @@ def create_checkout_session(fatura_id: int, db_session: Session = Depends(get_db
         fatura = crud.get_fatura_by_id(db_session, fatura_id)
         if not fatura:
             raise HTTPException(status_code=404, detail="Fatura não encontrada")
+        if fatura.ja_pago:
+            raise HTTPException(status_code=409, detail="Fatura já paga")
 
-        valor_em_centavos = int(fatura.valor_total * 100)
-
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'brl',
-                    'product_data': {
-                        'name': f"Fatura de {fatura.mes_referencia}",
-                    },
-                    'unit_amount': valor_em_centavos,
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
-            success_url=f"{settings.FRONTEND_SUCCESS_URL}?session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=settings.FRONTEND_CANCEL_URL,
-            metadata={"fatura_id": str(fatura.id)}
-        )
+        valor_em_centavos = stripe_checkout.valor_em_centavos(fatura.valor_total)
+
+        registro = crud.FaturaCRUD.get_checkout_sessao(db_session, fatura_id)
+        if stripe_checkout.sessao_reaproveitavel(registro, valor_em_centavos):
+            return CheckoutSessionResponse(
+                session_id=registro.session_id,
+                checkout_url=registro.checkout_url
+            )
+
+        # Não segura a conexão de escrita durante a chamada ao Stripe
+        db_session.close()
+        dados = stripe_checkout.criar_sessao_checkout(fatura, valor_em_centavos)
+        crud.FaturaCRUD.salvar_checkout_sessao(db_session, dados)
         
         return CheckoutSessionResponse(
-            session_id=session.id, 
-            checkout_url=session.url
+            session_id=dados["session_id"], 
+            checkout_url=dados["checkout_url"]
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Erro ao criar sessão de checkout: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/faturas/{fatura_id}/link-pagamento", response_model=LinkPagamentoSchema)
+def obter_link_pagamento(fatura_id: int, db_session: Session = Depends(get_db)):
+    """
+    Payment Link pré-gerado da fatura (não expira), para envio ao cliente.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    link = crud.FaturaCRUD.get_link_pagamento(db_session, fatura_id)
+    if not link:
+        raise HTTPException(status_code=404, detail="Link de pagamento não encontrado")
+    return link
+
+@app.post("/checkout/pre-gerar")
+def pre_gerar_checkouts(threads: Optional[int] = Query(None, ge=1, le=32), db_session: Session = Depends(get_db)):
+    """
+    Cria em lote os Payment Links das faturas pendentes que ainda não têm
+    um link ativo com o valor atual (ex.: antes do envio mensal das faturas).
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    if not stripe.api_key:
+        raise HTTPException(status_code=500, detail="Stripe não configurado")
+    
+    try:
+        return checkout_lote.pre_gerar_checkouts(db_session, threads=threads or settings.CHECKOUT_PREGEN_WORKERS)
+    except Exception as e:
+        print(f"❌ Erro na pré-geração de links de pagamento: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro na pré-geração de links de pagamento: {str(e)}")
+
 @app.post("/stripe-webhook/")
-async def stripe_webhook(request: Request, db_session: Session = Depends(get_db)):
+async def stripe_webhook(request: Request, db_session: AsyncSession = Depends(get_async_db)):
     """
     Recebe eventos do Stripe para atualizar status de pagamento.
+    Só valida a assinatura e grava o evento na caixa de entrada (eventos
+    repetidos são ignorados pelo ID); o processamento é feito em segundo plano.
     """
     if not db_session:
         raise HTTPException(status_code=500, detail="Banco de dados não disponível")
@@ -444,18 +913,55 @@ async def stripe_webhook(request: Request, db_session: Session = Depends(get_db)
     except stripe.error.SignatureVerificationError:
         raise HTTPException(status_code=400, detail="Invalid signature")
 
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        fatura_id_str = session.get('metadata', {}).get('fatura_id')
-        if fatura_id_str:
-            try:
-                fatura_id = int(fatura_id_str)
-                crud.update_fatura_ja_pago(db_session, fatura_id)
-                print(f"✅ Pagamento concluído para a fatura ID: {fatura_id}")
-            except Exception as e:
-                print(f"❌ Erro ao atualizar fatura {fatura_id_str}: {e}")
+    try:
+        dados = json.loads(payload)
+        novo = await crud.FaturaCRUDAsync.registrar_evento_stripe(
+            db_session, event['id'], event['type'], json.dumps(dados['data']['object'])
+        )
+    except Exception as e:
+        # Sem 2xx o Stripe reenvia o evento mais tarde
+        print(f"❌ Erro ao registrar evento {event['id']}: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao registrar evento")
+    
+    if settings.IS_VERCEL:
+        await processador_eventos_stripe.processar_agora(novo)
+    else:
+        processador_eventos_stripe.notificar(novo)
+    return {"status": "success", "duplicado": not novo}
 
-    return {"status": "success"}
+@rota_cron("/stripe/eventos/processar")
+async def processar_eventos_stripe():
+    """
+    Aplica os eventos pendentes da caixa de entrada do webhook (cron da
+    Vercel, onde não há processador em segundo plano, ou manualmente).
+    """
+    try:
+        return {"eventos": await processador_eventos_stripe.drenar()}
+    except Exception as e:
+        print(f"❌ Erro ao processar eventos do Stripe: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao processar eventos do Stripe: {str(e)}")
+
+@app.post("/stripe/reconciliar")
+def reconciliar_pagamentos_stripe(
+    max_paginas: Optional[int] = Query(None, ge=1),
+    db_session: Session = Depends(get_db)
+):
+    """
+    Aplica os pagamentos concluídos no Stripe desde o último checkpoint
+    (recuperação quando o webhook ficou fora do ar). Com max_paginas, para
+    no limite e a próxima chamada continua de onde parou.
+    """
+    if not db_session:
+        raise HTTPException(status_code=500, detail="Banco de dados não disponível")
+    
+    if not stripe.api_key:
+        raise HTTPException(status_code=500, detail="Stripe não configurado")
+    
+    try:
+        return stripe_reconciliacao.reconciliar_pagamentos(db_session, max_paginas=max_paginas)
+    except Exception as e:
+        print(f"❌ Erro na reconciliação do Stripe: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro na reconciliação do Stripe: {str(e)}")
 
 @app.get("/debug/")
 def debug_config():
@@ -491,6 +997,58 @@ def debug_config():
         }
 
 
+@app.get("/metricas/pool")
+def metricas_pool():
+    """
+    Métricas dos pools de conexão: espera por checkout (histograma),
+    conexões em uso, overflow, timeouts e o dimensionamento aplicado.
+    """
+    try:
+        return get_pool_metrics()
+    except Exception as e:
+        print(f"❌ Erro ao coletar métricas dos pools: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao coletar métricas dos pools: {str(e)}")
+
+@app.get("/metricas/cache")
+def metricas_cache():
+    """
+    Taxa de acerto do cache de faturas (camada local e compartilhada).
+    """
+    try:
+        return cache_faturas.estatisticas()
+    except Exception as e:
+        return {
+            "error": str(e),
+            "traceback": str(e.__class__.__name__)
+        }
+
+@app.get("/metricas/coalescencia")
+def metricas_coalescencia():
+    """
+    Coalescência de requisições por endpoint: execuções, requisições que se
+    juntaram a uma execução em andamento e reaproveitadas.
+    """
+    return coalescencia.estatisticas()
+
+@app.get("/metricas/stripe")
+def metricas_stripe():
+    """
+    Contadores do processador de eventos do webhook do Stripe e chamadas
+    à API do Stripe (latência por operação, retentativas e erros).
+    """
+    return {
+        **processador_eventos_stripe.contadores.to_dict(),
+        "http": stripe_http.cliente_http_stripe.estatisticas()
+    }
+
+@app.get("/metricas/ingestao")
+def metricas_ingestao():
+    """
+    Agendador da ingestão de emails: disparos executados e saltados (outra
+    instância com a trava) e tempo de retenção da trava da caixa de email.
+    """
+    return agendador_ingestao.estatisticas()
+
 @app.get("/logs/")
 def get_logs():
     """
@@ -0,0 +1,85 @@
+"""
+Métricas em memória do Sistema de Gestão de Faturas
+Contadores e histogramas simples, por processo, expostos pelos endpoints de métricas
+"""
+
+import threading
+from typing import Dict, Sequence
+
+# Limites padrão dos buckets de latência, em milissegundos
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histograma:
+    """Histograma de buckets fixos (contagem acumulada por limite superior)"""
+    
+    def __init__(self, buckets: Sequence[float] = BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._contagens = [0] * (len(self.buckets) + 1)
+        self._total = 0
+        self._soma = 0.0
+        self._maximo = 0.0
+        self._lock = threading.Lock()
+    
+    def observar(self, valor: float) -> None:
+        """Registra uma observação"""
+        indice = len(self.buckets)
+        for posicao, limite in enumerate(self.buckets):
+            if valor <= limite:
+                indice = posicao
+                break
+        with self._lock:
+            self._contagens[indice] += 1
+            self._total += 1
+            self._soma += valor
+            self._maximo = max(self._maximo, valor)
+    
+    def percentil(self, p: float) -> float:
+        """Percentil aproximado pelo limite superior do bucket"""
+        with self._lock:
+            if not self._total:
+                return 0.0
+            alvo = self._total * p
+            acumulado = 0
+            for posicao, contagem in enumerate(self._contagens):
+                acumulado += contagem
+                if acumulado >= alvo:
+                    return min(float(self.buckets[posicao]), self._maximo) if posicao < len(self.buckets) else self._maximo
+            return self._maximo
+    
+    def to_dict(self) -> Dict:
+        """Converte o histograma para dicionário"""
+        with self._lock:
+            total, soma, maximo = self._total, self._soma, self._maximo
+            acumulado, buckets = 0, {}
+            for posicao, contagem in enumerate(self._contagens):
+                acumulado += contagem
+                chave = f"le_{self.buckets[posicao]:g}" if posicao < len(self.buckets) else "le_inf"
+                buckets[chave] = acumulado
+        return {
+            "total": total,
+            "media": round(soma / total, 3) if total else 0.0,
+            "p50": self.percentil(0.5),
+            "p95": self.percentil(0.95),
+            "p99": self.percentil(0.99),
+            "maximo": round(maximo, 3),
+            "buckets": buckets
+        }
+
+class Contadores:
+    """Conjunto de contadores inteiros nomeados, seguros entre threads"""
+    
+    def __init__(self, *nomes: str):
+        self._valores = {nome: 0 for nome in nomes}
+        self._lock = threading.Lock()
+    
+    def incrementar(self, nome: str, quantidade: int = 1) -> None:
+        with self._lock:
+            self._valores[nome] = self._valores.get(nome, 0) + quantidade
+    
+    def valor(self, nome: str) -> int:
+        with self._lock:
+            return self._valores.get(nome, 0)
+    
+    def to_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._valores)
@@ -4,12 +4,46 @@ Modelos SQLAlchemy para o Sistema de Gestão de Faturas
 Define a estrutura das tabelas do banco de dados
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, Text, Index, ForeignKey, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 Base = declarative_base()
 
+class Cliente(Base):
+    """
+    Modelo para clientes (titulares de uma ou mais instalações)
+    """
+    __tablename__ = 'clientes'
+
+    id = Column(Integer, primary_key=True, index=True)
+    documento = Column(String(20), unique=True, nullable=False, index=True)
+    nome = Column(String(255), nullable=False)
+    email = Column(String(255), nullable=True)
+
+    # Timestamps
+    data_criacao = Column(DateTime, default=func.now(), nullable=False)
+    data_ultima_atualizacao = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<Cliente(id={self.id}, documento='{self.documento}')>"
+
+class Instalacao(Base):
+    """
+    Modelo para instalações (unidades consumidoras) de um cliente
+    """
+    __tablename__ = 'instalacoes'
+
+    id = Column(Integer, primary_key=True, index=True)
+    numero = Column(String(20), unique=True, nullable=False, index=True)
+    cliente_id = Column(Integer, ForeignKey('clientes.id'), nullable=False, index=True)
+
+    # Timestamps
+    data_criacao = Column(DateTime, default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<Instalacao(id={self.id}, numero='{self.numero}', cliente_id={self.cliente_id})>"
+
 class Fatura(Base):
     """
     Modelo para armazenar faturas de energia elétrica
@@ -19,13 +53,15 @@ class Fatura(Base):
     # Campos de identificação
     id = Column(Integer, primary_key=True, index=True)
     
-    # Dados do cliente
+    # Dados do cliente: cópia, na data da fatura, do cadastro em clientes
+    # (mantida para o payload da API; consultas por cliente usam instalacao_id)
     nome_cliente = Column(String(255), nullable=False, index=True)
-    documento_cliente = Column(String(20), unique=True, nullable=False, index=True)
+    documento_cliente = Column(String(20), nullable=False, index=True)
     email_cliente = Column(String(255), nullable=False, index=True)
     
     # Dados da instalação
     numero_instalacao = Column(String(20), unique=True, nullable=False, index=True)
+    instalacao_id = Column(Integer, ForeignKey('instalacoes.id'), nullable=True, index=True)
     
     # Dados financeiros
     valor_total = Column(Float, nullable=False)
@@ -40,7 +76,11 @@ class Fatura(Base):
     
     # Timestamps
     data_criacao = Column(DateTime, server_default=func.now(), nullable=False)
-    data_ultima_atualizacao = Column(DateTime, onupdate=func.now(), nullable=False)
+    data_ultima_atualizacao = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+    
+    # Versão da linha, incrementada a cada UPDATE (ETag das respostas; os
+    # timestamps do SQLite têm resolução de segundos)
+    versao = Column(Integer, default=1, server_default="1", onupdate=text("versao + 1"), nullable=False)
     
     def __repr__(self):
         return f"<Fatura(id={self.id}, nome='{self.nome_cliente}', valor={self.valor_total})>"
@@ -53,6 +93,7 @@ class Fatura(Base):
             'documento_cliente': self.documento_cliente,
             'email_cliente': self.email_cliente,
             'numero_instalacao': self.numero_instalacao,
+            'instalacao_id': self.instalacao_id,
             'valor_total': self.valor_total,
             'mes_referencia': self.mes_referencia,
             'data_vencimento': self.data_vencimento,
@@ -60,4 +101,214 @@ class Fatura(Base):
             'ja_pago': self.ja_pago,
             'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None,
             'data_ultima_atualizacao': self.data_ultima_atualizacao.isoformat() if self.data_ultima_atualizacao else None
-        }
\ No newline at end of file
+        }
+
+
+class FaturaHistorico(Base):
+    """
+    Histórico mensal de faturas: uma linha por instalação e mês de referência.
+    No PostgreSQL a tabela é particionada por mês (RANGE em competencia);
+    no SQLite é uma tabela comum indexada por competencia.
+    """
+    __tablename__ = 'faturas_historico'
+    __table_args__ = (
+        Index('ix_faturas_historico_competencia', 'competencia'),
+        {'postgresql_partition_by': 'RANGE (competencia)'},
+    )
+
+    # Chave: instalação + primeiro dia do mês de referência (chave de partição)
+    numero_instalacao = Column(String(20), primary_key=True)
+    competencia = Column(Date, primary_key=True)
+    instalacao_id = Column(Integer, ForeignKey('instalacoes.id'), nullable=True, index=True)
+
+    # Dados da fatura no mês
+    mes_referencia = Column(String(50), nullable=False)
+    valor_total = Column(Float, nullable=False)
+    data_vencimento = Column(String(20), nullable=False)
+    url_pdf = Column(Text, nullable=True)
+
+    # Timestamps
+    data_criacao = Column(DateTime, default=func.now(), nullable=False)
+    data_ultima_atualizacao = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<FaturaHistorico(instalacao='{self.numero_instalacao}', competencia={self.competencia})>"
+
+    def to_dict(self):
+        """Converte o modelo para dicionário"""
+        return {
+            'numero_instalacao': self.numero_instalacao,
+            'instalacao_id': self.instalacao_id,
+            'competencia': self.competencia.isoformat() if self.competencia else None,
+            'mes_referencia': self.mes_referencia,
+            'valor_total': self.valor_total,
+            'data_vencimento': self.data_vencimento,
+            'url_pdf': self.url_pdf,
+            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None,
+            'data_ultima_atualizacao': self.data_ultima_atualizacao.isoformat() if self.data_ultima_atualizacao else None
+        }
+
+class CheckoutSessao(Base):
+    """
+    Última sessão de checkout do Stripe criada para cada fatura, reaproveitada
+    enquanto estiver aberta, dentro da validade e com o mesmo valor
+    """
+    __tablename__ = 'checkout_sessoes'
+
+    id = Column(Integer, primary_key=True, index=True)
+    fatura_id = Column(Integer, ForeignKey('faturas.id', ondelete='CASCADE'), unique=True, nullable=False, index=True)
+    session_id = Column(String(255), unique=True, nullable=False, index=True)
+    checkout_url = Column(Text, nullable=False)
+    valor_centavos = Column(Integer, nullable=False)
+    expira_em = Column(DateTime, nullable=False)  # UTC
+    status = Column(String(20), nullable=False, default='open')  # open | complete | expired
+
+    # Timestamps
+    data_criacao = Column(DateTime, default=func.now(), nullable=False)
+    data_ultima_atualizacao = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<CheckoutSessao(fatura_id={self.fatura_id}, session_id='{self.session_id}', status='{self.status}')>"
+
+class LinkPagamento(Base):
+    """
+    Payment Link do Stripe de cada fatura pendente, gerado em lote para o
+    envio das faturas. Não expira: cada clique cria a própria sessão de
+    checkout (com o fatura_id nos metadados) e o link é desativado após o
+    primeiro pagamento ou quando o valor da fatura muda
+    """
+    __tablename__ = 'links_pagamento'
+
+    id = Column(Integer, primary_key=True, index=True)
+    fatura_id = Column(Integer, ForeignKey('faturas.id', ondelete='CASCADE'), unique=True, nullable=False, index=True)
+    payment_link_id = Column(String(255), unique=True, nullable=False, index=True)
+    url = Column(Text, nullable=False)
+    valor_centavos = Column(Integer, nullable=False)
+    ativo = Column(Boolean, default=True, nullable=False)
+
+    # Timestamps
+    data_criacao = Column(DateTime, default=func.now(), nullable=False)
+    data_ultima_atualizacao = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<LinkPagamento(fatura_id={self.fatura_id}, payment_link_id='{self.payment_link_id}', ativo={self.ativo})>"
+
+class StripeEvento(Base):
+    """
+    Caixa de entrada dos eventos do webhook do Stripe. O webhook só grava o
+    evento (chave: id do evento, o que descarta duplicatas) e um processador
+    aplica os pendentes em lotes, reivindicando-os antes (status 'processando')
+    """
+    __tablename__ = 'stripe_eventos'
+    __table_args__ = (
+        Index('ix_stripe_eventos_status_recebido', 'status', 'recebido_em'),
+    )
+
+    event_id = Column(String(255), primary_key=True)
+    tipo = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)  # objeto do evento (data.object) em JSON
+    status = Column(String(20), nullable=False, default='pendente')  # pendente | processando | processado | erro
+    tentativas = Column(Integer, nullable=False, default=0)
+    erro = Column(Text, nullable=True)
+
+    # Timestamps
+    recebido_em = Column(DateTime, default=func.now(), nullable=False)
+    reivindicado_em = Column(DateTime, nullable=True)  # UTC; início do processamento
+    processado_em = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<StripeEvento(event_id='{self.event_id}', tipo='{self.tipo}', status='{self.status}')>"
+
+class Checkpoint(Base):
+    """
+    Posição salva de jobs retomáveis (ex.: reconciliação do Stripe): o job
+    grava o cursor a cada etapa e, se for interrompido, continua dali
+    """
+    __tablename__ = 'checkpoints'
+
+    nome = Column(String(100), primary_key=True)
+    valor = Column(Text, nullable=False)  # estado do job em JSON
+
+    # Timestamps
+    data_ultima_atualizacao = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<Checkpoint(nome='{self.nome}', valor='{self.valor}')>"
+
+class Trava(Base):
+    """
+    Trava exclusiva entre processos e instâncias por arrendamento: o dono
+    renova a expiração enquanto trabalha e apaga a linha ao terminar; se ele
+    morrer, a trava fica livre quando a expiração passa
+    """
+    __tablename__ = 'travas'
+
+    nome = Column(String(100), primary_key=True)
+    dono = Column(String(255), nullable=False)  # host:pid:uuid de quem a detém
+    expira_em = Column(DateTime, nullable=False)  # UTC
+
+    def __repr__(self):
+        return f"<Trava(nome='{self.nome}', dono='{self.dono}', expira_em='{self.expira_em}')>"
+
+class JobIngestao(Base):
+    """
+    Fila de jobs de ingestão de faturas por e-mail. O endpoint só enfileira;
+    os workers reivindicam os pendentes com SELECT ... FOR UPDATE SKIP LOCKED
+    e registram o progresso aqui
+    """
+    __tablename__ = 'jobs_ingestao'
+    __table_args__ = (
+        Index('ix_jobs_ingestao_status_id', 'status', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), nullable=False, default='pendente')  # pendente | executando | concluido | erro
+    tentativas = Column(Integer, nullable=False, default=0)
+    worker = Column(String(100), nullable=True)
+
+    # Progresso
+    faturas_encontradas = Column(Integer, nullable=False, default=0)
+    faturas_salvas = Column(Integer, nullable=False, default=0)
+    restantes = Column(Integer, nullable=True)  # emails deixados para a continuação (prazo atingido)
+    mensagem = Column(Text, nullable=True)
+
+    # Timestamps (UTC); heartbeat_em parado há muito tempo indica worker interrompido
+    criado_em = Column(DateTime, default=func.now(), nullable=False)
+    iniciado_em = Column(DateTime, nullable=True)
+    heartbeat_em = Column(DateTime, nullable=True)
+    concluido_em = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<JobIngestao(id={self.id}, status='{self.status}', worker='{self.worker}')>"
+
+class FalhaExtracao(Base):
+    """
+    Fila de PDFs cuja extração falhou (dead-letter). O conteúdo do PDF fica
+    na própria linha (o disco da Vercel, /tmp, é efêmero), então a ingestão
+    não o lê de novo do email; o job de reprocessamento tenta outra vez a
+    partir daqui, com espera exponencial entre as tentativas
+    """
+    __tablename__ = 'falhas_extracao'
+    __table_args__ = (
+        Index('ix_falhas_extracao_status_proxima', 'status', 'proxima_tentativa_em'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    hash_pdf = Column(String(32), unique=True, nullable=False)  # md5 do conteúdo, nome do arquivo salvo
+    nome_arquivo = Column(String(255), nullable=True)  # nome do anexo no email
+    caminho_pdf = Column(String(500), nullable=False)
+    conteudo_pdf = Column(LargeBinary, nullable=True)  # regrava o PDF se o arquivo sumir; limpo ao resolver
+    status = Column(String(20), nullable=False, default='pendente')  # pendente | resolvida | esgotada
+
+    # Última falha: classe da exceção (ou SemDados, quando o parser não reconheceu a fatura)
+    classe_erro = Column(String(100), nullable=False)
+    mensagem = Column(Text, nullable=True)
+    tentativas = Column(Integer, nullable=False, default=1)
+    proxima_tentativa_em = Column(DateTime, nullable=True)  # UTC
+
+    # Timestamps
+    criado_em = Column(DateTime, default=func.now(), nullable=False)
+    data_ultima_atualizacao = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<FalhaExtracao(hash_pdf='{self.hash_pdf}', status='{self.status}', tentativas={self.tentativas})>"
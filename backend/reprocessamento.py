@@ -0,0 +1,199 @@
+"""
+Reprocessamento dos PDFs com falha de extração do Sistema de Gestão de Faturas
+Percorre a fila falhas_extracao em lotes: extrai de novo, em paralelo, os PDFs
+cuja próxima tentativa venceu, grava as faturas recuperadas e reagenda as que
+falharam outra vez com espera exponencial. Roda após cada disparo do agendador
+da ingestão, pelo endpoint ou em um processo separado:
+
+    python -m backend.reprocessamento [--forcar]
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy.orm import Session
+
+# Importações com fallback para Vercel
+try:
+    from .config import settings
+    from . import crud
+    from .database import TravaPerdida, trava_exclusiva, verificar_travas
+    from .ingestao import proxima_tentativa_extracao, salvar_faturas
+    from .utils import bot_mail
+except ImportError:
+    from config import settings
+    import crud
+    from database import TravaPerdida, trava_exclusiva, verificar_travas
+    from ingestao import proxima_tentativa_extracao, salvar_faturas
+    from utils import bot_mail
+
+# Uma execução por vez entre as instâncias (o endpoint e o agendador podem coincidir)
+TRAVA_REPROCESSAMENTO = "reprocessamento_pdfs"
+
+Tentativa = Tuple[int, Union[Dict[str, Any], bot_mail.ErroExtracao]]
+
+def _extrair(falha: Tuple[int, str, str, str, Optional[bytes]]) -> Tentativa:
+    # Roda nas threads do pool: recebe só valores, nunca objetos da sessão
+    falha_id, nome, caminho_pdf, hash_pdf, conteudo = falha
+    try:
+        return falha_id, bot_mail.extrair_pdf(nome, caminho_pdf, hash_pdf, conteudo)
+    except bot_mail.ErroExtracao as e:
+        return falha_id, e
+
+def reprocessar_falhas(
+    db: Session,
+    forcar: bool = False,
+    threads: Optional[int] = None,
+    tamanho_lote: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Tenta de novo as falhas de extração elegíveis.
+
+    Cada lote é extraído em paralelo e gravado em uma transação: faturas
+    recuperadas e o novo status das falhas (resolvida; pendente com a próxima
+    tentativa reagendada; ou esgotada, após EXTRACTION_MAX_ATTEMPTS). Se a
+    gravação do lote falhar, ele é refeito PDF a PDF, cada fatura com o status
+    da sua falha, e só o PDF que não grava é reagendado como ErroGravacao.
+
+    Args:
+        db: Sessão do banco de dados
+        forcar: Ignora a espera e o limite de tentativas (ex.: após corrigir o parser)
+        threads: Extrações simultâneas (padrão: EXTRACTION_RETRY_WORKERS)
+        tamanho_lote: PDFs por lote (padrão: EXTRACTION_RETRY_BATCH_SIZE)
+
+    Returns:
+        Resumo com elegiveis, resolvidas, reagendadas, esgotadas e duração;
+        status 'ocupado' se outra execução está em andamento ou
+        'interrompido' se a trava foi perdida para outra instância no meio
+    """
+    if threads is None:
+        threads = settings.EXTRACTION_RETRY_WORKERS
+    if tamanho_lote is None:
+        tamanho_lote = settings.EXTRACTION_RETRY_BATCH_SIZE
+    with trava_exclusiva(TRAVA_REPROCESSAMENTO) as obtida:
+        if not obtida:
+            print("⏭️ Reprocessamento de PDFs já em andamento em outra instância")
+            return {"status": "ocupado"}
+        try:
+            return _reprocessar(db, forcar, threads, tamanho_lote)
+        except TravaPerdida as e:
+            print(f"⛔ {e}")
+            db.rollback()
+            return {"status": "interrompido"}
+
+def _nova_tentativa(falha_id: int, feitas: int, classe_erro: str, mensagem: str, agora: datetime) -> Dict[str, Any]:
+    esgotada = feitas >= settings.EXTRACTION_MAX_ATTEMPTS
+    return {
+        "id": falha_id,
+        "status": "esgotada" if esgotada else "pendente",
+        "tentativas": feitas,
+        "classe_erro": classe_erro,
+        "mensagem": mensagem,
+        "proxima_tentativa_em": None if esgotada else proxima_tentativa_extracao(feitas, agora)
+    }
+
+def _gravar_tentativas(
+    db: Session,
+    extraidas: List[Tentativa],
+    tentativas: Dict[int, int],
+    agora: datetime
+) -> List[Dict[str, Any]]:
+    # Grava as faturas recuperadas e o status das falhas sem commit; propaga o primeiro erro
+    resultados: List[Dict[str, Any]] = []
+    for falha_id, resultado in extraidas:
+        if isinstance(resultado, dict):
+            salvar_faturas(db, [resultado], commit=False)
+            resultados.append({
+                "id": falha_id, "status": "resolvida", "proxima_tentativa_em": None, "conteudo_pdf": None
+            })
+        else:
+            resultados.append(_nova_tentativa(
+                falha_id, tentativas[falha_id] + 1, resultado.classe_erro, str(resultado.causa or resultado), agora
+            ))
+    crud.FaturaCRUD.atualizar_falhas_extracao(db, resultados)
+    return resultados
+
+def _gravar_um_a_um(
+    db: Session,
+    extraidas: List[Tentativa],
+    tentativas: Dict[int, int],
+    agora: datetime
+) -> List[Dict[str, Any]]:
+    # Após a falha do lote: cada PDF em sua transação, isolando o que não grava
+    resultados: List[Dict[str, Any]] = []
+    for falha_id, resultado in extraidas:
+        verificar_travas()
+        try:
+            resultados += _gravar_tentativas(db, [(falha_id, resultado)], tentativas, agora)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            erro = [_nova_tentativa(falha_id, tentativas[falha_id] + 1, "ErroGravacao", str(e), agora)]
+            crud.FaturaCRUD.atualizar_falhas_extracao(db, erro)
+            db.commit()
+            resultados += erro
+    return resultados
+
+def _reprocessar(db: Session, forcar: bool, threads: int, tamanho_lote: int) -> Dict[str, Any]:
+    inicio = time.perf_counter()
+    resumo = {"status": "concluido", "elegiveis": 0, "resolvidas": 0, "reagendadas": 0, "esgotadas": 0}
+    contadores = {"resolvida": "resolvidas", "pendente": "reagendadas", "esgotada": "esgotadas"}
+    apos_id = 0
+    with ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix="reprocessamento") as executor:
+        while True:
+            verificar_travas()
+            falhas = crud.FaturaCRUD.get_falhas_extracao_elegiveis(
+                db, settings.EXTRACTION_MAX_ATTEMPTS, tamanho_lote, apos_id=apos_id, forcar=forcar
+            )
+            if not falhas:
+                db.commit()  # encerra a leitura: não segura a conexão de escrita
+                break
+            apos_id = falhas[-1].id
+            tentativas = {falha.id: falha.tentativas for falha in falhas}
+            lote = [
+                (falha.id, falha.nome_arquivo, falha.caminho_pdf, falha.hash_pdf, falha.conteudo_pdf)
+                for falha in falhas
+            ]
+            db.commit()  # não segura a conexão durante a extração
+
+            extraidas = list(executor.map(_extrair, lote))
+            agora = datetime.now(timezone.utc).replace(tzinfo=None)
+            verificar_travas()
+            try:
+                resultados = _gravar_tentativas(db, extraidas, tentativas, agora)
+                verificar_travas()
+                db.commit()
+            except TravaPerdida:
+                raise
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ Falha ao gravar o lote de reprocessamento ({e}); gravando PDF a PDF")
+                resultados = _gravar_um_a_um(db, extraidas, tentativas, agora)
+
+            for resultado in resultados:
+                resumo[contadores[resultado["status"]]] += 1
+            resumo["elegiveis"] += len(lote)
+
+    resumo["segundos"] = round(time.perf_counter() - inicio, 3)
+    if resumo["elegiveis"]:
+        print(
+            f"🔁 Reprocessamento de PDFs: {resumo['resolvidas']} de {resumo['elegiveis']} recuperados, "
+            f"{resumo['reagendadas']} reagendados, {resumo['esgotadas']} esgotados em {resumo['segundos']}s"
+        )
+    return resumo
+
+if __name__ == "__main__":
+    try:
+        from .database import SessionLocal
+    except ImportError:
+        from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Reprocessa os PDFs com falha de extração")
+    parser.add_argument("--forcar", action="store_true", help="Ignora a espera e o limite de tentativas")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        print(reprocessar_falhas(db, forcar=args.forcar))
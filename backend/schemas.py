@@ -4,8 +4,8 @@ Define a estrutura dos dados de entrada e saída
 """
 
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+from datetime import date, datetime
 
 class FaturaBase(BaseModel):
     """Schema base para faturas"""
@@ -37,6 +37,7 @@ class FaturaUpdate(BaseModel):
 class FaturaSchema(FaturaBase):
     """Schema completo para faturas (inclui campos do banco)"""
     id: int = Field(..., description="ID único da fatura")
+    instalacao_id: Optional[int] = Field(None, description="ID da instalação")
     ja_pago: bool = Field(default=False, description="Status de pagamento")
     data_criacao: Optional[datetime] = Field(None, description="Data de criação")
     data_ultima_atualizacao: Optional[datetime] = Field(None, description="Data da última atualização")
@@ -47,16 +48,145 @@ class FaturaSchema(FaturaBase):
             datetime: lambda v: v.isoformat() if v else None
         }
 
+class FaturaParcialSchema(BaseModel):
+    """
+    Schema das rotas de faturas com projeção (fields=): só o id é sempre
+    enviado; os demais campos aparecem quando solicitados (ou sem fields=)
+    """
+    id: int = Field(..., description="ID único da fatura")
+    nome_cliente: Optional[str] = Field(None, description="Nome completo do cliente")
+    documento_cliente: Optional[str] = Field(None, description="CPF/CNPJ do cliente")
+    email_cliente: Optional[str] = Field(None, description="Email do cliente")
+    numero_instalacao: Optional[str] = Field(None, description="Número da instalação")
+    instalacao_id: Optional[int] = Field(None, description="ID da instalação")
+    valor_total: Optional[float] = Field(None, description="Valor total da fatura")
+    mes_referencia: Optional[str] = Field(None, description="Mês de referência")
+    data_vencimento: Optional[str] = Field(None, description="Data de vencimento")
+    url_pdf: Optional[str] = Field(None, description="URL ou caminho do PDF da fatura")
+    ja_pago: Optional[bool] = Field(None, description="Status de pagamento")
+    data_criacao: Optional[datetime] = Field(None, description="Data de criação")
+    data_ultima_atualizacao: Optional[datetime] = Field(None, description="Data da última atualização")
+
+    class Config:
+        from_attributes = True
+
+class ClienteSchema(BaseModel):
+    """Schema para clientes"""
+    id: int = Field(..., description="ID único do cliente")
+    documento: str = Field(..., description="CPF/CNPJ do cliente")
+    nome: str = Field(..., description="Nome completo do cliente")
+    email: Optional[str] = Field(None, description="Email do cliente")
+
+    class Config:
+        from_attributes = True
+
+class InstalacaoSchema(BaseModel):
+    """Schema para instalações"""
+    id: int = Field(..., description="ID único da instalação")
+    numero: str = Field(..., description="Número da instalação")
+    cliente_id: int = Field(..., description="ID do cliente titular")
+
+    class Config:
+        from_attributes = True
+
+class FaturaHistoricoSchema(BaseModel):
+    """Schema para faturas do histórico mensal"""
+    numero_instalacao: str = Field(..., description="Número da instalação")
+    instalacao_id: Optional[int] = Field(None, description="ID da instalação")
+    competencia: date = Field(..., description="Primeiro dia do mês de referência")
+    mes_referencia: str = Field(..., description="Mês de referência")
+    valor_total: float = Field(..., description="Valor total da fatura")
+    data_vencimento: str = Field(..., description="Data de vencimento")
+    url_pdf: Optional[str] = Field(None, description="URL ou caminho do PDF da fatura")
+    data_criacao: Optional[datetime] = Field(None, description="Data de criação")
+    data_ultima_atualizacao: Optional[datetime] = Field(None, description="Data da última atualização")
+
+    class Config:
+        from_attributes = True
+
+class ErroImportacao(BaseModel):
+    """Erro de validação ou gravação de um registro importado"""
+    linha: int = Field(..., description="Número do registro no arquivo (sem cabeçalho)")
+    erro: str = Field(..., description="Descrição do erro")
+
+class ImportacaoLoteResponse(BaseModel):
+    """Schema para resposta de importação em lote de faturas"""
+    registros_recebidos: int = Field(..., description="Total de registros lidos")
+    registros_gravados: int = Field(..., description="Registros válidos gravados")
+    erros: List[ErroImportacao] = Field(default_factory=list, description="Erros por registro")
+
+class PagamentoLoteRequest(BaseModel):
+    """Schema para baixa de pagamento em lote"""
+    fatura_ids: List[int] = Field(..., min_length=1, description="IDs das faturas pagas")
+
+class PagamentoLoteResponse(BaseModel):
+    """Schema para resposta de baixa de pagamento em lote"""
+    atualizadas: List[int] = Field(..., description="IDs marcados como pagos")
+    nao_encontradas: List[int] = Field(..., description="IDs inexistentes")
+
+class EstatisticasResponse(BaseModel):
+    """Schema para os totais do dashboard"""
+    total_faturas: int = Field(..., description="Total de faturas")
+    faturas_pendentes: int = Field(..., description="Faturas pendentes de pagamento")
+    faturas_pagas: int = Field(..., description="Faturas pagas")
+    valor_total: float = Field(..., description="Soma de todas as faturas")
+    valor_pendente: float = Field(..., description="Soma das faturas pendentes")
+    valor_recebido: float = Field(..., description="Soma das faturas pagas")
+
 class CheckoutSessionResponse(BaseModel):
     """Schema para resposta de criação de sessão de checkout"""
     session_id: str = Field(..., description="ID da sessão do Stripe")
     checkout_url: str = Field(..., description="URL para checkout")
 
+class LinkPagamentoSchema(BaseModel):
+    """Schema para o Payment Link de uma fatura"""
+    fatura_id: int = Field(..., description="ID da fatura")
+    payment_link_id: str = Field(..., description="ID do Payment Link no Stripe")
+    url: str = Field(..., description="URL de pagamento (não expira)")
+    valor_centavos: int = Field(..., description="Valor cobrado, em centavos")
+    ativo: bool = Field(..., description="Se o link ainda aceita pagamentos")
+
+    class Config:
+        from_attributes = True
+
 class ProcessamentoEmailResponse(BaseModel):
     """Schema para resposta de processamento de emails"""
     message: str = Field(..., description="Mensagem de resultado")
     faturas_processadas: int = Field(..., description="Número de faturas processadas")
 
+class FalhaExtracaoSchema(BaseModel):
+    """Schema para um PDF na fila de falhas de extração"""
+    id: int = Field(..., description="ID da falha")
+    hash_pdf: str = Field(..., description="Hash do conteúdo do PDF")
+    nome_arquivo: Optional[str] = Field(None, description="Nome do anexo no email")
+    caminho_pdf: str = Field(..., description="Caminho do PDF salvo")
+    status: str = Field(..., description="pendente, resolvida ou esgotada")
+    classe_erro: str = Field(..., description="Classe do último erro (SemDados se o parser não reconheceu a fatura)")
+    mensagem: Optional[str] = Field(None, description="Mensagem do último erro")
+    tentativas: int = Field(..., description="Tentativas de extração")
+    proxima_tentativa_em: Optional[datetime] = Field(None, description="Próxima tentativa (UTC)")
+    criado_em: datetime = Field(..., description="Data da primeira falha")
+
+    class Config:
+        from_attributes = True
+
+class JobIngestaoSchema(BaseModel):
+    """Schema para status de um job de ingestão de emails"""
+    id: int = Field(..., description="ID do job")
+    status: str = Field(..., description="pendente, executando, concluido ou erro")
+    tentativas: int = Field(..., description="Vezes que o job foi reivindicado por um worker")
+    worker: Optional[str] = Field(None, description="Worker que executa ou executou o job")
+    faturas_encontradas: int = Field(..., description="Faturas extraídas dos emails")
+    faturas_salvas: int = Field(..., description="Faturas gravadas no banco")
+    restantes: Optional[int] = Field(None, description="Emails deixados para o job de continuação")
+    mensagem: Optional[str] = Field(None, description="Resultado ou erro")
+    criado_em: datetime = Field(..., description="Data de enfileiramento")
+    iniciado_em: Optional[datetime] = Field(None, description="Início da última execução")
+    concluido_em: Optional[datetime] = Field(None, description="Data de conclusão")
+
+    class Config:
+        from_attributes = True
+
 class HealthCheckResponse(BaseModel):
     """Schema para resposta de health check"""
     status: str = Field(..., description="Status do sistema")
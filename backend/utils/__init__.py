@@ -3,5 +3,15 @@
 
 from . import bot_mail
 from . import pdf_parser
+from . import exportacao
+from . import importacao
+from . import validacao_http
+from . import serializacao
+from . import stripe_checkout
+from . import stripe_eventos
+from . import stripe_http
+from . import stripe_reconciliacao
+from . import limites
+from . import checkout_lote
 
-__all__ = ['bot_mail', 'pdf_parser']
+__all__ = ['bot_mail', 'pdf_parser', 'exportacao', 'importacao', 'validacao_http', 'serializacao', 'stripe_checkout', 'stripe_eventos', 'stripe_http', 'stripe_reconciliacao', 'limites', 'checkout_lote']
@@ -7,9 +7,10 @@ BASEADO NO SISTEMA FUNCIONAL
 import imaplib
 import email
 import os
+import re
 from email.header import decode_header
 from hashlib import md5
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 # Importações com fallback para Vercel
 try:
@@ -52,6 +53,148 @@ def gerar_hash(conteudo_bytes: bytes) -> str:
     """
     return md5(conteudo_bytes).hexdigest()
 
+class ErroExtracao(Exception):
+    """Falha ao extrair os dados da fatura de um PDF já salvo em disco"""
+
+    def __init__(
+        self,
+        nome: str,
+        caminho_pdf: str,
+        hash_pdf: str,
+        causa: Optional[BaseException] = None,
+        conteudo: Optional[bytes] = None
+    ):
+        self.nome = nome
+        self.caminho_pdf = caminho_pdf
+        self.hash_pdf = hash_pdf
+        self.causa = causa
+        self.conteudo = conteudo  # PDF, para a fila de reprocessamento
+        # SemDados: o parser não reconheceu a fatura (retornou None)
+        self.classe_erro = type(causa).__name__ if causa is not None else "SemDados"
+        mensagem = f"Falha ao extrair dados da fatura: {nome}"
+        if causa is not None:
+            mensagem += f" ({self.classe_erro}: {causa})"
+        super().__init__(mensagem)
+
+def extrair_pdf(nome: str, caminho_pdf: str, hash_pdf: str, conteudo: Optional[bytes] = None) -> Dict[str, Any]:
+    """
+    Extrai os dados da fatura de um PDF salvo. Se o arquivo não existe mais
+    (disco efêmero, outra instância) e o `conteudo` foi informado, ele é
+    regravado antes.
+    
+    Returns:
+        Dados extraídos, com url_pdf
+        
+    Raises:
+        ErroExtracao: o parser falhou ou não reconheceu a fatura
+    """
+    # Chama a função de extração do pdf_parser.py
+    from .pdf_parser import extrair_dados_fatura_pdf
+    if not os.path.exists(caminho_pdf):
+        if conteudo is None:
+            raise ErroExtracao(nome, caminho_pdf, hash_pdf, FileNotFoundError(caminho_pdf))
+        print(f"💾 Regravando PDF: {nome}")
+        os.makedirs(os.path.dirname(caminho_pdf) or ".", exist_ok=True)
+        with open(caminho_pdf, "wb") as f:
+            f.write(conteudo)
+    try:
+        dados_extraidos = extrair_dados_fatura_pdf(caminho_pdf)
+    except Exception as e:
+        raise ErroExtracao(nome, caminho_pdf, hash_pdf, e, conteudo) from e
+    
+    if not dados_extraidos:
+        raise ErroExtracao(nome, caminho_pdf, hash_pdf, conteudo=conteudo)
+    
+    dados_extraidos['url_pdf'] = caminho_pdf
+    print(f"✅ Fatura extraída: {dados_extraidos.get('nome_cliente', 'N/A')}")
+    print(f"   📊 Dados: {dados_extraidos}")
+    return dados_extraidos
+
+def obter_uidvalidity(mail: imaplib.IMAP4_SSL) -> Optional[int]:
+    """
+    UIDVALIDITY da caixa de entrada. Se mudar, os UIDs anteriores deixam de
+    valer (a caixa foi recriada) e o checkpoint da ingestão é descartado.
+    """
+    status, dados = mail.status("inbox", "(UIDVALIDITY)")
+    if status != "OK" or not dados:
+        return None
+    encontrado = re.search(rb"UIDVALIDITY (\d+)", dados[0])
+    return int(encontrado.group(1)) if encontrado else None
+
+def listar_uids(mail: imaplib.IMAP4_SSL, apos_uid: Optional[int] = None, limite_inicial: int = 10) -> List[int]:
+    """
+    UIDs dos emails a processar, em ordem crescente: os posteriores a `apos_uid`
+    ou, sem checkpoint, os últimos `limite_inicial` da caixa de entrada.
+    """
+    criterio = "ALL" if apos_uid is None else f"UID {apos_uid + 1}:*"
+    status, dados = mail.uid("search", None, criterio)
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"Erro ao buscar emails: {status}")
+    uids = sorted(int(uid) for uid in dados[0].split())
+    if apos_uid is None:
+        return uids[-limite_inicial:]
+    # "n:*" sempre inclui o último email, mesmo com UID menor que n
+    return [uid for uid in uids if uid > apos_uid]
+
+def anexos_pdf(mail: imaplib.IMAP4_SSL, uid: int) -> List[Tuple[str, bytes]]:
+    """Baixa o email e retorna seus anexos PDF (nome, conteúdo), na ordem da mensagem"""
+    print(f"📬 Processando email UID: {uid}")
+    _, msg_data = mail.uid("fetch", str(uid), "(RFC822)")
+    msg = email.message_from_bytes(msg_data[0][1])
+
+    # Obtém informações do email
+    subject = decode_header(msg["subject"])[0][0] if msg["subject"] else "Sem assunto"
+    if isinstance(subject, bytes):
+        subject = subject.decode("utf-8", errors="ignore")
+
+    from_addr = msg["from"] or "Remetente desconhecido"
+    print(f"📧 Assunto: {subject}")
+    print(f"👤 De: {from_addr}")
+
+    anexos = []
+    for part in msg.walk():
+        if part.get_content_type() == "application/pdf":
+            nome_anexo = part.get_filename()
+            if nome_anexo:
+                # Decodifica o nome do arquivo
+                nome, charset = decode_header(nome_anexo)[0]
+                if isinstance(nome, bytes):
+                    nome = nome.decode(charset or "utf-8")
+                print(f"📎 Anexo PDF encontrado: {nome}")
+                anexos.append((nome, part.get_payload(decode=True)))
+    return anexos
+
+def processar_anexo(nome: str, conteudo: bytes, reprocessar: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Salva o PDF inédito (identificado pelo hash do conteúdo) e extrai os dados
+    da fatura. PDFs já salvos são ignorados, a menos que `reprocessar` seja
+    True (retomada de um anexo interrompido no meio).
+    
+    Returns:
+        Dados extraídos (com url_pdf) ou None se o PDF já foi processado
+        
+    Raises:
+        ErroExtracao: a extração falhou (o PDF fica salvo, para nova tentativa)
+    """
+    hash_pdf = gerar_hash(conteudo)
+    
+    # Cria diretório se não existir
+    os.makedirs(settings.PDF_STORAGE_PATH, exist_ok=True)
+    
+    # Caminho completo do arquivo
+    path_pdf = os.path.join(settings.PDF_STORAGE_PATH, f"{hash_pdf}.pdf")
+    
+    # Verificação se o PDF é inédito
+    if os.path.exists(path_pdf) and not reprocessar:
+        print(f"ℹ️ PDF já processado: {nome}")
+        return None
+    
+    print(f"💾 Salvando PDF inédito: {nome}")
+    with open(path_pdf, "wb") as f:
+        f.write(conteudo)
+    
+    return extrair_pdf(nome, path_pdf, hash_pdf, conteudo)
+
 def buscar_e_processar_emails() -> List[Dict[str, Any]]:
     """
     Busca emails com anexos PDF e processa faturas automaticamente.
@@ -66,88 +209,28 @@ def buscar_e_processar_emails() -> List[Dict[str, Any]]:
         return []
     
     try:
-        # Busca TODOS os emails (lógica que funciona)
+        # Processa apenas os últimos 10 emails, do mais recente para o mais antigo
         print("🔍 Buscando emails na caixa de entrada...")
-        status, mensagens = mail.search(None, 'ALL')
-        
-        if status != "OK":
-            print(f"❌ Erro ao buscar emails: {status}")
-            return []
-        
-        email_ids = mensagens[0].split()
-        print(f"📧 Encontrados {len(email_ids)} emails na caixa de entrada")
-        
-        # Processa apenas os últimos 10 emails (lógica que funciona)
-        emails_para_processar = reversed(email_ids[-10:])
-        print(f"📋 Processando os últimos 10 emails")
+        uids = listar_uids(mail, limite_inicial=10)
+        print(f"📋 Processando os últimos {len(uids)} emails")
         
         dados_faturas = []
         
-        for eid in emails_para_processar:
+        for uid in reversed(uids):
             try:
-                print(f"📬 Processando email ID: {eid}")
-                
-                # Busca o email específico
-                _, msg_data = mail.fetch(eid, "(RFC822)")
-                msg = email.message_from_bytes(msg_data[0][1])
-                
-                # Obtém informações do email
-                subject = decode_header(msg["subject"])[0][0] if msg["subject"] else "Sem assunto"
-                if isinstance(subject, bytes):
-                    subject = subject.decode("utf-8", errors="ignore")
-                
-                from_addr = msg["from"] or "Remetente desconhecido"
-                print(f"📧 Assunto: {subject}")
-                print(f"👤 De: {from_addr}")
-                
-                # Processa anexos PDF (lógica que funciona)
-                for part in msg.walk():
-                    if part.get_content_type() == "application/pdf":
-                        nome_anexo = part.get_filename()
-                        if nome_anexo:
-                            # Decodifica o nome do arquivo
-                            nome, charset = decode_header(nome_anexo)[0]
-                            if isinstance(nome, bytes):
-                                nome = nome.decode(charset or "utf-8")
-                            
-                            print(f"📎 Anexo PDF encontrado: {nome}")
-                            
-                            # Obtém o conteúdo do PDF
-                            conteudo = part.get_payload(decode=True)
-                            hash_pdf = gerar_hash(conteudo)
-                            
-                            # Cria diretório se não existir
-                            os.makedirs(settings.PDF_STORAGE_PATH, exist_ok=True)
-                            
-                            # Caminho completo do arquivo
-                            path_pdf = os.path.join(settings.PDF_STORAGE_PATH, f"{hash_pdf}.pdf")
-                            
-                            # Verificação se o PDF é inédito
-                            if not os.path.exists(path_pdf):
-                                print(f"💾 Salvando PDF inédito: {nome}")
-                                
-                                # Salva o PDF
-                                with open(path_pdf, "wb") as f:
-                                    f.write(conteudo)
-                                
-                                # Chama a função de extração do pdf_parser.py
-                                from .pdf_parser import extrair_dados_fatura_pdf
-                                dados_extraidos = extrair_dados_fatura_pdf(path_pdf)
-                                
-                                if dados_extraidos:
-                                    dados_extraidos['url_pdf'] = path_pdf
-                                    dados_faturas.append(dados_extraidos)
-                                    print(f"✅ Fatura extraída: {dados_extraidos.get('nome_cliente', 'N/A')}")
-                                    print(f"   📊 Dados: {dados_extraidos}")
-                                else:
-                                    print(f"⚠️ Falha ao extrair dados da fatura: {nome}")
-                            else:
-                                print(f"ℹ️ PDF já processado: {nome}")
+                for nome, conteudo in anexos_pdf(mail, uid):
+                    try:
+                        dados_extraidos = processar_anexo(nome, conteudo)
+                    except ErroExtracao as e:
+                        print(f"⚠️ {e}")
+                        continue
+                    if dados_extraidos:
+                        dados_faturas.append(dados_extraidos)
                 
                 print("-" * 60)
                 
             except Exception as e:
-                print(f"❌ Erro ao processar email {eid}: {e}")
+                print(f"❌ Erro ao processar email {uid}: {e}")
                 import traceback
                 traceback.print_exc()
                 continue
@@ -166,11 +249,15 @@ def buscar_e_processar_emails() -> List[Dict[str, Any]]:
         return []
     
     finally:
-        try:
-            mail.logout()
-            print("🔌 Conexão com Gmail fechada")
-        except:
-            pass
+        desconectar_email(mail)
+
+def desconectar_email(mail: imaplib.IMAP4_SSL) -> None:
+    """Encerra a sessão IMAP, ignorando falhas"""
+    try:
+        mail.logout()
+        print("🔌 Conexão com Gmail fechada")
+    except:
+        pass
 
 if __name__ == "__main__":
     # Teste da funcionalidade
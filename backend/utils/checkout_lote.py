@@ -0,0 +1,130 @@
+"""
+Pré-geração em lote dos links de pagamento do Stripe
+Cria, em paralelo e dentro do limite de taxa do Stripe, o Payment Link de
+cada fatura pendente que ainda não tem um link ativo com o valor atual. Os
+links não expiram (cada clique abre a própria sessão de checkout), então
+podem ser enviados com as faturas e ficam em links_pagamento, de onde
+GET /faturas/{id}/link-pagamento os devolve sem chamar o Stripe.
+
+Uso: python -m backend.utils.checkout_lote [--threads N]
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+import stripe
+from sqlalchemy.orm import Session
+
+# Importações com fallback para Vercel
+try:
+    from ..config import settings
+    from ..crud import FaturaCRUD
+    from .limites import LimitadorTaxa, executar_com_retentativas
+    from .stripe_http import configurar_stripe
+    from .stripe_checkout import criar_link_pagamento, link_reaproveitavel, valor_em_centavos
+except ImportError:
+    from config import settings
+    from crud import FaturaCRUD
+    from utils.limites import LimitadorTaxa, executar_com_retentativas
+    from utils.stripe_http import configurar_stripe
+    from utils.stripe_checkout import criar_link_pagamento, link_reaproveitavel, valor_em_centavos
+
+# Erros do Stripe que podem ser repetidos (as chaves de idempotência evitam links duplicados)
+ERROS_TEMPORARIOS = (stripe.RateLimitError, stripe.APIConnectionError, stripe.APIError)
+
+# Links gravados por commit
+LOTE_GRAVACAO = 200
+
+def erro_temporario(erro: BaseException) -> bool:
+    """APIError só é repetido quando o Stripe respondeu 5xx (ou não respondeu)"""
+    if isinstance(erro, stripe.APIError):
+        return erro.http_status is None or erro.http_status >= 500
+    return True
+
+def faturas_sem_link(db: Session) -> List[tuple]:
+    """
+    Faturas pendentes (linha, valor em centavos, link a desativar) sem link
+    ativo com o valor atual
+    """
+    pendentes = []
+    for linha in FaturaCRUD.get_faturas_pendentes_link(db):
+        centavos = valor_em_centavos(linha.valor_total)
+        registro = linha if linha.payment_link_id is not None else None
+        if not link_reaproveitavel(registro, centavos):
+            anterior = linha.payment_link_id if registro is not None and linha.ativo else None
+            pendentes.append((linha, centavos, anterior))
+    return pendentes
+
+def pre_gerar_checkouts(
+    db: Session,
+    threads: int = settings.CHECKOUT_PREGEN_WORKERS,
+    limitador: Optional[LimitadorTaxa] = None
+) -> Dict[str, Any]:
+    """
+    Cria os links de pagamento que faltam para as faturas pendentes.
+
+    As chamadas ao Stripe (até três por link: desativar o anterior, preço e
+    link) rodam em um pool de `threads`, passando todas pelo mesmo limitador
+    de taxa; erros temporários são repetidos com backoff, chamada a chamada.
+    As gravações ficam na thread que chamou (a sessão do banco não é
+    compartilhada), em lotes de LOTE_GRAVACAO.
+
+    Returns:
+        Resumo com pendentes, criados, falhas (fatura_id e erro) e duração
+    """
+    inicio = time.perf_counter()
+    pendentes = faturas_sem_link(db)
+    db.commit()  # não segura a conexão durante as chamadas ao Stripe
+    limitador = limitador or LimitadorTaxa(settings.STRIPE_RATE_LIMIT_PER_SECOND)
+    resumo: Dict[str, Any] = {"pendentes": len(pendentes), "criados": 0, "falhas": []}
+
+    chamar = partial(
+        executar_com_retentativas,
+        tentativas=settings.STRIPE_MAX_RETRIES,
+        repetir_em=ERROS_TEMPORARIOS,
+        deve_repetir=erro_temporario,
+        limitador=limitador
+    )
+
+    lote: List[Dict[str, Any]] = []
+    with ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix="checkout") as executor:
+        futuros = {
+            executor.submit(criar_link_pagamento, linha, centavos, anterior, chamar): linha.id
+            for linha, centavos, anterior in pendentes
+        }
+        for futuro in as_completed(futuros):
+            try:
+                lote.append(futuro.result())
+            except Exception as e:
+                print(f"❌ Erro ao criar link de pagamento da fatura {futuros[futuro]}: {e}")
+                resumo["falhas"].append({"fatura_id": futuros[futuro], "erro": str(e)})
+            if len(lote) >= LOTE_GRAVACAO:
+                FaturaCRUD.salvar_links_pagamento(db, lote)
+                resumo["criados"] += len(lote)
+                lote = []
+    FaturaCRUD.salvar_links_pagamento(db, lote)
+    resumo["criados"] += len(lote)
+
+    resumo["segundos"] = round(time.perf_counter() - inicio, 3)
+    print(
+        f"💳 Pré-geração de links de pagamento: {resumo['criados']} de {resumo['pendentes']} links criados "
+        f"em {resumo['segundos']}s ({len(resumo['falhas'])} falhas)"
+    )
+    return resumo
+
+if __name__ == "__main__":
+    try:
+        from ..database import SessionLocal
+    except ImportError:
+        from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Cria os links de pagamento das faturas pendentes")
+    parser.add_argument("--threads", type=int, default=settings.CHECKOUT_PREGEN_WORKERS)
+    args = parser.parse_args()
+
+    configurar_stripe()
+    with SessionLocal() as db:
+        print(pre_gerar_checkouts(db, threads=args.threads))
@@ -0,0 +1,82 @@
+"""
+Exportação de faturas em NDJSON e CSV para o Sistema de Gestão de Faturas
+Gera o arquivo em blocos a partir de um cursor do banco, sem materializar a lista
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, Sequence
+
+# Colunas exportadas, na ordem do cabeçalho CSV
+COLUNAS_EXPORTACAO = (
+    "id",
+    "nome_cliente",
+    "documento_cliente",
+    "email_cliente",
+    "numero_instalacao",
+    "instalacao_id",
+    "valor_total",
+    "mes_referencia",
+    "data_vencimento",
+    "url_pdf",
+    "ja_pago",
+    "data_criacao",
+    "data_ultima_atualizacao",
+)
+
+# Tipos de mídia por formato suportado
+FORMATOS_EXPORTACAO = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Linhas acumuladas antes de enviar um bloco ao cliente
+LINHAS_POR_BLOCO = 500
+
+def _valor_json(valor: Any) -> Any:
+    """Converte datas para ISO 8601 na serialização JSON"""
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def gerar_ndjson(linhas: Iterable[Sequence[Any]], colunas: Sequence[str] = COLUNAS_EXPORTACAO) -> Iterator[bytes]:
+    """
+    Gera blocos NDJSON (um objeto JSON por linha) a partir de tuplas de valores.
+    """
+    bloco = []
+    for linha in linhas:
+        bloco.append(json.dumps(dict(zip(colunas, linha)), default=_valor_json, ensure_ascii=False))
+        if len(bloco) >= LINHAS_POR_BLOCO:
+            yield ("\n".join(bloco) + "\n").encode("utf-8")
+            bloco = []
+    if bloco:
+        yield ("\n".join(bloco) + "\n").encode("utf-8")
+
+def gerar_csv(linhas: Iterable[Sequence[Any]], colunas: Sequence[str] = COLUNAS_EXPORTACAO) -> Iterator[bytes]:
+    """
+    Gera blocos CSV (com cabeçalho) a partir de tuplas de valores.
+    O cabeçalho é enviado imediatamente, antes da primeira linha do banco.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(colunas)
+    yield buffer.getvalue().encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate()
+    
+    pendentes = 0
+    for linha in linhas:
+        escritor.writerow([
+            valor.isoformat() if isinstance(valor, (datetime, date)) else valor
+            for valor in linha
+        ])
+        pendentes += 1
+        if pendentes >= LINHAS_POR_BLOCO:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pendentes = 0
+    if pendentes:
+        yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,132 @@
+"""
+Importação em lote de faturas a partir de NDJSON ou CSV
+Lê o corpo da requisição em streaming e entrega os registros em blocos validados
+"""
+
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from pydantic import ValidationError
+
+# Importações com fallback para Vercel
+try:
+    from ..schemas import FaturaCreate
+    from ..crud import competencia_de_referencia
+except ImportError:
+    from schemas import FaturaCreate
+    from crud import competencia_de_referencia
+
+# Registros validados e gravados por vez
+REGISTROS_POR_BLOCO = 500
+
+async def _linhas(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Quebra o corpo recebido em linhas de texto, sem carregá-lo inteiro"""
+    resto = b""
+    async for pedaco in stream:
+        resto += pedaco
+        *completas, resto = resto.split(b"\n")
+        for linha in completas:
+            yield linha.decode("utf-8-sig").rstrip("\r")
+    if resto:
+        yield resto.decode("utf-8-sig").rstrip("\r")
+
+async def ler_registros(stream: AsyncIterator[bytes], formato: str) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Lê registros NDJSON ou CSV do stream.
+    
+    Returns:
+        Iterador assíncrono de (número do registro, dicionário ou mensagem de erro)
+    """
+    numero = 0
+    
+    if formato == "ndjson":
+        async for linha in _linhas(stream):
+            if not linha.strip():
+                continue
+            numero += 1
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError as e:
+                yield numero, f"JSON inválido: {e.msg}"
+                continue
+            if not isinstance(registro, dict):
+                yield numero, "Cada linha deve conter um objeto JSON"
+                continue
+            yield numero, registro
+        return
+    
+    # CSV: acumula linhas até fechar as aspas, para aceitar campos com quebra de linha
+    cabecalho = None
+    pendente = ""
+    async for linha in _linhas(stream):
+        pendente = f"{pendente}\n{linha}" if pendente else linha
+        if pendente.count('"') % 2:
+            continue
+        texto, pendente = pendente, ""
+        if not texto.strip():
+            continue
+        valores = next(csv.reader(io.StringIO(texto)))
+        if cabecalho is None:
+            cabecalho = [coluna.strip() for coluna in valores]
+            continue
+        numero += 1
+        if len(valores) != len(cabecalho):
+            yield numero, f"Esperadas {len(cabecalho)} colunas, recebidas {len(valores)}"
+            continue
+        yield numero, {
+            coluna: (valor if valor != "" else None)
+            for coluna, valor in zip(cabecalho, valores)
+        }
+    if pendente:
+        yield numero + 1, "Aspas não fechadas no final do arquivo"
+
+def validar_registro(registro: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida um registro contra FaturaCreate e exige mês de referência reconhecível.
+    
+    Raises:
+        ValueError: Com a descrição dos campos inválidos
+    """
+    try:
+        fatura = FaturaCreate.model_validate(registro)
+    except ValidationError as e:
+        erros = [
+            f"{'.'.join(str(parte) for parte in erro['loc'])}: {erro['msg']}"
+            for erro in e.errors()
+        ]
+        raise ValueError("; ".join(erros))
+    
+    dados = fatura.model_dump()
+    if not competencia_de_referencia(dados["mes_referencia"]):
+        raise ValueError(f"mes_referencia: formato não reconhecido ({dados['mes_referencia']})")
+    return dados
+
+async def ler_blocos(
+    stream: AsyncIterator[bytes],
+    formato: str,
+    tamanho: int = REGISTROS_POR_BLOCO
+) -> AsyncIterator[Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]]:
+    """
+    Agrupa os registros em blocos validados.
+    
+    Returns:
+        Iterador assíncrono de (registros válidos com seu número, erros por registro)
+    """
+    validos, erros = [], []
+    async for numero, registro in ler_registros(stream, formato):
+        if isinstance(registro, str):
+            erros.append({"linha": numero, "erro": registro})
+        else:
+            try:
+                validos.append((numero, validar_registro(registro)))
+            except ValueError as e:
+                erros.append({"linha": numero, "erro": str(e)})
+        
+        if len(validos) + len(erros) >= tamanho:
+            yield validos, erros
+            validos, erros = [], []
+    
+    if validos or erros:
+        yield validos, erros
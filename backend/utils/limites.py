@@ -0,0 +1,74 @@
+"""
+Limite de taxa e retentativas para chamadas a serviços externos
+Usados pelos jobs em lote que falam com o Stripe a partir de várias threads
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Optional, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+class LimitadorTaxa:
+    """
+    Balde de fichas compartilhado entre threads: no máximo `taxa` chamadas
+    por segundo em regime, com rajadas de até `rajada` chamadas.
+    """
+
+    def __init__(self, taxa: float, rajada: Optional[int] = None):
+        self.taxa = taxa
+        self.rajada = rajada or max(int(taxa), 1)
+        self._fichas = float(self.rajada)
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self) -> float:
+        """
+        Bloqueia até haver uma ficha disponível.
+
+        Returns:
+            Tempo esperado, em segundos
+        """
+        with self._lock:
+            agora = time.monotonic()
+            self._fichas = min(self.rajada, self._fichas + (agora - self._ultima) * self.taxa)
+            self._ultima = agora
+            # A ficha é reservada já; quem chega depois espera na fila
+            self._fichas -= 1
+            espera = -self._fichas / self.taxa if self._fichas < 0 else 0.0
+        if espera:
+            time.sleep(espera)
+        return espera
+
+def espera_retentativa(tentativa: int, base: float, maximo: float) -> float:
+    """Backoff exponencial com jitter completo: sorteio entre 0 e base * 2^tentativa"""
+    return random.uniform(0, min(maximo, base * (2 ** tentativa)))
+
+def executar_com_retentativas(
+    funcao: Callable[[], T],
+    tentativas: int,
+    repetir_em: Tuple[Type[BaseException], ...],
+    base: float = 0.5,
+    maximo: float = 8.0,
+    deve_repetir: Optional[Callable[[BaseException], bool]] = None,
+    limitador: Optional[LimitadorTaxa] = None
+) -> T:
+    """
+    Executa `funcao`, repetindo com backoff quando ela levanta uma das
+    exceções de `repetir_em` (e `deve_repetir`, se informado, concordar).
+    Cada tentativa consome uma ficha do limitador.
+
+    Raises:
+        A última exceção, quando as tentativas se esgotam ou o erro não é repetível
+    """
+    for tentativa in range(tentativas):
+        if limitador is not None:
+            limitador.adquirir()
+        try:
+            return funcao()
+        except repetir_em as e:
+            if tentativa + 1 >= tentativas or (deve_repetir is not None and not deve_repetir(e)):
+                raise
+            time.sleep(espera_retentativa(tentativa, base, maximo))
+    raise ValueError("tentativas deve ser pelo menos 1")
@@ -0,0 +1,82 @@
+"""
+Serialização rápida de listagens de faturas para o Sistema de Gestão de Faturas
+Seleciona só as colunas do FaturaSchema como tuplas e codifica direto em JSON,
+sem instanciar objetos ORM nem validar cada linha com Pydantic
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, Optional, Sequence, Tuple
+
+from fastapi import Response
+
+# orjson é opcional: sem ele, usa o json da biblioteca padrão
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Importações com fallback para Vercel
+try:
+    from ..models import Fatura
+    from ..schemas import FaturaSchema
+except ImportError:
+    from models import Fatura
+    from schemas import FaturaSchema
+
+# Campos na mesma ordem da resposta do FaturaSchema
+CAMPOS_FATURA = tuple(FaturaSchema.model_fields)
+
+# Colunas selecionadas (uma por campo do schema)
+COLUNAS_FATURA = tuple(getattr(Fatura, campo) for campo in CAMPOS_FATURA)
+
+def campos_solicitados(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    Converte o parâmetro fields= (campos separados por vírgula) nos campos da
+    resposta, na ordem do schema. O id é sempre incluído; sem fields, todos.
+    
+    Raises:
+        ValueError: Se algum campo não existir no FaturaSchema
+    """
+    if not fields:
+        return CAMPOS_FATURA
+    pedidos = {campo.strip() for campo in fields.split(",") if campo.strip()}
+    desconhecidos = sorted(pedidos.difference(CAMPOS_FATURA))
+    if desconhecidos:
+        raise ValueError(f"Campos desconhecidos: {', '.join(desconhecidos)}")
+    return tuple(campo for campo in CAMPOS_FATURA if campo == "id" or campo in pedidos)
+
+def colunas_de(campos: Sequence[str]) -> Tuple[Any, ...]:
+    """Colunas de Fatura correspondentes aos campos"""
+    return tuple(getattr(Fatura, campo) for campo in campos)
+
+class RespostaJSON(Response):
+    """Resposta com corpo JSON já codificado"""
+    media_type = "application/json"
+
+def _valor_json(valor: Any) -> Any:
+    """Converte datas para ISO 8601 (fallback sem orjson)"""
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def _codificar(valor: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(valor)
+    return json.dumps(valor, default=_valor_json, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def codificar_linhas(linhas: Iterable[Sequence[Any]], campos: Sequence[str] = CAMPOS_FATURA) -> bytes:
+    """Codifica as linhas (tuplas na ordem de campos) como um array JSON de objetos"""
+    return _codificar([dict(zip(campos, linha)) for linha in linhas])
+
+def resposta_linhas(
+    linhas: Iterable[Sequence[Any]],
+    campos: Sequence[str] = CAMPOS_FATURA,
+    headers: dict = None
+) -> RespostaJSON:
+    """Resposta pré-codificada para uma listagem de faturas"""
+    return RespostaJSON(content=codificar_linhas(linhas, campos), headers=headers)
+
+def resposta_linha(linha: Sequence[Any], campos: Sequence[str], headers: dict = None) -> RespostaJSON:
+    """Resposta pré-codificada para uma única fatura"""
+    return RespostaJSON(content=_codificar(dict(zip(campos, linha))), headers=headers)
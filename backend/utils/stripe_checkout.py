@@ -0,0 +1,144 @@
+"""
+Sessões de checkout e Payment Links do Stripe para o Sistema de Gestão de Faturas
+Reaproveita a sessão aberta de cada fatura e cria as novas com chave de
+idempotência, para que cliques repetidos não gerem sessões órfãs. Os
+Payment Links, que não expiram, são os enviados junto com as faturas
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import stripe
+
+# Importações com fallback para Vercel
+try:
+    from ..config import settings
+except ImportError:
+    from config import settings
+
+# O Stripe aceita expires_at entre 30 minutos e 24 horas após a criação. A
+# sessão expira mais de uma janela depois de criada, então a janela mínima tem
+# uma folga sobre os 30 minutos para a latência da chamada e a diferença de
+# relógio com o Stripe (com 30 exatos, uma sessão criada no fim da janela
+# ficaria a instantes do limite e seria recusada)
+FOLGA_EXPIRACAO_MINUTOS = 5
+JANELA = timedelta(minutes=min(max(settings.CHECKOUT_SESSION_WINDOW_MINUTES, 30 + FOLGA_EXPIRACAO_MINUTOS), 720))
+
+# Sessões perto de expirar não são reaproveitadas (o cliente precisa de tempo para pagar)
+MARGEM_REAPROVEITAMENTO = timedelta(minutes=10)
+
+def agora_utc() -> datetime:
+    """Momento atual em UTC, sem fuso (como gravado no banco)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def janela_atual(agora: datetime) -> Tuple[datetime, datetime]:
+    """
+    Início da janela corrente e a expiração das sessões criadas nela.
+    Dentro da mesma janela os parâmetros enviados ao Stripe são idênticos,
+    requisito para repetir a mesma chave de idempotência.
+    """
+    epoca = datetime(1970, 1, 1)
+    inicio = epoca + ((agora - epoca) // JANELA) * JANELA
+    return inicio, inicio + 2 * JANELA
+
+def valor_em_centavos(valor_total: float) -> int:
+    """Converte o valor da fatura para centavos (arredondando, não truncando)"""
+    return int(round(valor_total * 100))
+
+def chave_idempotencia(fatura_id: int, centavos: int, inicio_janela: datetime) -> str:
+    """Chave derivada da fatura, do valor e da janela de criação"""
+    return f"checkout-fatura-{fatura_id}-{centavos}-{int(inicio_janela.replace(tzinfo=timezone.utc).timestamp())}"
+
+def sessao_reaproveitavel(registro: Optional[Any], centavos: int, agora: Optional[datetime] = None) -> bool:
+    """Indica se a sessão registrada ainda está aberta, válida e com o mesmo valor"""
+    if registro is None:
+        return False
+    agora = agora or agora_utc()
+    return (
+        registro.status == "open"
+        and registro.valor_centavos == centavos
+        and registro.expira_em - MARGEM_REAPROVEITAMENTO > agora
+    )
+
+def criar_sessao_checkout(fatura: Any, centavos: int, agora: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Cria a sessão de checkout no Stripe e retorna os dados para registro.
+    Repetições na mesma janela (cliques simultâneos, retentativas) recebem
+    a mesma sessão graças à chave de idempotência.
+    """
+    inicio, expira_em = janela_atual(agora or agora_utc())
+    session = stripe.checkout.Session.create(
+        payment_method_types=['card'],
+        line_items=[{
+            'price_data': {
+                'currency': 'brl',
+                'product_data': {
+                    'name': f"Fatura de {fatura.mes_referencia}",
+                },
+                'unit_amount': centavos,
+            },
+            'quantity': 1,
+        }],
+        mode='payment',
+        success_url=f"{settings.FRONTEND_SUCCESS_URL}?session_id={{CHECKOUT_SESSION_ID}}",
+        cancel_url=settings.FRONTEND_CANCEL_URL,
+        metadata={"fatura_id": str(fatura.id)},
+        expires_at=int(expira_em.replace(tzinfo=timezone.utc).timestamp()),
+        idempotency_key=chave_idempotencia(fatura.id, centavos, inicio)
+    )
+    return {
+        "fatura_id": fatura.id,
+        "session_id": session.id,
+        "checkout_url": session.url,
+        "valor_centavos": centavos,
+        "expira_em": expira_em,
+        "status": session.status or "open"
+    }
+
+def link_reaproveitavel(registro: Optional[Any], centavos: int) -> bool:
+    """Indica se o Payment Link registrado ainda está ativo e com o mesmo valor"""
+    return registro is not None and bool(registro.ativo) and registro.valor_centavos == centavos
+
+def criar_link_pagamento(
+    fatura: Any,
+    centavos: int,
+    link_anterior: Optional[str] = None,
+    chamar: Callable[[Callable[[], Any]], Any] = lambda chamada: chamada()
+) -> Dict[str, Any]:
+    """
+    Cria o Payment Link da fatura no Stripe e retorna os dados para registro.
+
+    O link aceita um único pagamento e copia o fatura_id dos metadados para
+    cada sessão de checkout que abrir, então o webhook marca a fatura como
+    paga pelo mesmo caminho das sessões criadas pelo endpoint. O link
+    anterior (valor desatualizado) é desativado antes. As chaves de
+    idempotência são derivadas da fatura, do valor e do link substituído:
+    repetições devolvem o mesmo preço e o mesmo link. Cada chamada ao Stripe
+    passa por `chamar` (ex.: limite de taxa e retentativas).
+    """
+    if link_anterior:
+        chamar(lambda: stripe.PaymentLink.modify(link_anterior, active=False))
+    preco = chamar(lambda: stripe.Price.create(
+        currency='brl',
+        unit_amount=centavos,
+        product_data={'name': f"Fatura de {fatura.mes_referencia}"},
+        idempotency_key=f"preco-fatura-{fatura.id}-{centavos}"
+    ))
+    link = chamar(lambda: stripe.PaymentLink.create(
+        line_items=[{'price': preco.id, 'quantity': 1}],
+        payment_method_types=['card'],
+        metadata={"fatura_id": str(fatura.id)},
+        restrictions={'completed_sessions': {'limit': 1}},
+        after_completion={
+            'type': 'redirect',
+            'redirect': {'url': f"{settings.FRONTEND_SUCCESS_URL}?session_id={{CHECKOUT_SESSION_ID}}"}
+        },
+        idempotency_key=f"link-fatura-{fatura.id}-{centavos}-{link_anterior or 'novo'}"
+    ))
+    return {
+        "fatura_id": fatura.id,
+        "payment_link_id": link.id,
+        "url": link.url,
+        "valor_centavos": centavos,
+        "ativo": True
+    }
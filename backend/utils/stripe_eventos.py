@@ -0,0 +1,175 @@
+"""
+Processamento dos eventos do webhook do Stripe
+O webhook só grava o evento na caixa de entrada (stripe_eventos) e responde;
+este processador aplica os pendentes em lotes, juntando todos os
+checkout.session.completed do lote em um único UPDATE de faturas. Roda em
+segundo plano ou, sem processo de longa duração (Vercel), na própria
+requisição do webhook e pelo cron de /stripe/eventos/processar
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+# Importações com fallback para Vercel
+try:
+    from ..config import settings
+    from ..crud import FaturaCRUDAsync
+    from ..database import get_async_sessionmaker
+    from ..metricas import Contadores
+except ImportError:
+    from config import settings
+    from crud import FaturaCRUDAsync
+    from database import get_async_sessionmaker
+    from metricas import Contadores
+
+class ProcessadorEventosStripe:
+    """
+    Tarefa asyncio que consome a caixa de entrada. É acordada pelo webhook
+    e, na falta de sinal, verifica a cada `intervalo` segundos (eventos de
+    outras instâncias ou que falharam e voltaram para 'pendente').
+    """
+
+    def __init__(self, lote: int, intervalo: float, max_tentativas: int, timeout: int):
+        self.lote = lote
+        self.intervalo = intervalo
+        self.max_tentativas = max_tentativas
+        self.timeout = timeout
+        self.contadores = Contadores("recebidos", "duplicados", "processados", "falhas", "lotes", "lotes_isolados")
+        self._sinal: Optional[asyncio.Event] = None
+        self._tarefa: Optional[asyncio.Task] = None
+
+    def iniciar(self) -> None:
+        """Inicia a tarefa no event loop corrente (se ainda não estiver rodando)"""
+        if self._tarefa is None or self._tarefa.done():
+            self._sinal = asyncio.Event()
+            self._tarefa = asyncio.get_running_loop().create_task(self._executar())
+
+    def notificar(self, novo: bool = True) -> None:
+        """Chamado pelo webhook após gravar um evento"""
+        self.contadores.incrementar("recebidos" if novo else "duplicados")
+        self.iniciar()
+        self._sinal.set()
+
+    async def processar_agora(self, novo: bool = True) -> int:
+        """
+        Versão de notificar sem tarefa em segundo plano (Vercel): esvazia a
+        caixa de entrada na própria requisição. Uma falha aqui não perde o
+        evento, que continua pendente para o cron.
+        """
+        self.contadores.incrementar("recebidos" if novo else "duplicados")
+        try:
+            return await self.drenar()
+        except Exception as e:
+            print(f"❌ Erro ao processar eventos do Stripe: {e}")
+            return 0
+
+    async def parar(self) -> None:
+        """Cancela a tarefa (encerramento da aplicação)"""
+        if self._tarefa is not None and not self._tarefa.done():
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+        self._tarefa = None
+
+    async def _executar(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._sinal.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._sinal.clear()
+            try:
+                await self.drenar()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Erro no processador de eventos do Stripe: {e}")
+
+    async def drenar(self) -> int:
+        """Esvazia a caixa de entrada em lotes; retorna o número de eventos lidos"""
+        total = 0
+        while True:
+            lidos = await self.processar_lote()
+            total += lidos
+            if lidos < self.lote:
+                return total
+
+    async def _aplicar(self, db: Any, eventos: List[Any]) -> None:
+        """Aplica os efeitos dos eventos e os marca como processados (um commit)"""
+        fatura_ids: List[int] = []
+        sessoes: Dict[str, List[str]] = {"complete": [], "expired": []}
+        for evento in eventos:
+            objeto = json.loads(evento.payload)
+            if evento.tipo == "checkout.session.completed":
+                fatura_id = (objeto.get("metadata") or {}).get("fatura_id")
+                if fatura_id and str(fatura_id).isdigit():
+                    fatura_ids.append(int(fatura_id))
+                else:
+                    print(f"⚠️ Evento {evento.event_id} sem fatura_id válido, ignorado")
+                sessoes["complete"].append(objeto.get("id"))
+            elif evento.tipo == "checkout.session.expired":
+                sessoes["expired"].append(objeto.get("id"))
+
+        if fatura_ids:
+            resultado = await FaturaCRUDAsync.mark_paid_many(db, fatura_ids)
+            for fatura_id in resultado["atualizadas"]:
+                print(f"✅ Pagamento concluído para a fatura ID: {fatura_id}")
+            for fatura_id in resultado["nao_encontradas"]:
+                print(f"⚠️ Pagamento recebido para fatura inexistente: {fatura_id}")
+        for status, session_ids in sessoes.items():
+            await FaturaCRUDAsync.atualizar_checkout_sessoes(db, [s for s in session_ids if s], status)
+        await FaturaCRUDAsync.marcar_eventos_stripe(db, [evento.event_id for evento in eventos], "processado")
+        self.contadores.incrementar("processados", len(eventos))
+
+    async def processar_lote(self) -> int:
+        """
+        Reivindica e aplica um lote de eventos pendentes. Os efeitos são
+        idempotentes (marcar como paga), então reprocessar um evento após uma
+        falha é seguro. Se o lote falhar, os eventos são aplicados um a um,
+        para que só o evento problemático conte a tentativa e os demais não
+        fiquem presos atrás dele.
+
+        Returns:
+            Número de eventos lidos da caixa de entrada
+        """
+        async with get_async_sessionmaker()() as db:
+            eventos = await FaturaCRUDAsync.reivindicar_eventos_stripe(db, self.lote, self.timeout)
+            if not eventos:
+                return 0
+
+            try:
+                await self._aplicar(db, eventos)
+            except Exception as e:
+                print(f"❌ Erro ao aplicar {len(eventos)} eventos do Stripe: {e}")
+                await db.rollback()
+                if len(eventos) == 1:
+                    await self._registrar_falha(db, eventos, e)
+                else:
+                    self.contadores.incrementar("lotes_isolados")
+                    for evento in eventos:
+                        try:
+                            await self._aplicar(db, [evento])
+                        except Exception as erro:
+                            print(f"❌ Erro ao aplicar o evento {evento.event_id} do Stripe: {erro}")
+                            await db.rollback()
+                            await self._registrar_falha(db, [evento], erro)
+
+            self.contadores.incrementar("lotes")
+            return len(eventos)
+
+    async def _registrar_falha(self, db: Any, eventos: List[Any], erro: BaseException) -> None:
+        """Devolve os eventos para 'pendente' (ou 'erro', esgotadas as tentativas)"""
+        await FaturaCRUDAsync.marcar_eventos_stripe(
+            db, [evento.event_id for evento in eventos], "erro", erro=str(erro), max_tentativas=self.max_tentativas
+        )
+        self.contadores.incrementar("falhas", len(eventos))
+
+processador_eventos_stripe = ProcessadorEventosStripe(
+    lote=settings.STRIPE_INBOX_BATCH_SIZE,
+    intervalo=settings.STRIPE_INBOX_POLL_SECONDS,
+    max_tentativas=settings.STRIPE_INBOX_MAX_ATTEMPTS,
+    timeout=settings.STRIPE_INBOX_CLAIM_TIMEOUT_SECONDS
+)
@@ -0,0 +1,99 @@
+"""
+Cliente HTTP do Stripe compartilhado pelo processo
+Uma única sessão requests com pool de conexões keep-alive (sem novo
+handshake TLS a cada chamada), timeouts de conexão e de leitura, retentativas
+de rede com backoff e jitter (feitas pela biblioteca do Stripe) e latência
+por operação
+"""
+
+import re
+import threading
+import time
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+# Importações com fallback para Vercel
+try:
+    from ..config import settings
+    from ..metricas import Contadores, Histograma
+except ImportError:
+    from config import settings
+    from metricas import Contadores, Histograma
+
+# IDs de objetos do Stripe nos caminhos (cs_test_..., evt_..., pi_...)
+_ID_STRIPE = re.compile(r"^[a-z]+_[A-Za-z0-9_]+$")
+
+def nome_operacao(metodo: str, url: str) -> str:
+    """Operação da chamada, com os IDs trocados por {id} (ex.: GET /v1/checkout/sessions/{id})"""
+    partes = ["{id}" if _ID_STRIPE.match(parte) else parte for parte in urlsplit(url).path.split("/") if parte]
+    return f"{metodo.upper()} /{'/'.join(partes)}"
+
+class ClienteHTTPStripe(stripe.RequestsClient):
+    """
+    RequestsClient com uma sessão compartilhada entre as threads (o padrão da
+    biblioteca abre uma sessão, e conexões, por thread) e métricas por operação.
+    """
+
+    def __init__(self, timeout_conexao: float, timeout_leitura: float, conexoes: int):
+        sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=conexoes)
+        sessao.mount("https://", adaptador)
+        sessao.mount("http://", adaptador)
+        super().__init__(timeout=(timeout_conexao, timeout_leitura), session=sessao)
+        self.contadores = Contadores("chamadas", "tentativas", "erros")
+        self._latencias: Dict[str, Histograma] = {}
+        self._lock = threading.Lock()
+
+    def _histograma(self, operacao: str) -> Histograma:
+        with self._lock:
+            if operacao not in self._latencias:
+                self._latencias[operacao] = Histograma()
+            return self._latencias[operacao]
+
+    def request(self, method, url, headers, post_data=None):
+        # Chamado uma vez por tentativa
+        self.contadores.incrementar("tentativas")
+        return super().request(method, url, headers, post_data)
+
+    def request_with_retries(self, method, url, headers, post_data=None, *args, **kwargs):
+        # Uma operação, incluindo as retentativas e as esperas entre elas
+        inicio = time.perf_counter()
+        erro = True
+        try:
+            resposta = super().request_with_retries(method, url, headers, post_data, *args, **kwargs)
+            erro = resposta[1] >= 400
+            return resposta
+        finally:
+            self.contadores.incrementar("chamadas")
+            if erro:
+                self.contadores.incrementar("erros")
+            self._histograma(nome_operacao(method, url)).observar((time.perf_counter() - inicio) * 1000)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Contadores e latência (ms) por operação"""
+        contadores = self.contadores.to_dict()
+        with self._lock:
+            latencias = dict(self._latencias)
+        return {
+            **contadores,
+            "retentativas": contadores["tentativas"] - contadores["chamadas"],
+            "operacoes": {operacao: histograma.to_dict() for operacao, histograma in sorted(latencias.items())}
+        }
+
+cliente_http_stripe = ClienteHTTPStripe(
+    timeout_conexao=settings.STRIPE_CONNECT_TIMEOUT,
+    timeout_leitura=settings.STRIPE_READ_TIMEOUT,
+    conexoes=settings.STRIPE_HTTP_POOL_SIZE
+)
+
+def configurar_stripe() -> None:
+    """Credenciais, base da API (STRIPE_API_BASE aponta para um servidor mock) e cliente HTTP"""
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    if settings.STRIPE_API_BASE:
+        stripe.api_base = settings.STRIPE_API_BASE
+    stripe.max_network_retries = settings.STRIPE_NETWORK_RETRIES
+    stripe.default_http_client = cliente_http_stripe
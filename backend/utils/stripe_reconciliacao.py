@@ -0,0 +1,146 @@
+"""
+Reconciliação de pagamentos do Stripe para o Sistema de Gestão de Faturas
+Percorre as sessões de checkout concluídas desde o último cursor e marca as
+faturas como pagas, com um UPDATE em lote por página. Cobre o período em que
+o webhook esteve fora do ar ou mal configurado.
+
+Uso: python -m backend.utils.stripe_reconciliacao [--max-paginas N]
+(com STRIPE_API_BASE=http://localhost:12111 roda contra o stripe-mock)
+"""
+
+import argparse
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+import stripe
+from sqlalchemy.orm import Session
+
+# Importações com fallback para Vercel
+try:
+    from ..config import settings
+    from ..crud import FaturaCRUD
+    from .stripe_http import configurar_stripe
+except ImportError:
+    from config import settings
+    from crud import FaturaCRUD
+    from utils.stripe_http import configurar_stripe
+
+# Nome do checkpoint na tabela checkpoints
+CHECKPOINT = "stripe_reconciliacao"
+
+# O filtro do Stripe é pela criação da sessão, não pelo pagamento: uma sessão
+# criada antes do cursor pode ter sido paga depois, enquanto ainda aberta.
+# Cada execução recua o tempo máximo de vida de uma sessão (a reaplicação é idempotente).
+VIDA_MAXIMA_SESSAO = timedelta(hours=24)
+
+# Status de pagamento que quitam a fatura
+PAGAMENTO_CONCLUIDO = ("paid", "no_payment_required")
+
+def _dados(sessao: Any) -> Dict[str, Any]:
+    """Sessão do Stripe como dicionário (StripeObject não é um dict)"""
+    return sessao.to_dict() if hasattr(sessao, "to_dict") else dict(sessao)
+
+def fatura_da_sessao(sessao: Dict[str, Any]) -> Optional[int]:
+    """ID da fatura em metadata.fatura_id, ou None"""
+    fatura_id = (sessao.get("metadata") or {}).get("fatura_id")
+    if fatura_id and str(fatura_id).isdigit():
+        return int(fatura_id)
+    return None
+
+def _estado_inicial(agora: int) -> Dict[str, Any]:
+    desde = agora - int(timedelta(days=settings.STRIPE_RECONCILE_LOOKBACK_DAYS).total_seconds())
+    return {"desde": desde}
+
+def reconciliar_pagamentos(
+    db: Session,
+    max_paginas: Optional[int] = None,
+    tamanho_pagina: int = settings.STRIPE_RECONCILE_PAGE_SIZE
+) -> Dict[str, Any]:
+    """
+    Aplica os pagamentos concluídos no Stripe desde o último cursor.
+
+    Cada execução cobre um intervalo fixo de criação (desde, ate]. Cada página
+    (faturas pagas, status das sessões e posição no intervalo) é gravada em
+    uma única transação; se o job parar no meio, ou atingir max_paginas, a
+    próxima execução continua da página seguinte do mesmo intervalo.
+
+    Args:
+        db: Sessão do banco de dados
+        max_paginas: Limite de páginas nesta execução (None = até o fim)
+        tamanho_pagina: Sessões por página (máximo 100 no Stripe)
+
+    Returns:
+        Resumo da execução; 'concluido' indica se o intervalo foi esgotado
+    """
+    agora = int(time.time())
+    estado = FaturaCRUD.get_checkpoint(db, CHECKPOINT) or _estado_inicial(agora)
+    db.commit()  # não segura a conexão durante as chamadas ao Stripe
+    if "ate" not in estado:
+        # Nova execução: fixa o fim do intervalo e recua o início
+        estado = {
+            "desde": estado["desde"] - int(VIDA_MAXIMA_SESSAO.total_seconds()),
+            "ate": agora,
+            "starting_after": None
+        }
+
+    resumo = {"paginas": 0, "sessoes": 0, "faturas_pagas": 0, "nao_encontradas": [], "concluido": False}
+    while max_paginas is None or resumo["paginas"] < max_paginas:
+        parametros = {
+            "status": "complete",
+            "created": {"gt": estado["desde"], "lte": estado["ate"]},
+            "limit": tamanho_pagina
+        }
+        if estado["starting_after"]:
+            parametros["starting_after"] = estado["starting_after"]
+        pagina = stripe.checkout.Session.list(**parametros)
+
+        sessoes = [_dados(sessao) for sessao in pagina.data]
+        fatura_ids: List[int] = []
+        for sessao in sessoes:
+            fatura_id = fatura_da_sessao(sessao)
+            if fatura_id is None:
+                print(f"⚠️ Sessão {sessao.get('id')} sem fatura_id válido, ignorada")
+            elif sessao.get("payment_status") in PAGAMENTO_CONCLUIDO:
+                fatura_ids.append(fatura_id)
+
+        if pagina.has_more and sessoes:
+            estado["starting_after"] = sessoes[-1]["id"]
+            proximo = estado
+        else:
+            # Intervalo esgotado: a próxima execução começa onde este terminou
+            proximo = {"desde": estado["ate"]}
+
+        # Status das sessões e checkpoint entram no commit de mark_paid_many
+        FaturaCRUD.atualizar_checkout_sessoes(db, [sessao["id"] for sessao in sessoes], "complete")
+        FaturaCRUD.salvar_checkpoint(db, CHECKPOINT, proximo)
+        resultado = FaturaCRUD.mark_paid_many(db, fatura_ids)
+
+        resumo["paginas"] += 1
+        resumo["sessoes"] += len(sessoes)
+        resumo["faturas_pagas"] += len(resultado["atualizadas"])
+        resumo["nao_encontradas"] += resultado["nao_encontradas"]
+        if proximo is not estado:
+            resumo["concluido"] = True
+            break
+
+    print(
+        f"💳 Reconciliação do Stripe: {resumo['sessoes']} sessões em {resumo['paginas']} páginas, "
+        f"{resumo['faturas_pagas']} faturas marcadas como pagas"
+        + ("" if resumo["concluido"] else " (interrompida; continua na próxima execução)")
+    )
+    return resumo
+
+if __name__ == "__main__":
+    try:
+        from ..database import SessionLocal
+    except ImportError:
+        from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Reconcilia pagamentos do Stripe com as faturas")
+    parser.add_argument("--max-paginas", type=int, default=None, help="Páginas nesta execução")
+    args = parser.parse_args()
+
+    configurar_stripe()
+    with SessionLocal() as db:
+        print(reconciliar_pagamentos(db, max_paginas=args.max_paginas))
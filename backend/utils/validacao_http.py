@@ -0,0 +1,65 @@
+"""
+Requisições condicionais (ETag / Last-Modified / 304) para o Sistema de Gestão de Faturas
+O validador é calculado por uma consulta barata; quando o cliente já tem a
+versão atual, a resposta 304 sai sem carregar nem serializar as faturas
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+
+# O navegador guarda a resposta, mas sempre revalida antes de reutilizar
+CACHE_CONTROL_REVALIDAR = "private, no-cache"
+
+def gerar_etag(*partes: Any) -> str:
+    """Gera um ETag fraco a partir das partes do validador"""
+    conteudo = "|".join(str(parte) for parte in partes)
+    return 'W/"' + hashlib.sha1(conteudo.encode("utf-8")).hexdigest()[:20] + '"'
+
+def _utc(momento: datetime) -> datetime:
+    """Os timestamps do banco são gravados sem fuso (UTC)"""
+    if momento.tzinfo is None:
+        return momento.replace(tzinfo=timezone.utc)
+    return momento.astimezone(timezone.utc)
+
+def cabecalhos_validacao(etag: str, ultima_modificacao: Optional[datetime] = None) -> Dict[str, str]:
+    """Cabeçalhos ETag, Last-Modified e Cache-Control da resposta"""
+    cabecalhos = {"ETag": etag, "Cache-Control": CACHE_CONTROL_REVALIDAR}
+    if ultima_modificacao is not None:
+        cabecalhos["Last-Modified"] = format_datetime(_utc(ultima_modificacao), usegmt=True)
+    return cabecalhos
+
+def _etags_iguais(if_none_match: str, etag: str) -> bool:
+    """Comparação fraca (RFC 9110): ignora o prefixo W/"""
+    if if_none_match.strip() == "*":
+        return True
+    alvo = etag.removeprefix("W/")
+    return any(candidato.strip().removeprefix("W/") == alvo for candidato in if_none_match.split(","))
+
+def nao_modificado(request: Request, etag: str, ultima_modificacao: Optional[datetime] = None) -> bool:
+    """
+    Indica se o cliente já tem a versão atual. If-None-Match tem precedência;
+    If-Modified-Since só é considerado quando o cliente não envia ETag.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etags_iguais(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and ultima_modificacao is not None:
+        try:
+            desde = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if desde.tzinfo is None:
+            desde = desde.replace(tzinfo=timezone.utc)
+        # Datas HTTP têm resolução de segundos
+        return _utc(ultima_modificacao).replace(microsecond=0) <= desde
+    return False
+
+def resposta_304(etag: str, ultima_modificacao: Optional[datetime] = None) -> Response:
+    """Resposta 304 sem corpo, com os mesmos validadores"""
+    return Response(status_code=304, headers=cabecalhos_validacao(etag, ultima_modificacao))
@@ -64,6 +64,7 @@ class ConfigManager {
             HEALTH: '/health',
             FATURAS: '/faturas/',
             PROCESSAR_EMAIL: '/processar_email/',
+            JOB_INGESTAO: '/jobs/ingestao',
 
             CHECKOUT: '/create-checkout-session',
             WEBHOOK: '/stripe-webhook/',
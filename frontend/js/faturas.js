@@ -45,6 +45,39 @@ class FaturaManager {
         }
     }
     
+    // Consulta o job de ingestão até ele terminar (ou até o prazo) e devolve o resultado no formato do processamento
+    async aguardarJobIngestao(jobId, intervaloMs = 2000, prazoMs = 10 * 60 * 1000) {
+        let salvasAnteriores = -1;
+        const limite = Date.now() + prazoMs;
+        while (Date.now() < limite) {
+            await new Promise(resolve => setTimeout(resolve, intervaloMs));
+            const response = await fetch(`${CONFIG.API_BASE_URL}${CONFIG.ENDPOINTS.JOB_INGESTAO}/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`Erro HTTP ${response.status} ao consultar o job ${jobId}`);
+            }
+            const job = await response.json();
+            if (job.status === 'concluido' || job.status === 'erro') {
+                return {
+                    status: job.status === 'concluido' ? 'success' : 'error',
+                    faturas_processadas: job.faturas_encontradas,
+                    faturas_salvas: job.faturas_salvas,
+                    message: job.mensagem || ''
+                };
+            }
+            if (job.status === 'executando' && job.faturas_salvas !== salvasAnteriores) {
+                salvasAnteriores = job.faturas_salvas;
+                this.adicionarLog('info', `⏳ ${job.faturas_salvas} de ${job.faturas_encontradas} faturas salvas...`);
+            }
+        }
+        // O job continua na fila; o resultado aparece na próxima consulta
+        return {
+            status: 'error',
+            faturas_processadas: 0,
+            faturas_salvas: 0,
+            message: `O job ${jobId} ainda não terminou; consulte novamente em alguns minutos`
+        };
+    }
+    
     // Processa emails para buscar novas faturas
     async processarEmails() {
         try {
@@ -73,7 +106,13 @@ class FaturaManager {
             });
             
             if (response.ok) {
-                const result = await response.json();
+                let result = await response.json();
+                
+                // O processamento roda em segundo plano: acompanha o job até terminar
+                if (result.status === 'enfileirado') {
+                    this.adicionarLog('info', `📥 ${result.message}`);
+                    result = await this.aguardarJobIngestao(result.job_id);
+                }
                 
                 // Adiciona log de resultado
                 if (result.status === 'success') {
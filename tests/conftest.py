@@ -0,0 +1,48 @@
+"""
+Configuração dos testes do Sistema de Gestão de Faturas
+Os testes rodam contra o SQLite local, em um diretório temporário próprio
+(a URL do banco e a pasta dos PDFs são relativas ao diretório corrente).
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRETORIO_TESTES = tempfile.mkdtemp(prefix="usina-testes-")
+
+# Antes de importar o backend: o engine e as configurações são criados na importação
+os.chdir(DIRETORIO_TESTES)
+os.environ.setdefault("INGESTION_WORKERS", "0")
+os.environ.setdefault("INGESTION_SCHEDULE_SECONDS", "0")
+os.environ.setdefault("REDIS_URL", "memory://")
+sys.path.insert(0, RAIZ)
+
+from backend import database  # noqa: E402
+from backend.cache import cache_faturas  # noqa: E402
+from backend.models import Base  # noqa: E402
+
+@pytest.fixture(autouse=True)
+def banco():
+    """Tabelas criadas e vazias a cada teste, com o cache de faturas limpo"""
+    database.create_tables()
+    yield
+    with database.engine.begin() as connection:
+        for tabela in reversed(Base.metadata.sorted_tables):
+            connection.execute(tabela.delete())
+    cache_faturas.local.delete(*list(cache_faturas.local._itens))
+    cache_faturas.compartilhado._dados.clear()
+
+@pytest.fixture
+def db():
+    with database.SessionLocal() as sessao:
+        yield sessao
+
+@pytest.fixture
+def client():
+    # Sem o bloco "with": o startup (agendador, processador do Stripe) não roda
+    from fastapi.testclient import TestClient
+    from backend import main
+    return TestClient(main.app)
@@ -0,0 +1,61 @@
+"""Cache de faturas: a marca de invalidação contra o preenchimento com a versão antiga"""
+
+import time
+
+import pytest
+
+from backend import crud
+from backend.cache import INVALIDADA, CacheFaturas, CacheLocal, RedisMemoria, cache_faturas
+from backend.models import Fatura
+
+def _fatura(db):
+    fatura = crud.FaturaCRUD.create_fatura(db, {
+        "nome_cliente": "Cliente A",
+        "documento_cliente": "11111111111",
+        "email_cliente": "cliente@exemplo.com",
+        "numero_instalacao": "1001",
+        "valor_total": 100.0,
+        "mes_referencia": "Agosto/2025",
+        "data_vencimento": "10/09/2025",
+    })
+    return fatura.id
+
+@pytest.mark.parametrize("camada", ["local", "compartilhado"])
+def test_leitor_atrasado_nao_grava_a_versao_antiga(db, monkeypatch, camada):
+    # Uma camada por vez: a local não pode mascarar a compartilhada
+    if camada == "local":
+        monkeypatch.setattr(cache_faturas, "compartilhado", None)
+    else:
+        monkeypatch.setattr(cache_faturas, "local", None)
+    fatura_id = _fatura(db)
+
+    # O leitor busca no banco antes do commit do escritor...
+    antiga = crud.FaturaCRUD.get_fatura_by_id(db, fatura_id)
+    dados_antigos = {coluna.key: getattr(antiga, coluna.key) for coluna in Fatura.__table__.columns}
+    db.expunge(antiga)
+    crud.FaturaCRUD.update_fatura(db, crud.FaturaCRUD.get_fatura_by_id(db, fatura_id), {"valor_total": 130.0})
+
+    # ...e só depois tenta guardar o que leu
+    cache_faturas.guardar(cache_faturas.instancia(dados_antigos))
+    assert cache_faturas.obter_por_id(fatura_id) is None
+    assert crud.FaturaCRUD.get_fatura_by_id(db, fatura_id).valor_total == 130.0
+
+@pytest.mark.parametrize("compartilhado", [False, True])
+def test_marca_expira_e_a_chave_volta_a_ser_preenchida(compartilhado):
+    cache = CacheFaturas(
+        None if compartilhado else CacheLocal(10, 60),
+        RedisMemoria() if compartilhado else None,
+        ttl_compartilhado=60,
+        ttl_invalidacao=0.2
+    )
+    chave = cache.chave_id(1)
+
+    cache._invalidar([chave])
+    cache._set(chave, {"id": 1})
+    camada = cache.compartilhado if compartilhado else cache.local
+    assert camada.get(chave) in (INVALIDADA, INVALIDADA.encode("utf-8"))
+    assert cache.obter_por_id(1) is None
+
+    time.sleep(0.3)
+    cache._set(chave, {"id": 1})
+    assert cache.obter_por_id(1) == {"id": 1}
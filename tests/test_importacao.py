@@ -0,0 +1,114 @@
+"""Importação em lote de faturas (POST /faturas/bulk)"""
+
+import json
+
+from backend import crud
+from backend.models import Fatura, FaturaHistorico, Instalacao
+
+def _registro(instalacao="1001", documento="11111111111", nome="Cliente A", mes="Agosto/2025", valor=100.0):
+    return {
+        "nome_cliente": nome,
+        "documento_cliente": documento,
+        "email_cliente": "cliente@exemplo.com",
+        "numero_instalacao": instalacao,
+        "valor_total": valor,
+        "mes_referencia": mes,
+        "data_vencimento": "10/09/2025",
+    }
+
+def _ndjson(*registros):
+    return "\n".join(json.dumps(registro) for registro in registros)
+
+def test_importa_ndjson(client, db):
+    resposta = client.post("/faturas/bulk?format=ndjson", content=_ndjson(
+        _registro("1001"), _registro("1002", documento="22222222222", nome="Cliente B")
+    ))
+    
+    assert resposta.status_code == 200
+    assert resposta.json() == {"registros_recebidos": 2, "registros_gravados": 2, "erros": []}
+    faturas = {fatura.numero_instalacao: fatura for fatura in db.query(Fatura)}
+    assert set(faturas) == {"1001", "1002"}
+    assert faturas["1002"].nome_cliente == "Cliente B"
+    assert db.query(FaturaHistorico).count() == 2
+
+def test_importa_csv_pelo_content_type(client, db):
+    corpo = (
+        "nome_cliente,documento_cliente,email_cliente,numero_instalacao,valor_total,mes_referencia,data_vencimento\n"
+        "Cliente A,11111111111,a@exemplo.com,1001,100.5,08/2025,10/09/2025\n"
+        '"Silva, Maria",22222222222,m@exemplo.com,1002,80,08/2025,10/09/2025\n'
+    )
+    resposta = client.post("/faturas/bulk", content=corpo, headers={"Content-Type": "text/csv"})
+    
+    assert resposta.json() == {"registros_recebidos": 2, "registros_gravados": 2, "erros": []}
+    fatura = db.query(Fatura).filter_by(numero_instalacao="1002").one()
+    assert fatura.nome_cliente == "Silva, Maria"
+    assert fatura.valor_total == 80
+
+def test_erros_por_registro(client, db):
+    resposta = client.post("/faturas/bulk?format=ndjson", content="\n".join([
+        json.dumps(_registro("1001")),
+        "{nao e json",
+        json.dumps(_registro("1002", documento="123")),
+        json.dumps(_registro("1003", mes="Mes/2025")),
+        json.dumps(_registro("1004")),
+    ]))
+    
+    corpo = resposta.json()
+    assert corpo["registros_recebidos"] == 5
+    assert corpo["registros_gravados"] == 2
+    assert [erro["linha"] for erro in corpo["erros"]] == [2, 3, 4]
+    assert corpo["erros"][0]["erro"].startswith("JSON inválido")
+    assert corpo["erros"][1]["erro"].startswith("documento_cliente")
+    assert corpo["erros"][2]["erro"].startswith("mes_referencia")
+    assert {fatura.numero_instalacao for fatura in db.query(Fatura)} == {"1001", "1004"}
+
+def test_bloco_com_falha_e_gravado_registro_a_registro(client, db, monkeypatch):
+    original = crud.FaturaCRUD.upsert_faturas_lote
+    
+    def upsert_com_falha(sessao, faturas_data):
+        if any(dados["numero_instalacao"] == "1003" for dados in faturas_data):
+            raise RuntimeError("violação simulada")
+        return original(sessao, faturas_data)
+    
+    monkeypatch.setattr(crud.FaturaCRUD, "upsert_faturas_lote", staticmethod(upsert_com_falha))
+    resposta = client.post("/faturas/bulk?format=ndjson", content=_ndjson(
+        *(_registro(f"100{i}", documento=f"1111111111{i}") for i in range(1, 6))
+    ))
+    
+    corpo = resposta.json()
+    assert corpo["registros_gravados"] == 4
+    assert corpo["erros"] == [{"linha": 3, "erro": "Erro ao gravar: violação simulada"}]
+    assert {fatura.numero_instalacao for fatura in db.query(Fatura)} == {"1001", "1002", "1004", "1005"}
+
+def test_registro_antigo_nao_troca_o_dono_da_instalacao(client, db):
+    # O mês mais recente vem primeiro no arquivo
+    resposta = client.post("/faturas/bulk?format=ndjson", content=_ndjson(
+        _registro("1001", documento="11111111111", nome="Cliente A", mes="Agosto/2025"),
+        _registro("1001", documento="22222222222", nome="Cliente B", mes="Julho/2025", valor=90.0),
+    ))
+    assert resposta.json()["registros_gravados"] == 2
+    
+    instalacoes = client.get("/clientes/11111111111/instalacoes").json()
+    assert [instalacao["numero"] for instalacao in instalacoes] == ["1001"]
+    faturas = client.get("/clientes/11111111111/faturas").json()
+    assert [(fatura["mes_referencia"], fatura["valor_total"]) for fatura in faturas] == [("Agosto/2025", 100.0)]
+    historico = client.get("/clientes/11111111111/historico").json()
+    assert sorted(linha["mes_referencia"] for linha in historico) == ["Agosto/2025", "Julho/2025"]
+    assert client.get("/clientes/22222222222/instalacoes").json() == []
+
+def test_registro_antigo_em_outro_lote_nao_troca_o_dono(client, db):
+    client.post("/faturas/bulk?format=ndjson", content=_ndjson(_registro("1001", mes="Agosto/2025")))
+    client.post("/faturas/bulk?format=ndjson", content=_ndjson(
+        _registro("1001", documento="22222222222", nome="Cliente B", mes="Julho/2025")
+    ))
+    
+    instalacao = db.query(Instalacao).filter_by(numero="1001").one()
+    assert instalacao.cliente_id == crud.FaturaCRUD.get_cliente_by_documento(db, "11111111111").id
+    db.rollback()  # libera a conexão de escrita (uma só no SQLite) para a API
+    
+    # Um mês mais recente transfere a instalação
+    client.post("/faturas/bulk?format=ndjson", content=_ndjson(
+        _registro("1001", documento="22222222222", nome="Cliente B", mes="Setembro/2025")
+    ))
+    db.expire_all()
+    assert instalacao.cliente_id == crud.FaturaCRUD.get_cliente_by_documento(db, "22222222222").id
@@ -0,0 +1,69 @@
+"""Fila de jobs de ingestão: reivindicação e retomada após o timeout do heartbeat"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from backend import crud
+from backend.database import SessionLocal
+from backend.models import JobIngestao
+
+def _sem_heartbeat(db, job_id, segundos):
+    # Simula um worker interrompido há `segundos`
+    heartbeat = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=segundos)
+    db.execute(update(JobIngestao).where(JobIngestao.id == job_id).values(heartbeat_em=heartbeat))
+    db.commit()
+
+def _job(db, job_id):
+    db.expire_all()
+    job = crud.FaturaCRUD.get_job_ingestao(db, job_id)
+    db.rollback()
+    return job
+
+def test_job_pendente_e_reaproveitado_e_reivindicado_uma_vez(db):
+    job_id = crud.FaturaCRUD.enfileirar_job_ingestao(db).id
+    assert crud.FaturaCRUD.enfileirar_job_ingestao(db).id == job_id
+
+    assert crud.FaturaCRUD.reivindicar_job_ingestao(db, "a", timeout=60, max_tentativas=3) == job_id
+    assert crud.FaturaCRUD.reivindicar_job_ingestao(db, "b", timeout=60, max_tentativas=3) is None
+    job = _job(db, job_id)
+    assert (job.status, job.worker, job.tentativas) == ("executando", "a", 1)
+
+def test_workers_concorrentes_pegam_jobs_diferentes(db):
+    ids = {crud.FaturaCRUD.enfileirar_job_ingestao(db).id}
+    crud.FaturaCRUD.reivindicar_job_ingestao(db, "inicial", timeout=60, max_tentativas=3)
+    ids.add(crud.FaturaCRUD.enfileirar_job_ingestao(db).id)
+    _sem_heartbeat(db, min(ids), 120)
+    obtidos = []
+    barreira = threading.Barrier(4)
+
+    def reivindicar(worker):
+        with SessionLocal() as sessao:
+            barreira.wait()
+            obtidos.append(crud.FaturaCRUD.reivindicar_job_ingestao(sessao, worker, timeout=60, max_tentativas=3))
+
+    threads = [threading.Thread(target=reivindicar, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(job_id for job_id in obtidos if job_id is not None) == sorted(ids)
+
+def test_job_sem_heartbeat_e_retomado_ate_esgotar(db):
+    job_id = crud.FaturaCRUD.enfileirar_job_ingestao(db).id
+    crud.FaturaCRUD.reivindicar_job_ingestao(db, "a", timeout=60, max_tentativas=2)
+
+    _sem_heartbeat(db, job_id, 30)
+    assert crud.FaturaCRUD.reivindicar_job_ingestao(db, "b", timeout=60, max_tentativas=2) is None
+
+    _sem_heartbeat(db, job_id, 120)
+    assert crud.FaturaCRUD.reivindicar_job_ingestao(db, "b", timeout=60, max_tentativas=2) == job_id
+    job = _job(db, job_id)
+    assert (job.status, job.worker, job.tentativas) == ("executando", "b", 2)
+
+    _sem_heartbeat(db, job_id, 120)
+    assert crud.FaturaCRUD.reivindicar_job_ingestao(db, "c", timeout=60, max_tentativas=2) is None
+    job = _job(db, job_id)
+    assert job.status == "erro"
+    assert job.concluido_em is not None
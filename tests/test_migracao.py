@@ -0,0 +1,63 @@
+"""Migração de uma base anterior à normalização (create_tables / migrar_schema_normalizado)"""
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, Integer, MetaData, String, Table, Text, create_engine, inspect, text
+)
+
+from backend import database
+
+def _base_anterior(caminho):
+    # A tabela faturas como era antes de clientes / instalacoes
+    metadata = MetaData()
+    faturas = Table(
+        "faturas", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("nome_cliente", String(255), nullable=False, index=True),
+        Column("documento_cliente", String(20), unique=True, nullable=False, index=True),
+        Column("email_cliente", String(255), nullable=False, index=True),
+        Column("numero_instalacao", String(20), unique=True, nullable=False, index=True),
+        Column("valor_total", Float, nullable=False),
+        Column("mes_referencia", String(50), nullable=False),
+        Column("data_vencimento", String(20), nullable=False),
+        Column("url_pdf", Text, nullable=True),
+        Column("ja_pago", Boolean, default=False, index=True),
+        Column("data_criacao", DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False),
+        Column("data_ultima_atualizacao", DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False),
+    )
+    engine = create_engine(f"sqlite:///{caminho}")
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(faturas.insert(), [
+            {"nome_cliente": "Cliente A", "documento_cliente": "11111111111", "email_cliente": "a@exemplo.com",
+             "numero_instalacao": "1001", "valor_total": 100.0, "mes_referencia": "Agosto/2025",
+             "data_vencimento": "10/09/2025"},
+            {"nome_cliente": "Cliente B", "documento_cliente": "22222222222", "email_cliente": "b@exemplo.com",
+             "numero_instalacao": "1002", "valor_total": 80.0, "mes_referencia": "Agosto/2025",
+             "data_vencimento": "10/09/2025"},
+        ])
+    return engine
+
+def test_migracao_da_base_anterior_pode_rodar_de_novo(tmp_path, monkeypatch):
+    engine = _base_anterior(tmp_path / "anterior.db")
+    monkeypatch.setattr(database, "engine", engine)
+
+    assert database.create_tables()
+    assert database.create_tables()
+    assert database.migrar_schema_normalizado() == {
+        "clientes_criados": 0, "instalacoes_criadas": 0, "faturas_vinculadas": 0, "historico_vinculado": 0
+    }
+
+    with engine.connect() as connection:
+        faturas = connection.execute(text("""
+            SELECT f.numero_instalacao, f.versao, c.documento
+            FROM faturas f
+            JOIN instalacoes i ON i.id = f.instalacao_id
+            JOIN clientes c ON c.id = i.cliente_id
+            ORDER BY f.numero_instalacao
+        """)).all()
+        assert [tuple(fatura) for fatura in faturas] == [("1001", 1, "11111111111"), ("1002", 1, "22222222222")]
+        assert connection.execute(text("SELECT COUNT(*) FROM clientes")).scalar() == 2
+        indices = {indice["name"]: indice for indice in inspect(connection).get_indexes("faturas")}
+        assert not indices["ix_faturas_documento_cliente"]["unique"]
+        assert "ix_faturas_instalacao_id" in indices
+    engine.dispose()
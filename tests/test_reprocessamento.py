@@ -0,0 +1,104 @@
+"""Reprocessamento da fila falhas_extracao"""
+
+from backend import crud, reprocessamento
+from backend.config import settings
+from backend.models import FalhaExtracao, Fatura
+from backend.utils import bot_mail
+
+def _registrar_falhas(db, *nomes):
+    for nome in nomes:
+        crud.FaturaCRUD.registrar_falha_extracao(db, {
+            "hash_pdf": f"hash-{nome}",
+            "nome_arquivo": f"{nome}.pdf",
+            "caminho_pdf": f"/tmp/{nome}.pdf",
+            "conteudo_pdf": b"%PDF",
+            "classe_erro": "ValueError",
+            "mensagem": "layout desconhecido",
+            "proxima_tentativa_em": None,
+        })
+    db.commit()
+
+def _extracao(dados_por_nome):
+    def extrair_pdf(nome, caminho_pdf, hash_pdf, conteudo=None):
+        dados = dados_por_nome.get(nome)
+        if dados is None:
+            raise bot_mail.ErroExtracao(nome, caminho_pdf, hash_pdf, ValueError("ainda ilegível"), conteudo)
+        return {**dados, "url_pdf": caminho_pdf}
+    return extrair_pdf
+
+def _fatura(instalacao, nome="Cliente A"):
+    return {
+        "nome_cliente": nome,
+        "documento_cliente": "11111111111",
+        "email_cliente": "cliente@exemplo.com",
+        "numero_instalacao": instalacao,
+        "valor_total": 100.0,
+        "mes_referencia": "Agosto/2025",
+        "data_vencimento": "10/09/2025",
+    }
+
+def _falhas(db):
+    db.expire_all()
+    falhas = {falha.nome_arquivo: falha for falha in db.query(FalhaExtracao)}
+    db.rollback()
+    return falhas
+
+def test_lote_grava_faturas_e_status(db, monkeypatch):
+    _registrar_falhas(db, "a", "b", "c")
+    monkeypatch.setattr(bot_mail, "extrair_pdf", _extracao({"a.pdf": _fatura("1001"), "c.pdf": _fatura("1003")}))
+
+    resumo = reprocessamento.reprocessar_falhas(db, forcar=True)
+
+    assert (resumo["elegiveis"], resumo["resolvidas"], resumo["reagendadas"]) == (3, 2, 1)
+    falhas = _falhas(db)
+    assert falhas["a.pdf"].status == "resolvida" and falhas["a.pdf"].conteudo_pdf is None
+    assert falhas["b.pdf"].status == "pendente" and falhas["b.pdf"].tentativas == 2
+    assert {fatura.numero_instalacao for fatura in db.query(Fatura)} == {"1001", "1003"}
+
+def test_falha_de_gravacao_isola_o_pdf(db, monkeypatch):
+    _registrar_falhas(db, "a", "b")
+    sem_instalacao = {chave: valor for chave, valor in _fatura("1002").items() if chave != "numero_instalacao"}
+    monkeypatch.setattr(bot_mail, "extrair_pdf", _extracao({"a.pdf": _fatura("1001"), "b.pdf": sem_instalacao}))
+
+    resumo = reprocessamento.reprocessar_falhas(db, forcar=True)
+
+    assert (resumo["resolvidas"], resumo["reagendadas"]) == (1, 1)
+    falhas = _falhas(db)
+    assert falhas["a.pdf"].status == "resolvida"
+    assert falhas["b.pdf"].status == "pendente"
+    assert falhas["b.pdf"].classe_erro == "ErroGravacao"
+    assert [fatura.numero_instalacao for fatura in db.query(Fatura)] == ["1001"]
+
+def test_trava_perdida_desfaz_o_lote_inteiro(db, monkeypatch):
+    _registrar_falhas(db, "a", "b")
+    monkeypatch.setattr(bot_mail, "extrair_pdf", _extracao({"a.pdf": _fatura("1001"), "b.pdf": _fatura("1002")}))
+    chamadas = []
+
+    def verificar_travas():
+        # 1ª: início do lote; 2ª: após a extração; 3ª: antes do commit
+        chamadas.append(None)
+        if len(chamadas) == 3:
+            raise reprocessamento.TravaPerdida("trava tomada")
+    monkeypatch.setattr(reprocessamento, "verificar_travas", verificar_travas)
+
+    assert reprocessamento.reprocessar_falhas(db, forcar=True) == {"status": "interrompido"}
+
+    falhas = _falhas(db)
+    assert {falha.status for falha in falhas.values()} == {"pendente"}
+    assert {falha.tentativas for falha in falhas.values()} == {1}
+    assert db.query(Fatura).count() == 0
+
+def test_le_os_padroes_na_chamada(db, monkeypatch):
+    _registrar_falhas(db, "a", "b", "c")
+    monkeypatch.setattr(bot_mail, "extrair_pdf", _extracao({}))
+    monkeypatch.setattr(settings, "EXTRACTION_RETRY_BATCH_SIZE", 1)
+    limites = []
+    elegiveis = crud.FaturaCRUD.get_falhas_extracao_elegiveis
+
+    def espiar(db, max_tentativas, limite, **kwargs):
+        limites.append(limite)
+        return elegiveis(db, max_tentativas, limite, **kwargs)
+    monkeypatch.setattr(crud.FaturaCRUD, "get_falhas_extracao_elegiveis", espiar)
+
+    assert reprocessamento.reprocessar_falhas(db, forcar=True)["elegiveis"] == 3
+    assert limites == [1, 1, 1, 1]
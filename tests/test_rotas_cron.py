@@ -0,0 +1,17 @@
+"""Rotas do cron: GET (cron da Vercel) e POST (chamada manual)"""
+
+import pytest
+
+@pytest.mark.parametrize("metodo", ["GET", "POST"])
+def test_reprocessamento_aceita_get_e_post(client, metodo):
+    resposta = client.request(metodo, "/falhas-extracao/reprocessar")
+    
+    assert resposta.status_code == 200
+    assert resposta.json()["elegiveis"] == 0
+
+def test_operation_id_por_metodo(client):
+    caminhos = client.get("/openapi.json").json()["paths"]
+    for caminho in ("/jobs/ingestao/executar", "/falhas-extracao/reprocessar", "/stripe/eventos/processar"):
+        operacoes = caminhos[caminho]
+        assert set(operacoes) == {"get", "post"}
+        assert operacoes["get"]["operationId"] != operacoes["post"]["operationId"]
@@ -0,0 +1,88 @@
+"""Trava exclusiva por arrendamento (tabela travas)"""
+
+import threading
+import time
+
+import pytest
+
+from backend import database, ingestao
+from backend.models import Trava
+from backend.utils import bot_mail
+
+def _expirar(nome):
+    # Simula uma renovação que falhou por mais tempo que o arrendamento
+    with database.engine.begin() as connection:
+        connection.execute(
+            Trava.__table__.update().where(Trava.__table__.c.nome == nome)
+            .values(expira_em=database._relogio_banco(connection, -60))
+        )
+
+def test_trava_ocupada_e_liberada():
+    with database.trava_exclusiva("teste") as primeira:
+        assert primeira
+        with database.trava_exclusiva("teste") as segunda:
+            assert not segunda
+    with database.trava_exclusiva("teste") as terceira:
+        assert terceira
+
+def test_uma_so_instancia_obtem_a_trava():
+    obtidas = []
+    barreira = threading.Barrier(8)
+    
+    def disputar():
+        barreira.wait()
+        with database.trava_exclusiva("disputada") as obtida:
+            obtidas.append(bool(obtida))
+            time.sleep(0.2)
+    
+    threads = [threading.Thread(target=disputar) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert obtidas.count(True) == 1
+
+def test_renovacao_mantem_a_trava_alem_da_duracao():
+    with database.trava_exclusiva("renovada", duracao=0.6) as obtida:
+        assert obtida
+        time.sleep(1.0)
+        with database.trava_exclusiva("renovada") as outra:
+            assert not outra
+        assert not obtida.perdida.is_set()
+
+def test_trava_vencida_e_tomada_e_o_dono_anterior_e_avisado():
+    with database.trava_exclusiva("tomada", duracao=0.6) as antiga:
+        _expirar("tomada")
+        with database.trava_exclusiva("tomada") as nova:
+            assert nova
+            assert antiga.perdida.wait(1.0)
+            with pytest.raises(database.TravaPerdida):
+                database.verificar_travas()
+    database.verificar_travas()  # fora do bloco, nada a verificar
+
+def test_ingestao_para_quando_a_trava_e_perdida(db, monkeypatch):
+    monkeypatch.setattr(ingestao.settings, "EMAIL_USER", "usuario")
+    monkeypatch.setattr(ingestao.settings, "EMAIL_PASS", "senha")
+    monkeypatch.setattr(bot_mail, "conectar_email", lambda: object())
+    monkeypatch.setattr(bot_mail, "desconectar_email", lambda mail: None)
+    monkeypatch.setattr(bot_mail, "obter_uidvalidity", lambda mail: 1)
+    monkeypatch.setattr(bot_mail, "listar_uids", lambda mail, apos, limite: [1, 2, 3])
+    lidos = []
+    
+    def anexos(mail, uid):
+        lidos.append(uid)
+        if uid == 1:
+            # A trava vence durante o primeiro email e outra instância a toma
+            _expirar(ingestao.TRAVA_INGESTAO)
+            with database.trava_exclusiva(ingestao.TRAVA_INGESTAO) as outra:
+                assert outra
+                assert arrendamento.perdida.wait(1.0)
+        return []
+    
+    monkeypatch.setattr(bot_mail, "anexos_pdf", anexos)
+    with database.trava_exclusiva(ingestao.TRAVA_INGESTAO, duracao=0.6) as arrendamento:
+        resultado = ingestao.executar_ingestao(db)
+    
+    assert lidos == [1]
+    assert resultado["status"] == "error"
+    assert "perdida" in resultado["message"]
@@ -0,0 +1,53 @@
+"""Requisições condicionais (ETag) das rotas de faturas"""
+
+import json
+
+from backend import crud
+
+def _importar(client, valor):
+    registro = {
+        "nome_cliente": "Cliente A",
+        "documento_cliente": "11111111111",
+        "email_cliente": "cliente@exemplo.com",
+        "numero_instalacao": "1001",
+        "valor_total": valor,
+        "mes_referencia": "Agosto/2025",
+        "data_vencimento": "10/09/2025",
+    }
+    assert client.post("/faturas/bulk?format=ndjson", content=json.dumps(registro)).json()["registros_gravados"] == 1
+
+def test_edicoes_no_mesmo_segundo_mudam_o_etag(client, db):
+    _importar(client, 100.0)
+    fatura_id = crud.FaturaCRUD.get_fatura_by_instalacao(db, "1001").id
+    db.rollback()
+    
+    primeira = client.get(f"/faturas/{fatura_id}")
+    lista = client.get("/faturas/")
+    assert primeira.status_code == 200 and primeira.headers["ETag"]
+    assert client.get(f"/faturas/{fatura_id}", headers={"If-None-Match": primeira.headers["ETag"]}).status_code == 304
+    
+    # Duas gravações seguidas: o timestamp (resolução de segundos) pode não mudar
+    _importar(client, 120.0)
+    crud.FaturaCRUD.update_fatura(db, crud.FaturaCRUD.get_fatura_by_id(db, fatura_id), {"valor_total": 130.0})
+    db.rollback()
+    
+    segunda = client.get(f"/faturas/{fatura_id}", headers={"If-None-Match": primeira.headers["ETag"]})
+    assert segunda.status_code == 200
+    assert segunda.json()["valor_total"] == 130.0
+    assert segunda.headers["ETag"] != primeira.headers["ETag"]
+    assert client.get("/faturas/", headers={"If-None-Match": lista.headers["ETag"]}).status_code == 200
+    
+    parcial = client.get(f"/faturas/{fatura_id}?fields=valor_total", headers={"If-None-Match": segunda.headers["ETag"]})
+    assert parcial.status_code == 200  # o ETag inclui a projeção
+
+def test_pagamento_muda_o_etag_das_listas(client, db):
+    _importar(client, 100.0)
+    fatura_id = crud.FaturaCRUD.get_fatura_by_instalacao(db, "1001").id
+    db.rollback()
+    pendentes = client.get("/faturas/pendentes")
+    assert [fatura["id"] for fatura in pendentes.json()] == [fatura_id]
+    
+    assert client.post("/faturas/pagamentos", json={"fatura_ids": [fatura_id]}).status_code == 200
+    
+    resposta = client.get("/faturas/pendentes", headers={"If-None-Match": pendentes.headers["ETag"]})
+    assert resposta.status_code == 200 and resposta.json() == []